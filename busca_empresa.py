@@ -1,35 +1,23 @@
-import time
 import pandas as pd
 import logging
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from esperas import aguardar, aguardar_pagina_estavel, linha_com_cnpj, elementos_com_texto
+from preenchimento import preencher_campo
+import captura
 
-def salvar_screenshot_auxiliar(driver, nome_arquivo, screenshot_folder="logs/imagens"):
-    """Salva um screenshot na pasta de imagens com o nome especificado"""
-    import os
-    caminho_completo = os.path.join(screenshot_folder, nome_arquivo)
-    try:
-        driver.save_screenshot(caminho_completo)
-        print(f"Screenshot salvo em {caminho_completo}")
-    except Exception as e:
-        print(f"Erro ao salvar screenshot {nome_arquivo}: {e}")
+def salvar_screenshot_auxiliar(driver, nome_arquivo, screenshot_folder=None):
+    """
+    Agenda um screenshot no pipeline de capturas (pasta da nota atual).
+    O parâmetro screenshot_folder é mantido apenas por compatibilidade.
+    """
+    captura.capturar_screenshot(driver, nome_arquivo)
 
 def simular_digitacao_humana_auxiliar(elemento, texto):
-    """Simula digitação humana inserindo caracteres um a um"""
-    import random
-    # Limpa o campo primeiro
-    elemento.clear()
-    
-    # Velocidades de digitação variáveis
-    for caractere in texto:
-        elemento.send_keys(caractere)
-        # Pequena pausa aleatória para simular digitação real
-        time.sleep(random.uniform(0.05, 0.15))
-    
-    # Pausa final após completar a digitação
-    time.sleep(random.uniform(0.2, 0.5))
+    """Preenche o campo conforme MODO_PREENCHIMENTO (digitação caractere a caractere ou modo rápido)"""
+    preencher_campo(elemento, texto, nome="busca CNPJ")
 
 def buscar_empresa_por_cnpj(driver, cnpj, nome_empresa, logger=None):
     """
@@ -81,22 +69,22 @@ def buscar_empresa_por_cnpj(driver, cnpj, nome_empresa, logger=None):
             return False
           # Clica no campo de busca
         campo_busca.click()
-        time.sleep(0.5)
         
         # Limpa o campo e insere o CNPJ
         campo_busca.clear()
         simular_digitacao_humana_auxiliar(campo_busca, cnpj)
         logger.info(f"CNPJ inserido no campo de busca")
         salvar_screenshot_auxiliar(driver, "apos_inserir_cnpj.png")
-          # Aguarda os resultados com tempo maior para garantir carregamento completo
+        # Aguarda os resultados: retorna assim que a tabela tiver uma linha com o CNPJ
         logger.info("Procurando resultados da busca de CNPJ...")
-        time.sleep(6)  # Aumentado para 6 segundos
+        celula_cnpj = aguardar(driver, linha_com_cnpj(cnpj, 'td[name="nomeRazao"]'),
+                               timeout=20, descricao="linha com o CNPJ nos resultados")
+        if not celula_cnpj:
+            # O CNPJ pode não aparecer no texto da linha; basta haver resultados para comparar pelo nome
+            aguardar(driver, elementos_com_texto('td[name="nomeRazao"]'),
+                     timeout=5, descricao="resultados da busca")
         salvar_screenshot_auxiliar(driver, "resultados_busca.png")
         
-        # Tira mais um screenshot após mais um tempo de espera para verificar se os dados apareceram
-        time.sleep(3)
-        salvar_screenshot_auxiliar(driver, "resultados_busca_adicional.png")
-        
         # Função auxiliar para verificar se um texto contém o CNPJ ou nome da empresa
         def texto_contem_empresa(texto, cnpj, nome_empresa):
             if not texto:
@@ -162,7 +150,7 @@ def buscar_empresa_por_cnpj(driver, cnpj, nome_empresa, logger=None):
                             elemento.click()
                             logger.info("Empresa selecionada com sucesso!")
                             salvar_screenshot_auxiliar(driver, "apos_selecionar_empresa.png")
-                            time.sleep(1)
+                            aguardar_pagina_estavel(driver, timeout=10)
                             return True
                         except Exception as e:
                             # Se falhar o clique direto, tenta com JavaScript como fallback
@@ -171,7 +159,7 @@ def buscar_empresa_por_cnpj(driver, cnpj, nome_empresa, logger=None):
                                 driver.execute_script("arguments[0].click();", elemento)
                                 logger.info("Empresa selecionada via JavaScript")
                                 salvar_screenshot_auxiliar(driver, "apos_selecionar_empresa_js.png")
-                                time.sleep(1)
+                                aguardar_pagina_estavel(driver, timeout=10)
                                 return True
                             except Exception as js_error:
                                 logger.error(f"Clique via JavaScript também falhou: {js_error}")
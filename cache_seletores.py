@@ -0,0 +1,151 @@
+"""
+Módulo com o cache persistente de seletores que funcionaram no portal NFSe.
+
+Para cada elemento lógico (ex.: "botao_proximo", "campo_valor_servico",
+"tributo_IR") guarda quais seletores e quais métodos de clique acertaram nas
+execuções anteriores. Nas próximas buscas eles são tentados primeiro, de forma
+que a maioria das buscas custa uma única consulta ao navegador em vez de
+percorrer a lista inteira. Entradas que começam a falhar seguidamente são
+rebaixadas para o fim da lista até voltarem a acertar.
+
+Acertos e falhas são registrados apenas em memória; o arquivo é gravado por
+`salvar()`, chamado uma vez por nota e no fim da execução.
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+# Configuração de logger
+logger = logging.getLogger('cache_seletores')
+
+# Arquivo padrão do cache (pode ser alterado pela variável de ambiente CACHE_SELETORES)
+ARQUIVO_CACHE = os.path.join("logs", "cache_seletores.json")
+
+# Falhas seguidas a partir das quais uma entrada é rebaixada para o fim da lista
+LIMITE_FALHAS = 3
+
+_cache = None
+_alterado = False
+_trava = threading.Lock()
+
+def _arquivo_cache():
+    """Caminho do cache, lido na primeira utilização para respeitar o .env carregado depois da importação."""
+    return os.getenv("CACHE_SELETORES", ARQUIVO_CACHE)
+
+def _carregar():
+    """Carrega o cache do disco na primeira utilização."""
+    global _cache
+    if _cache is None:
+        try:
+            with open(_arquivo_cache(), "r", encoding="utf-8") as f:
+                _cache = json.load(f)
+            logger.debug(f"Cache de seletores carregado de {_arquivo_cache()}")
+        except FileNotFoundError:
+            _cache = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache de seletores inválido, começando vazio: {e}")
+            _cache = {}
+    return _cache
+
+def salvar():
+    """Grava o cache em disco de forma atômica (arquivo temporário + replace), se houve alteração."""
+    global _alterado
+    arquivo = _arquivo_cache()
+    with _trava:
+        if _cache is None or not _alterado:
+            return
+        try:
+            pasta = os.path.dirname(arquivo)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            temporario = arquivo + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(_cache, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, arquivo)
+            _alterado = False
+        except OSError as e:
+            logger.warning(f"Não foi possível salvar o cache de seletores: {e}")
+
+def ordenar(chave, candidatos, tipo="seletores"):
+    """
+    Ordena os candidatos colocando primeiro os que acertaram por último.
+
+    Args:
+        chave: Nome lógico do elemento (ex.: "botao_proximo")
+        candidatos: Lista de seletores (ou nomes de métodos de clique) na ordem original
+        tipo: "seletores" ou "metodos"
+
+    Returns:
+        list: Candidatos reordenados (acertos recentes, desconhecidos, rebaixados)
+    """
+    candidatos = list(dict.fromkeys(candidatos))
+    if not chave:
+        return candidatos
+
+    with _trava:
+        registros = _carregar().get(chave, {}).get(tipo, {})
+
+    preferidos, desconhecidos, rebaixados = [], [], []
+    for candidato in candidatos:
+        registro = registros.get(candidato)
+        if registro is None or not registro.get("acertos"):
+            desconhecidos.append(candidato)
+        elif registro.get("falhas_seguidas", 0) >= LIMITE_FALHAS:
+            rebaixados.append(candidato)
+        else:
+            preferidos.append(candidato)
+
+    preferidos.sort(key=lambda c: (registros[c].get("falhas_seguidas", 0),
+                                   -registros[c].get("ultimo_acerto", 0)))
+    return preferidos + desconhecidos + rebaixados
+
+def registrar_acerto(chave, seletor=None, metodo=None):
+    """
+    Registra que o seletor (e opcionalmente o método de clique) funcionou para a chave.
+
+    Args:
+        chave: Nome lógico do elemento
+        seletor: Seletor CSS ou XPath que encontrou o elemento
+        metodo: Nome do método de clique que funcionou (opcional)
+    """
+    global _alterado
+    if not chave:
+        return
+    with _trava:
+        entrada = _carregar().setdefault(chave, {})
+        for tipo, valor in (("seletores", seletor), ("metodos", metodo)):
+            if valor is None:
+                continue
+            registro = entrada.setdefault(tipo, {}).setdefault(valor, {})
+            registro["acertos"] = registro.get("acertos", 0) + 1
+            registro["falhas_seguidas"] = 0
+            registro["ultimo_acerto"] = time.time()
+            _alterado = True
+
+def registrar_falha(chave, seletor=None, metodo=None):
+    """
+    Registra que um seletor ou método já conhecido não funcionou desta vez.
+    Candidatos que nunca acertaram não são registrados.
+
+    Args:
+        chave: Nome lógico do elemento
+        seletor: Seletor que não encontrou o elemento (opcional)
+        metodo: Método de clique que falhou (opcional)
+    """
+    global _alterado
+    if not chave:
+        return
+    with _trava:
+        entrada = _carregar().get(chave)
+        if not entrada:
+            return
+        for tipo, valor in (("seletores", seletor), ("metodos", metodo)):
+            registro = entrada.get(tipo, {}).get(valor) if valor is not None else None
+            if registro is None:
+                continue
+            registro["falhas_seguidas"] = registro.get("falhas_seguidas", 0) + 1
+            if registro["falhas_seguidas"] == LIMITE_FALHAS:
+                logger.info(f"Cache de seletores: '{valor}' rebaixado para '{chave}' após {LIMITE_FALHAS} falhas seguidas")
+            _alterado = True
@@ -0,0 +1,316 @@
+"""
+Módulo com o pipeline de capturas de diagnóstico (screenshots e HTML).
+
+A captura em si é rápida: o screenshot é obtido em base64 e o HTML como texto,
+sem tocar no disco. A decodificação, a compactação e a gravação ficam com uma
+thread em segundo plano, de forma que os diagnósticos não atrasam a emissão.
+
+Níveis (variável de ambiente CAPTURA_NIVEL):
+    desligado - nenhuma captura
+    erro      - apenas capturas de erro (nome começando com "erro" ou erro=True)
+    falhas    - "gravador de voo" (padrão): as últimas etapas ficam num buffer
+                circular em memória (screenshot, URL, DOM reduzido, horários) e
+                só vão para o disco quando uma etapa falha, o portal exibe uma
+                mensagem de erro ou o operador interrompe
+    todos     - todas as etapas são gravadas
+
+Os arquivos de cada nota vão para logs/capturas/<execução>/<nota>/, numerados
+na ordem das etapas, em vez de sobrescrever nomes fixos a cada nota.
+"""
+import os
+import re
+import json
+import time
+import gzip
+import queue
+import base64
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+# Configuração de logger
+logger = logging.getLogger('captura')
+
+NIVEL_DESLIGADO = "desligado"
+NIVEL_ERRO = "erro"
+NIVEL_FALHAS = "falhas"
+NIVEL_TODOS = "todos"
+_NIVEIS = (NIVEL_DESLIGADO, NIVEL_ERRO, NIVEL_FALHAS, NIVEL_TODOS)
+
+# Quantidade de etapas mantidas no buffer do nível "falhas" (CAPTURA_BUFFER)
+TAMANHO_BUFFER_PADRAO = 20
+
+# Tamanho máximo do DOM guardado por etapa no buffer, em caracteres
+LIMITE_DOM = 200000
+
+# URL e DOM reduzido numa única chamada
+_SCRIPT_URL_DOM = "return [location.href, document.documentElement.outerHTML.slice(0, arguments[0])];"
+
+# Pasta base das capturas
+PASTA_CAPTURAS = os.path.join("logs", "capturas")
+
+# Identificador da execução, usado como subpasta de todas as capturas desta execução
+EXECUCAO = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+_fila = queue.Queue()
+_thread = None
+_trava = threading.Lock()
+_nota_atual = "geral"
+_sequencia = 0
+_buffer = None
+_ultima_etapa = None
+
+def nivel_captura():
+    """
+    Retorna o nível de captura desta execução.
+    Lido a cada chamada para respeitar o .env carregado depois da importação.
+    """
+    nivel = os.getenv("CAPTURA_NIVEL", NIVEL_FALHAS).strip().lower()
+    return nivel if nivel in _NIVEIS else NIVEL_FALHAS
+
+def _tamanho_buffer():
+    """Quantidade de etapas mantidas no buffer (CAPTURA_BUFFER, padrão 20)."""
+    try:
+        return max(1, int(os.getenv("CAPTURA_BUFFER", TAMANHO_BUFFER_PADRAO)))
+    except ValueError:
+        return TAMANHO_BUFFER_PADRAO
+
+def _compactar_html():
+    """Indica se os HTMLs devem ser gravados compactados (.html.gz)."""
+    return os.getenv("CAPTURA_COMPACTAR_HTML", "").strip().lower() in ("1", "true", "sim", "s")
+
+def deve_capturar(nome, erro=None):
+    """
+    Verifica se uma captura deve ser feita no nível atual.
+
+    Args:
+        nome: Nome da captura (ex.: "erro_tributos_federais.png")
+        erro: True se a captura é de erro. Se None, é deduzido do nome
+    """
+    nivel = nivel_captura()
+    if nivel == NIVEL_DESLIGADO:
+        return False
+    return nivel == NIVEL_TODOS or _eh_erro(nome, erro)
+
+def _eh_erro(nome, erro=None):
+    """Indica se a captura é de erro (explicitamente ou pelo nome começar com "erro")."""
+    if erro is None:
+        erro = os.path.basename(nome).lower().startswith("erro")
+    return bool(erro)
+
+def iniciar_nota(identificador):
+    """
+    Passa a gravar as próximas capturas na pasta da nota informada.
+
+    Args:
+        identificador: Identificação da nota (ex.: "linha_12")
+    """
+    global _nota_atual, _sequencia, _buffer, _ultima_etapa
+    with _trava:
+        _nota_atual = re.sub(r'[^\w.-]+', '_', str(identificador)) or "geral"
+        _sequencia = 0
+        # Cada nota começa com o buffer vazio
+        _buffer = None
+        _ultima_etapa = None
+
+def finalizar_nota():
+    """Volta a gravar as capturas na pasta geral da execução."""
+    iniciar_nota("geral")
+
+def pasta_nota():
+    """Retorna a pasta de capturas da nota atual."""
+    return os.path.join(PASTA_CAPTURAS, EXECUCAO, _nota_atual)
+
+def _proximo_caminho(nome, extensao):
+    """Monta o caminho numerado da próxima captura da nota atual."""
+    global _sequencia
+    base = os.path.splitext(os.path.basename(nome))[0]
+    with _trava:
+        _sequencia += 1
+        return os.path.join(pasta_nota(), f"{_sequencia:03d}_{base}{extensao}")
+
+def _gravar(item):
+    """Executado na thread de gravação: decodifica, compacta e grava uma captura ("png" ou "texto")."""
+    tipo, caminho, dados = item
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    if tipo == "png":
+        with open(caminho, "wb") as f:
+            f.write(base64.b64decode(dados))
+    elif caminho.endswith(".gz"):
+        with gzip.open(caminho, "wt", encoding="utf-8") as f:
+            f.write(dados)
+    else:
+        with open(caminho, "w", encoding="utf-8") as f:
+            f.write(dados)
+
+def _trabalhador():
+    """Loop da thread de gravação."""
+    while True:
+        item = _fila.get()
+        try:
+            if item is None:
+                return
+            _gravar(item)
+            logger.debug(f"Captura gravada em {item[1]}")
+        except Exception as e:
+            logger.warning(f"Erro ao gravar captura {item[1] if item else ''}: {e}")
+        finally:
+            _fila.task_done()
+
+def _enfileirar(tipo, caminho, dados):
+    """Entrega a captura à thread de gravação, iniciando-a se necessário."""
+    global _thread
+    with _trava:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_trabalhador, name="captura", daemon=True)
+            _thread.start()
+    _fila.put((tipo, caminho, dados))
+
+def capturar_screenshot(driver, nome, erro=None):
+    """
+    Captura um screenshot e agenda a gravação em segundo plano.
+
+    Args:
+        driver: WebDriver do Selenium
+        nome: Nome da captura (ex.: "apos_selecionar_empresa.png")
+        erro: True se a captura é de erro (se None, deduzido do nome)
+
+    Returns:
+        str: Caminho onde o arquivo será gravado, ou None se não capturado
+    """
+    if nivel_captura() == NIVEL_FALHAS:
+        registrar_etapa(driver, nome)
+        if _eh_erro(nome, erro):
+            return despejar_buffer(os.path.splitext(os.path.basename(nome))[0])
+        return None
+    if not deve_capturar(nome, erro):
+        return None
+    try:
+        dados = driver.get_screenshot_as_base64()
+    except Exception as e:
+        logger.warning(f"Erro ao capturar screenshot {nome}: {e}")
+        return None
+    caminho = _proximo_caminho(nome, ".png")
+    _enfileirar("png", caminho, dados)
+    logger.info(f"Screenshot agendado em {caminho}")
+    return caminho
+
+def capturar_html(driver, nome, erro=None, conteudo=None):
+    """
+    Captura o HTML da página (ou do iframe atual) e agenda a gravação em segundo plano.
+
+    Args:
+        driver: WebDriver do Selenium
+        nome: Nome da captura (ex.: "pagina_tributos")
+        erro: True se a captura é de erro (se None, deduzido do nome)
+        conteudo: HTML já obtido (opcional, evita um novo page_source)
+
+    Returns:
+        str: Caminho onde o arquivo será gravado, ou None se não capturado
+    """
+    if nivel_captura() == NIVEL_FALHAS:
+        # No gravador de voo o DOM reduzido já acompanha cada etapa do buffer
+        if _eh_erro(nome, erro):
+            registrar_etapa(driver, nome, screenshot=False, conteudo=conteudo)
+            return despejar_buffer(nome)
+        return None
+    if not deve_capturar(nome, erro):
+        return None
+    try:
+        dados = conteudo if conteudo is not None else driver.page_source
+    except Exception as e:
+        logger.warning(f"Erro ao capturar HTML {nome}: {e}")
+        return None
+    caminho = _proximo_caminho(nome, ".html.gz" if _compactar_html() else ".html")
+    _enfileirar("texto", caminho, dados)
+    logger.info(f"HTML agendado em {caminho}")
+    return caminho
+
+def registrar_etapa(driver, etapa, screenshot=True, conteudo=None):
+    """
+    Guarda a etapa no buffer circular em memória (nível "falhas"), sem tocar no disco.
+
+    Args:
+        driver: WebDriver do Selenium
+        etapa: Nome da etapa (ex.: "apos_selecionar_empresa.png")
+        screenshot: Se True, inclui o screenshot em base64
+        conteudo: HTML já obtido (opcional, evita consultar o DOM novamente)
+    """
+    global _buffer, _ultima_etapa
+    agora = time.time()
+    registro = {
+        "etapa": os.path.splitext(os.path.basename(etapa))[0],
+        "horario": datetime.fromtimestamp(agora).strftime("%H:%M:%S.%f")[:-3],
+        "segundos_desde_etapa_anterior": round(agora - _ultima_etapa, 3) if _ultima_etapa else None,
+        "url": None,
+        "dom": conteudo[:LIMITE_DOM] if conteudo is not None else None,
+        "screenshot": None,
+    }
+    try:
+        if conteudo is None:
+            registro["url"], registro["dom"] = driver.execute_script(_SCRIPT_URL_DOM, LIMITE_DOM)
+        else:
+            registro["url"] = driver.current_url
+        if screenshot:
+            registro["screenshot"] = driver.get_screenshot_as_base64()
+    except Exception as e:
+        logger.debug(f"Captura parcial da etapa {etapa}: {e}")
+    registro["duracao_captura"] = round(time.time() - agora, 3)
+
+    with _trava:
+        if _buffer is None or _buffer.maxlen != _tamanho_buffer():
+            _buffer = deque(_buffer or (), maxlen=_tamanho_buffer())
+        _buffer.append(registro)
+        _ultima_etapa = agora
+
+def despejar_buffer(motivo):
+    """
+    Grava em disco as etapas do buffer circular (nível "falhas") e esvazia o buffer.
+
+    Os arquivos vão para uma subpasta "falha_<motivo>" da nota atual, com um
+    resumo.json listando etapas, URLs e tempos.
+
+    Args:
+        motivo: Motivo do despejo (ex.: "erro_tributos_federais", "interrompida")
+
+    Returns:
+        str: Pasta onde as etapas serão gravadas, ou None se o buffer estava vazio
+    """
+    with _trava:
+        etapas = list(_buffer or ())
+        if _buffer is not None:
+            _buffer.clear()
+    if not etapas:
+        return None
+
+    motivo = re.sub(r'[^\w.-]+', '_', str(motivo))
+    pasta = _proximo_caminho(f"falha_{motivo}", "")
+    resumo = []
+    for i, registro in enumerate(etapas, 1):
+        base = os.path.join(pasta, f"{i:03d}_{registro['etapa']}")
+        if registro["screenshot"]:
+            _enfileirar("png", base + ".png", registro["screenshot"])
+        if registro["dom"]:
+            _enfileirar("texto", base + (".html.gz" if _compactar_html() else ".html"), registro["dom"])
+        resumo.append({chave: valor for chave, valor in registro.items() if chave not in ("screenshot", "dom")})
+    _enfileirar("texto", os.path.join(pasta, "resumo.json"),
+                json.dumps({"motivo": motivo, "etapas": resumo}, ensure_ascii=False, indent=2))
+    logger.warning(f"Gravador de voo: {len(etapas)} etapa(s) gravadas em {pasta} (motivo: {motivo})")
+    return pasta
+
+def aguardar_gravacoes():
+    """Bloqueia até que todas as capturas pendentes tenham sido gravadas."""
+    if _thread is not None and _thread.is_alive():
+        _fila.join()
+
+def encerrar():
+    """Grava as capturas pendentes e encerra a thread de gravação."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        _fila.put(None)
+        _thread.join()
+    _thread = None
+
+atexit.register(encerrar)
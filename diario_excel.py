@@ -0,0 +1,190 @@
+"""
+Módulo com o diário de gravação dos números das notas na planilha de controle.
+
+Cada número emitido é primeiro acrescentado, de forma durável, a um pequeno
+arquivo JSON-lines (logs/diario_excel.jsonl, ou o caminho da variável de
+ambiente DIARIO_EXCEL). A planilha, que é grande e fica no OneDrive, é aberta
+e salva uma única vez por lote (a cada LOTE_GRAVACAO_EXCEL notas e ao final da
+execução), com um único backup. Entradas que ficaram no diário por uma
+execução interrompida são gravadas na próxima inicialização, de forma que um
+número emitido nunca se perde.
+
+Se a célula da linha já tiver outro número na planilha, o número emitido não é
+sobrescrito nem descartado: a entrada é movida para o arquivo de conflitos
+(logs/diario_excel_conflitos.jsonl, ao lado do diário), que é apontado ao
+operador a cada execução até ser resolvido manualmente.
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+# Configuração de logger
+logger = logging.getLogger('diario_excel')
+
+# Arquivo padrão do diário (pode ser alterado pela variável de ambiente DIARIO_EXCEL)
+ARQUIVO_DIARIO = os.path.join("logs", "diario_excel.jsonl")
+
+# Quantidade de notas por gravação na planilha (LOTE_GRAVACAO_EXCEL)
+LOTE_PADRAO = 10
+
+_trava = threading.Lock()
+
+def _arquivo_diario():
+    """Caminho do diário, lido na utilização para respeitar o .env carregado depois da importação."""
+    return os.getenv("DIARIO_EXCEL", ARQUIVO_DIARIO)
+
+def _arquivo_conflitos():
+    """Arquivo de conflitos, ao lado do diário."""
+    return os.path.splitext(_arquivo_diario())[0] + "_conflitos.jsonl"
+
+def _acrescentar(arquivo, entradas):
+    """Acrescenta entradas JSON-lines ao arquivo e força a gravação em disco."""
+    pasta = os.path.dirname(arquivo)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(arquivo, "a", encoding="utf-8") as f:
+        # Uma gravação interrompida pode ter deixado a última linha sem quebra
+        if f.tell() > 0 and not _termina_com_quebra(arquivo):
+            f.write("\n")
+        for entrada in entradas:
+            f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def tamanho_lote():
+    """Quantidade de notas acumuladas antes de gravar a planilha (LOTE_GRAVACAO_EXCEL, padrão 10)."""
+    try:
+        return max(1, int(os.getenv("LOTE_GRAVACAO_EXCEL", LOTE_PADRAO)))
+    except ValueError:
+        return LOTE_PADRAO
+
+def _termina_com_quebra(arquivo):
+    """Indica se o último byte do arquivo é uma quebra de linha."""
+    with open(arquivo, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+def registrar_numero(linha_excel, numero_nota):
+    """
+    Acrescenta o número emitido ao diário e força a gravação em disco.
+
+    Args:
+        linha_excel: Linha do Excel (1-based, já considerando o cabeçalho)
+        numero_nota: Número da nota emitida
+    """
+    arquivo = _arquivo_diario()
+    entrada = {"linha_excel": int(linha_excel), "numero_nota": str(numero_nota),
+               "registrado_em": datetime.now().isoformat(timespec="seconds")}
+    with _trava:
+        _acrescentar(arquivo, [entrada])
+    logger.info(f"Número {numero_nota} da linha {linha_excel} registrado no diário")
+
+def entradas_pendentes():
+    """
+    Lê as entradas do diário que ainda não foram gravadas na planilha.
+
+    Returns:
+        dict: {linha_excel: numero_nota}, na ordem de registro (a última entrada de cada linha prevalece)
+    """
+    pendentes = {}
+    try:
+        with open(_arquivo_diario(), "r", encoding="utf-8") as f:
+            linhas = f.readlines()
+    except FileNotFoundError:
+        return pendentes
+    for texto in linhas:
+        if not texto.strip():
+            continue
+        try:
+            entrada = json.loads(texto)
+            pendentes[int(entrada["linha_excel"])] = entrada["numero_nota"]
+        except (ValueError, KeyError, TypeError):
+            # Linha incompleta de uma gravação interrompida
+            logger.warning(f"Entrada inválida ignorada no diário: {texto.strip()}")
+    return pendentes
+
+def lote_completo():
+    """Indica se o diário já acumulou notas suficientes para gravar a planilha."""
+    return len(entradas_pendentes()) >= tamanho_lote()
+
+def conflitos():
+    """
+    Lê as entradas em conflito (números emitidos para linhas que já tinham outro número na planilha).
+
+    Returns:
+        list: Dicionários {'linha_excel', 'numero_nota', 'valor_planilha', 'registrado_em'}
+    """
+    entradas = []
+    try:
+        with open(_arquivo_conflitos(), "r", encoding="utf-8") as f:
+            linhas = f.readlines()
+    except FileNotFoundError:
+        return entradas
+    for texto in linhas:
+        if texto.strip():
+            try:
+                entradas.append(json.loads(texto))
+            except ValueError:
+                logger.warning(f"Entrada inválida no arquivo de conflitos: {texto.strip()}")
+    return entradas
+
+def avisar_conflitos(log=None):
+    """
+    Aponta ao operador os números emitidos que não puderam ser gravados por conflito.
+
+    Returns:
+        int: Quantidade de conflitos pendentes
+    """
+    log = log or logger
+    entradas = conflitos()
+    if entradas:
+        log.error(f"{len(entradas)} número(s) emitido(s) não gravado(s) na planilha por conflito "
+                  f"(veja {_arquivo_conflitos()}; apague o arquivo depois de corrigir a planilha):")
+        for entrada in entradas:
+            log.error(f"  Linha {entrada.get('linha_excel')}: nota {entrada.get('numero_nota')} emitida, "
+                      f"planilha contém {entrada.get('valor_planilha')}")
+    return len(entradas)
+
+def aplicar_pendentes(caminho_excel, gravar):
+    """
+    Grava na planilha, de uma só vez, todas as entradas pendentes do diário.
+
+    O diário só é esvaziado se a gravação for bem-sucedida. As entradas cujas
+    células já tinham outro número são movidas para o arquivo de conflitos antes
+    de o diário ser esvaziado.
+
+    Args:
+        caminho_excel: Caminho do arquivo Excel de controle
+        gravar: Função gravar(caminho_excel, {linha_excel: numero_nota}) -> (bool, conflitos),
+            com conflitos no formato {linha_excel: valor já existente na planilha}
+
+    Returns:
+        bool: True se não havia pendências ou se a gravação foi bem-sucedida
+    """
+    with _trava:
+        pendentes = entradas_pendentes()
+        if not pendentes:
+            return True
+        logger.info(f"Gravando {len(pendentes)} número(s) do diário na planilha de controle...")
+        sucesso, em_conflito = gravar(caminho_excel, pendentes)
+        if not sucesso:
+            logger.error(f"Os números continuam no diário ({_arquivo_diario()}) e serão gravados na próxima tentativa")
+            return False
+        if em_conflito:
+            registrado_em = datetime.now().isoformat(timespec="seconds")
+            try:
+                _acrescentar(_arquivo_conflitos(), [
+                    {"linha_excel": int(linha), "numero_nota": str(pendentes[linha]),
+                     "valor_planilha": str(valor), "registrado_em": registrado_em}
+                    for linha, valor in em_conflito.items()])
+            except OSError as e:
+                logger.error(f"Não foi possível registrar os conflitos; o diário ({_arquivo_diario()}) é mantido: {e}")
+                return False
+            avisar_conflitos()
+        try:
+            os.remove(_arquivo_diario())
+        except OSError as e:
+            logger.warning(f"Não foi possível esvaziar o diário: {e}")
+        return True
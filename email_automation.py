@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
 import os
-import pandas as pd
 import logging
 from dotenv import load_dotenv
 import re
+import time
 from zoneinfo import ZoneInfo
-import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
+from datetime import datetime
 from exchange_manager import ExchangeEmailManager
+from planilha_controle import ler_registros, ler_cabecalho
 import argparse
-from PyPDF2 import PdfReader  # para extrair número interno de PDFs
+from extracao_notas import extrair_arquivos
+import indice_entrada
+import historico_envios
+import template_email
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,8 +27,14 @@ LAYOUT_EMAIL_FILE = './layout_email.txt'
 ARQUIVO_EXCEL_INFO = 'C:\\Users\\pesqu\\OneDrive\\LAF\\Adm_Fioravanso\\Planejamentos_Controles\\Financeiro\\_Controle NotaFiscal.xlsx'
 
 # Funções auxiliares
-def renomear_arquivos(pasta, empresa_map=None):
-    """Renomeia arquivos PDF e XML na pasta de entrada com prefixo 2025 e sufixo empresa."""
+def renomear_arquivos(pasta, empresa_map=None, processos=None):
+    """
+    Renomeia arquivos PDF e XML na pasta de entrada com prefixo do ano e sufixo empresa.
+
+    Arquivos já identificados em execuções anteriores são reconhecidos pelo índice
+    (`indice_entrada`). A extração dos números dos demais roda num pool de processos
+    (`extracao_notas`); apenas as renomeações são feitas em série.
+    """
     # Listar arquivos XML e PDF
     from datetime import datetime as _dt
     current_year = _dt.now().year
@@ -40,111 +49,135 @@ def renomear_arquivos(pasta, empresa_map=None):
         elif ext == '.pdf':
             pdf_entries.append(entry)
 
+    # Arquivos já identificados em execuções anteriores são reconhecidos pelo índice, sem ser interpretados
+    entries = xml_entries + pdf_entries
+    conteudos = {}
+    conhecidos = {}
+    for entry in entries:
+        try:
+            conteudos[entry.path], registro = indice_entrada.consultar(entry.path)
+        except OSError as e:
+            logger.warning(f"Não foi possível ler {entry.name}: {e}")
+            continue
+        if registro:
+            conhecidos[entry.path] = {'caminho': entry.path, 'tipo': registro['tipo'], 'numero': registro['numero'],
+                                      'erro': None, 'avisos': [], 'texto': '', 'pagina': None, 'duracao': 0.0}
+
+    # Extração em paralelo apenas dos arquivos novos; XMLs primeiro, como na renomeação
+    novos = [entry.path for entry in entries if entry.path in conteudos and entry.path not in conhecidos]
+    inicio = time.perf_counter()
+    extraidos = dict(zip(novos, extrair_arquivos(novos, processos)))
+    logger.info(f"{len(conhecidos)} arquivo(s) reconhecido(s) pelo índice; números extraídos de "
+                f"{len(novos)} arquivo(s) em {time.perf_counter() - inicio:.2f}s")
+
     arquivos_por_nota = {}
-    # Processar XML primeiro: extrair número do nome via prefixo ou do conteúdo
-    for entry in xml_entries:
-        name = entry.name
-        # Tenta primeiro extrair via nome no formato 2025_<numero>
-        m = re.match(r"2025_(\d+)", name)
-        if m:
-            numero = m.group(1)
-        else:
-            # Fallback: extrair número do conteúdo do XML (tag numero_nfse)
-            numero = None
-            try:
-                tree = ET.parse(entry.path)
-                num_text = tree.findtext('.//numero_nfse')
-                if num_text and num_text.isdigit():
-                    numero = num_text
-                else:
-                    raise ValueError('Tag numero_nfse inválida')
-            except Exception as e:
-                logger.warning(f"Falha ao extrair número de XML ({name}): {e}")
+    vistos = {}
+    for entry in entries:
+        resultado = conhecidos.get(entry.path) or extraidos.get(entry.path)
+        if resultado is None:
+            continue
+        for aviso in resultado['avisos']:
+            logger.warning(aviso)
+        numero = resultado['numero']
+        if resultado['tipo'] == 'xml':
+            if numero is None:
+                logger.warning(f"Falha ao extrair número de XML ({entry.name}): {resultado['erro']}")
                 continue
-        # Obter sufixo de empresa
-        empresa = empresa_map.get(int(numero)) if empresa_map else None
-        sufixo = f" - {empresa}" if empresa else ''
-        novo_nome = f"{current_year}_{numero}{sufixo}.xml"
-        novo_caminho = os.path.join(pasta, novo_nome)
-        os.rename(entry.path, novo_caminho)
-        arquivos_por_nota[int(numero)] = [novo_caminho]
-
-    # Processar PDFs: extrair número via prefixo ou fallback regex
-    for entry in pdf_entries:
-        numero = None
-        try:
-            # Extrai texto completo do PDF
-            reader = PdfReader(entry.path)
-            text = ''.join(page.extract_text() or '' for page in reader.pages)
-            # Procura número interno após 'Número da NFS-e' (flexível, sem acento e ignore case)
-            m = re.search(r'n[uú]mero da nfs-?e[:\s]*([0-9]+)', text, re.IGNORECASE)
-            if m:
-                numero = m.group(1)
-            else:
-                logger.warning(f"Regex não encontrou número no PDF {entry.name}")
-                # Segunda tentativa com expressão mais abrangente
-                m = re.search(r'nfs-?e[\s\:]*([0-9]+)', text, re.IGNORECASE)
-                if m:
-                    numero = m.group(1)
-                    logger.info(f"Número encontrado com regex alternativo: {numero}")
-                else:
-                    raise ValueError('número interno não encontrado')
-        except Exception as e:
-            logger.warning(f"Não foi possível extrair número interno do PDF {entry.name}: {e}")
+        elif numero is None:
+            logger.warning(f"Não foi possível extrair número interno do PDF {entry.name}: {resultado['erro']}")
             # Salvando conteúdo para debug em caso de falha
             try:
                 with open(f"/tmp/pdf_content_{entry.name.replace('.pdf', '.txt')}", "w", encoding="utf-8") as f:
-                    f.write(text[:2000])  # Salvando os primeiros 2000 caracteres para debug
+                    f.write(resultado['texto'])  # Salvando os primeiros 2000 caracteres para debug
                 logger.info(f"Primeiros 2000 caracteres do PDF salvos para debug")
             except:
                 pass
             continue
-            
-        # Dado que encontramos o número, renomeamos o arquivo
+
+        if entry.path in extraidos:
+            pagina = f", página {resultado['pagina']}" if resultado['pagina'] else ''
+            logger.info(f"Número {numero} extraído de {entry.name} ({resultado['duracao']:.3f}s{pagina})")
+            if resultado.get('campos'):
+                logger.debug(f"Campos lidos do XML {entry.name}: {resultado['campos']}")
+
+        # Mesma nota e mesmo tipo em dois arquivos: mantém o primeiro e não renomeia o segundo
+        chave = (int(numero), resultado['tipo'])
+        if chave in vistos:
+            logger.warning(f"Arquivo duplicado para a nota {numero}: {entry.name} "
+                           f"(já mapeado: {vistos[chave]}). O arquivo não será renomeado nem anexado.")
+            continue
+        vistos[chave] = entry.name
+
+        # Arquivos já renomeados mantêm o ano do prefixo; os novos recebem o ano atual
+        m = re.match(rf"(\d{{4}})_{numero}\b", entry.name)
+        ano = m.group(1) if m else current_year
+        # Obter sufixo de empresa
         empresa = empresa_map.get(int(numero)) if empresa_map else None
         sufixo = f" - {empresa}" if empresa else ''
-        novo_nome = f"{current_year}_{numero}{sufixo}.pdf"
+        novo_nome = f"{ano}_{numero}{sufixo}.{resultado['tipo']}"
         novo_caminho = os.path.join(pasta, novo_nome)
-        
+
         # Importante: realmente renomear o arquivo fisicamente
-        os.rename(entry.path, novo_caminho)
-        logger.info(f"PDF renomeado: {entry.name} -> {novo_nome}")
-        
-        # Adicionar à lista de arquivos para essa nota
-        arquivos_por_nota.setdefault(int(numero), []).append(novo_caminho)
+        if novo_nome != entry.name:
+            os.rename(entry.path, novo_caminho)
+            if resultado['tipo'] == 'pdf':
+                logger.info(f"PDF renomeado: {entry.name} -> {novo_nome}")
+        indice_entrada.registrar(novo_caminho, conteudos[entry.path], numero, resultado['tipo'])
+        if resultado['tipo'] == 'xml':
+            arquivos_por_nota[int(numero)] = [novo_caminho]
+        else:
+            # Adicionar à lista de arquivos para essa nota
+            arquivos_por_nota.setdefault(int(numero), []).append(novo_caminho)
     
+    indice_entrada.salvar()
     logger.info(f"Arquivos renomeados e mapeados por nota: {arquivos_por_nota}")
     return arquivos_por_nota
 
 
-def ler_informacoes_excel(arquivo_excel):
+def _numero_nota(valor):
+    """Converte o número da nota lido da planilha em int (None se não for numérico)."""
+    if isinstance(valor, bool) or valor is None:
+        return None
+    try:
+        return int(float(str(valor).strip()))
+    except (ValueError, OverflowError):
+        return None
+
+
+def ler_informacoes_excel(arquivo_excel, numeros=None, colunas_layout=None):
+    """
+    Lê número, e-mail e empresa de cada nota da planilha de controle.
+
+    A planilha é percorrida linha a linha apenas nas três colunas usadas
+    (openpyxl em modo somente leitura, ou o cache colunar se estiver atual),
+    mais as colunas usadas como variáveis no layout do e-mail.
+
+    Args:
+        arquivo_excel: Caminho da planilha de controle
+        numeros: Conjunto opcional de números de nota; se informado, apenas essas
+            notas são retornadas (ex.: as que têm arquivos em entrada/)
+        colunas_layout: Dicionário opcional {variável do layout: coluna da planilha}
+
+    Returns:
+        list: Dicionários com as chaves 'Numero', 'Email', 'Empresa_reduzido' e
+            'Variaveis' ({variável do layout: valor da planilha})
+    """
+    # Colunas necessárias - usando os nomes exatos das colunas como aparecem no Excel
+    expected = ['NÚMERO DAS NOTAS', 'E-MAIL\nResponsável', 'Nome Reduzido']
+    colunas_layout = colunas_layout or {}
+    logger.info(f"Procurando pelas colunas: {expected}")
     try:
-        df = pd.read_excel(arquivo_excel, engine='openpyxl')
-        logger.info(f"Arquivo Excel lido com sucesso. Colunas encontradas: {df.columns.tolist()}")
-        
-        # Verifica colunas necessárias - usando os nomes exatos das colunas como aparecem no Excel
-        expected = ['NÚMERO DAS NOTAS', 'E-MAIL\nResponsável', 'Nome Reduzido']
-        logger.info(f"Procurando pelas colunas: {expected}")
-        
-        for col in expected:
-            if col not in df.columns:
-                logger.error(f"Coluna '{col}' não encontrada no Excel. Colunas encontradas: {df.columns.tolist()}")
-                return []
-        
-        logger.info("Todas as colunas necessárias foram encontradas.")
-        
-        # Tratar e converter
-        df['NÚMERO DAS NOTAS'] = pd.to_numeric(df['NÚMERO DAS NOTAS'], errors='coerce')
-        df = df.dropna(subset=['NÚMERO DAS NOTAS'])
-        df['NÚMERO DAS NOTAS'] = df['NÚMERO DAS NOTAS'].astype(int)
-        
-        # Construir lista de dicionários - mapeando as colunas para os campos esperados pelo código
         informacoes = []
-        for _, row in df.iterrows():
+        colunas = expected + list(colunas_layout.values())
+        for numero, email, empresa, *extras in ler_registros(arquivo_excel, colunas, logger_planilha=logger):
+            numero = _numero_nota(numero)
+            if numero is None or (numeros is not None and numero not in numeros):
+                continue
             informacoes.append({
-                'Numero': int(row['NÚMERO DAS NOTAS']),
-                'Email': str(row['E-MAIL\nResponsável']).strip() if pd.notna(row['E-MAIL\nResponsável']) else '',
-                'Empresa_reduzido': str(row['Nome Reduzido']).strip() if pd.notna(row['Nome Reduzido']) else ''
+                'Numero': numero,
+                'Email': str(email).strip() if email is not None else '',
+                'Empresa_reduzido': str(empresa).strip() if empresa is not None else '',
+                'Variaveis': dict(zip(colunas_layout, extras))
             })
         
         logger.info(f"Processadas {len(informacoes)} linhas do Excel.")
@@ -155,40 +188,31 @@ def ler_informacoes_excel(arquivo_excel):
         return []
 
 
-def ler_layout_email(arquivo_layout):
+def carregar_layout_email(arquivo_layout, arquivo_excel):
+    """
+    Compila o layout do e-mail, aceitando as variáveis fixas e as colunas da planilha de controle.
+
+    Args:
+        arquivo_layout: Caminho do layout (layout_email.txt)
+        arquivo_excel: Caminho da planilha de controle, cujo cabeçalho define as variáveis extras
+
+    Returns:
+        tuple: (TemplateEmail, {variável do layout: coluna da planilha} das colunas usadas no layout)
+
+    Raises:
+        OSError: Se o layout não puder ser lido
+        ValueError: Se o layout estiver vazio ou tiver marcadores desconhecidos
+    """
+    colunas = {}
     try:
-        return open(arquivo_layout, 'r', encoding='utf-8').read()
+        for coluna in ler_cabecalho(arquivo_excel):
+            colunas.setdefault(template_email.nome_variavel(coluna), coluna)
     except Exception as e:
-        logger.error(f'Erro ao ler layout de e-mail: {e}')
-        return ''
-
-def ler_historico_envio(account, empresas_validas):
-    """Lê os e-mails enviados nos últimos 3 anos, filtra pelo padrão de anexo e empresas válidas."""
-    historico = []
-    data_limite = datetime.now(ZoneInfo("America/Sao_Paulo")) - timedelta(days=3*365)
-    padrao = re.compile(r'(\d{4})_(\d+) - (.+)\.pdf')
-    vistos = set()
-    try:
-        mails = account.sent.filter(datetime_sent__gte=data_limite).order_by('-datetime_sent')
-        for msg in mails:
-            if msg.subject in vistos:
-                continue
-            vistos.add(msg.subject)
-            for att in msg.attachments or []:
-                nome = getattr(att, 'name', '')
-                m = padrao.match(nome)
-                if m and m.group(3) in empresas_validas:
-                    destinatarios = [r.email_address for r in msg.to_recipients or []]
-                    historico.append({
-                        'assunto': msg.subject,
-                        'data_envio': msg.datetime_sent,
-                        'empresa': m.group(3),
-                        'destinatarios': destinatarios
-                    })
-                    break
-    except Exception as e:
-        logger.error(f"Erro ao ler histórico de envio: {e}")
-    return historico
+        logger.warning(f"Não foi possível ler o cabeçalho da planilha para o layout: {e}")
+    template = template_email.carregar_template(arquivo_layout, set(template_email.VARIAVEIS_FIXAS) | set(colunas))
+    usadas = {nome: colunas[nome] for nome in template.variaveis
+              if nome in colunas and nome not in template_email.VARIAVEIS_FIXAS}
+    return template, usadas
 
 # Script principal
 if __name__ == '__main__':
@@ -196,102 +220,122 @@ if __name__ == '__main__':
     # Parse de argumentos
     parser = argparse.ArgumentParser(description='Automação de e-mails NFSE')
     parser.add_argument('--historico', action='store_true', help='Gerar relatório de histórico de envios')
+    parser.add_argument('--processos', type=int, default=None,
+                        help='Processos para extrair os números dos PDFs/XMLs (padrão: PROCESSOS_EXTRACAO ou número de núcleos)')
+    parser.add_argument('--concorrencia', type=int, default=None,
+                        help='Lotes de rascunhos enviados ao mesmo tempo ao Exchange (padrão: EMAIL_CONCORRENCIA ou 4; 1 desativa)')
     args = parser.parse_args()
 
-    # 1. Ler Excel para obter mapeamento empresa
-    informacoes = ler_informacoes_excel(ARQUIVO_EXCEL_INFO)
+    # 1. Layout, compilado antes de tudo para apontar marcadores desconhecidos logo no início
+    try:
+        template, colunas_layout = carregar_layout_email(LAYOUT_EMAIL_FILE, ARQUIVO_EXCEL_INFO)
+    except (OSError, ValueError) as e:
+        logger.error(f'Erro no layout de e-mail: {e}')
+        exit(1)
+
+    # 2. Ler Excel para obter mapeamento empresa (e as colunas usadas no layout)
+    informacoes = ler_informacoes_excel(ARQUIVO_EXCEL_INFO, colunas_layout=colunas_layout)
     empresa_map = {info['Numero']: info['Empresa_reduzido'] for info in informacoes}
-    # 2. Renomear e mapear arquivos na pasta de entrada com base no mapeamento
-    arquivos_por_nota = renomear_arquivos(PASTA_ENTRADA, empresa_map)
+    # 3. Renomear e mapear arquivos na pasta de entrada com base no mapeamento
+    arquivos_por_nota = renomear_arquivos(PASTA_ENTRADA, empresa_map, args.processos)
     if not arquivos_por_nota:
         logger.warning('Nenhum arquivo PDF ou XML encontrado na pasta de entrada.')
 
-    # 3. Layout
-    layout = ler_layout_email(LAYOUT_EMAIL_FILE)
-    if not layout:
-        logger.error('Layout de e-mail vazio.')
-        exit(1)
-
-    # 4. Conectar Exchange
-    manager = ExchangeEmailManager()
+    # 4. Conectar Exchange (o pool de conexões é dimensionado pela concorrência)
+    manager = ExchangeEmailManager(concorrencia=args.concorrencia)
     setup = manager.connect()
     if not setup:
         logger.error('Falha ao conectar ao Exchange.')
         exit(1)
 
-    # Se solicitou só histórico, gera e sai
-    if args.historico:
-        empresas_validas = set(info['Empresa_reduzido'] for info in informacoes)
-        historico = ler_historico_envio(manager.account, empresas_validas)
-        if historico:
-            df_hist = pd.DataFrame(historico)
+    # A mesma sessão (conta e conexões) atende o histórico e os rascunhos e é fechada ao final
+    with manager:
+        # Se solicitou só histórico, gera e sai
+        if args.historico:
+            empresas_validas = set(info['Empresa_reduzido'] for info in informacoes)
+            try:
+                historico_envios.atualizar(manager.account)
+            except Exception as e:
+                logger.error(f"Erro ao atualizar histórico de envio: {e}")
+            # O relatório é uma exportação do histórico local (consultas: python historico_envios.py -h)
             arquivo_hist = 'historico_envios.xlsx'
-            df_hist.to_excel(arquivo_hist, index=False)
-            logger.info(f"Histórico de envios salvo em {arquivo_hist}")
-        else:
-            logger.warning('Nenhum histórico de envios encontrado.')
-        exit(0)
+            if historico_envios.exportar_excel(arquivo_hist, empresas_validas):
+                logger.info(f"Histórico de envios salvo em {arquivo_hist}")
+            else:
+                logger.warning('Nenhum histórico de envios encontrado.')
+            exit(0)
 
-    # 5. Criar rascunhos
-    count_sucesso = 0
-    count_sem_arquivos = 0
-    count_email_invalido = 0
+        # 5. Criar rascunhos
+        count_sucesso = 0
+        count_sem_arquivos = 0
+        count_email_invalido = 0
+        rascunhos = []
+        notas_rascunhos = []
+        # Assunto e saudação (horário de Brasília, GMT-3) são os mesmos para todos os rascunhos da execução
+        assunto = "Nota Fiscal La'Fioravanso Consultoria Empresarial"
+        saudacao = template_email.saudacao(datetime.now(ZoneInfo("America/Sao_Paulo")).hour)
     
-    for info in informacoes:
-        numero = int(info['Numero'])
-        email_dest = info['Email']
-        # Ignorar email inválido
-        if not isinstance(email_dest, str) or not email_dest.strip():
-            logger.debug(f"Email inválido ou ausente para nota {numero}: '{email_dest}'")
-            count_email_invalido += 1
-            continue
+        for info in informacoes:
+            numero = int(info['Numero'])
+            email_dest = info['Email']
+            # Ignorar email inválido
+            if not isinstance(email_dest, str) or not email_dest.strip():
+                logger.debug(f"Email inválido ou ausente para nota {numero}: '{email_dest}'")
+                count_email_invalido += 1
+                continue
 
-        # Obter arquivos já mapeados por número da nota
-        arquivos = arquivos_por_nota.get(numero, [])
-        if not arquivos:
-            logger.debug(f'Nenhum arquivo encontrado para nota {numero} (provavelmente já enviada).')
-            count_sem_arquivos += 1
-            continue
+            # Obter arquivos já mapeados por número da nota
+            arquivos = arquivos_por_nota.get(numero, [])
+            if not arquivos:
+                logger.debug(f'Nenhum arquivo encontrado para nota {numero} (provavelmente já enviada).')
+                count_sem_arquivos += 1
+                continue
 
-        # Definir assunto
-        assunto = "Nota Fiscal La'Fioravanso Consultoria Empresarial"
-        # Calcular saudação de acordo com horário de Brasília (GMT-3)
-        sp_tz = ZoneInfo("America/Sao_Paulo")
-        hora = datetime.now(sp_tz).hour
-        if hora < 12:
-            saudacao = "Bom dia"
-        elif hora < 18:
-            saudacao = "Boa tarde"
-        else:
-            saudacao = "Boa noite"
-        # Substituir placeholders no layout
-        corpo = layout
-        corpo = corpo.replace('{{SAUDACAO}}', saudacao)
-        corpo = corpo.replace('{{ARQUIVO}}', ', '.join(os.path.basename(a) for a in arquivos))
-        corpo = corpo.replace('{{NUMERO_NOTA}}', str(numero))
-
-        # Remover assinatura fixa (se houver) para permitir assinatura padrão do Outlook
-        # Exemplo: se houver uma assinatura fixa no layout, remova-a ou comente a linha abaixo
-        # corpo = corpo.replace('{{ASSINATURA}}', 'Assinatura fixa aqui')  # Remova esta linha se existir
-
-        success = manager.create_draft_with_attachments(
-            to_email=email_dest,
-            subject=assunto,
-            body_html=corpo,
-            attachment_paths=arquivos
-        )
-        if success:
-            count_sucesso += 1
-            logger.info(f"Rascunho criado com sucesso para nota {numero}")
-        else:
-            logger.error(f"Falha ao criar rascunho para nota {numero}")
-            count_email_invalido += 1
-
-    # Relatório final mais detalhado
-    total_notas = len(informacoes)
-    logger.info(f'=== RESUMO DA EXECUÇÃO ===')
-    logger.info(f'Total de notas processadas: {total_notas}')
-    logger.info(f'Rascunhos criados com sucesso: {count_sucesso}')
-    logger.info(f'Notas sem arquivos (provavelmente já enviadas): {count_sem_arquivos}')
-    logger.info(f'Notas com email inválido ou erro de criação: {count_email_invalido}')
-    logger.info(f'Percentual de sucesso (notas com arquivos): {(count_sucesso / (count_sucesso + count_email_invalido) * 100):.1f}%' if (count_sucesso + count_email_invalido) > 0 else 'N/A')
\ No newline at end of file
+            # Variáveis do layout: colunas da planilha usadas no layout e variáveis fixas
+            valores = dict(info.get('Variaveis', {}))
+            valores.update(SAUDACAO=saudacao, NUMERO_NOTA=numero, EMPRESA=info['Empresa_reduzido'],
+                           ARQUIVO=', '.join(os.path.basename(a) for a in arquivos))
+            corpo = template.render(valores)
+
+            rascunhos.append({
+                'to_email': email_dest,
+                'subject': assunto,
+                'body_html': corpo,
+                'attachment_paths': arquivos,
+                'rotulo': info['Empresa_reduzido'] or email_dest
+            })
+            notas_rascunhos.append({'numero': numero, 'empresa': info['Empresa_reduzido'],
+                                    'destinatarios': [e.strip() for e in email_dest.split(';') if e.strip()]})
+
+        # Os rascunhos são criados em lotes, com poucas chamadas ao servidor, enviados em paralelo
+        inicio_rascunhos = time.perf_counter()
+        resultados = manager.create_drafts_bulk(rascunhos)
+        duracao_rascunhos = time.perf_counter() - inicio_rascunhos
+        for indice, (nota, success) in enumerate(zip(notas_rascunhos, resultados)):
+            numero = nota['numero']
+            if success:
+                count_sucesso += 1
+                logger.info(f"Rascunho criado com sucesso para nota {numero}")
+            elif any(manager.resultado_partes.get(indice, [])):
+                # Partes já criadas estão listadas no log; apenas as faltantes devem ser refeitas
+                logger.error(f"Rascunho criado parcialmente para nota {numero}: não execute de novo para esta nota "
+                             f"sem antes conferir as partes na pasta Rascunhos")
+                count_email_invalido += 1
+            else:
+                logger.error(f"Falha ao criar rascunho para nota {numero}")
+                count_email_invalido += 1
+        # Os rascunhos criados entram no histórico local (latência até o envio)
+        try:
+            historico_envios.registrar_rascunhos(
+                [nota for nota, success in zip(notas_rascunhos, resultados) if success])
+        except Exception as e:
+            logger.warning(f"Não foi possível registrar os rascunhos no histórico: {e}")
+
+        # Relatório final mais detalhado
+        total_notas = len(informacoes)
+        logger.info(f'=== RESUMO DA EXECUÇÃO ===')
+        logger.info(f'Total de notas processadas: {total_notas}')
+        logger.info(f'Rascunhos criados com sucesso: {count_sucesso} (em {duracao_rascunhos:.1f}s)')
+        logger.info(f'Notas sem arquivos (provavelmente já enviadas): {count_sem_arquivos}')
+        logger.info(f'Notas com email inválido ou erro de criação: {count_email_invalido}')
+        logger.info(f'Percentual de sucesso (notas com arquivos): {(count_sucesso / (count_sucesso + count_email_invalido) * 100):.1f}%' if (count_sucesso + count_email_invalido) > 0 else 'N/A')
\ No newline at end of file
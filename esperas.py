@@ -0,0 +1,169 @@
+"""
+Módulo com a camada de esperas compartilhada pelos módulos de preenchimento.
+
+Cada condição é verificada em intervalos curtos e a espera termina assim que ela
+é satisfeita, substituindo as pausas fixas com time.sleep. Os tempos máximos
+continuam generosos para tolerar os dias em que o portal está lento e podem ser
+multiplicados pela variável de ambiente FATOR_TIMEOUT_ESPERA.
+"""
+import os
+import time
+import logging
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+
+# Configuração de logger
+logger = logging.getLogger('esperas')
+
+def fator_timeout():
+    """
+    Multiplicador aplicado a todos os timeouts (ex.: 2 em dias de portal lento).
+    Lido a cada espera para respeitar o .env carregado depois da importação.
+    """
+    try:
+        return float(os.getenv("FATOR_TIMEOUT_ESPERA", "1"))
+    except ValueError:
+        return 1.0
+
+# Intervalo entre verificações das condições, em segundos
+INTERVALO_PADRAO = 0.2
+
+# Considera a página pronta quando o documento terminou de carregar, não há
+# requisições jQuery pendentes e o DOM não muda há pelo menos N milissegundos.
+# O MutationObserver é instalado na primeira verificação de cada página.
+_SCRIPT_PAGINA_ESTAVEL = """
+var estavelMs = arguments[0];
+if (document.readyState !== 'complete') return false;
+if (typeof jQuery !== 'undefined' && jQuery.active > 0) return false;
+if (!window.__nfseObservador) {
+    window.__nfseUltimaMutacao = Date.now();
+    window.__nfseObservador = new MutationObserver(function() {
+        window.__nfseUltimaMutacao = Date.now();
+    });
+    window.__nfseObservador.observe(document.documentElement,
+        {childList: true, subtree: true, characterData: true});
+    return false;
+}
+return (Date.now() - window.__nfseUltimaMutacao) >= estavelMs;
+"""
+
+# Procura a célula de resultado cuja linha contém os dígitos do CNPJ
+_SCRIPT_LINHA_CNPJ = """
+var celulas = document.querySelectorAll(arguments[0]);
+var cnpj = arguments[1];
+for (var i = 0; i < celulas.length; i++) {
+    var linha = celulas[i].closest('tr') || celulas[i];
+    var digitos = (linha.innerText || '').replace(/\\D/g, '');
+    if (cnpj && digitos.indexOf(cnpj) >= 0) return celulas[i];
+}
+return null;
+"""
+
+# Retorna os elementos do seletor que já possuem texto visível
+_SCRIPT_ELEMENTOS_COM_TEXTO = """
+return Array.prototype.filter.call(document.querySelectorAll(arguments[0]), function(el) {
+    return (el.innerText || '').trim().length > 0;
+});
+"""
+
+# Retorna o primeiro elemento visível entre os seletores CSS, na ordem informada
+_SCRIPT_PRIMEIRO_VISIVEL = """
+var seletores = arguments[0];
+for (var i = 0; i < seletores.length; i++) {
+    var elementos;
+    try { elementos = document.querySelectorAll(seletores[i]); } catch (e) { continue; }
+    for (var j = 0; j < elementos.length; j++) {
+        var el = elementos[j];
+        var estilo = window.getComputedStyle(el);
+        if (estilo.display !== 'none' && estilo.visibility !== 'hidden' && el.getClientRects().length > 0) {
+            return el;
+        }
+    }
+}
+return null;
+"""
+
+def aguardar(driver, condicao, timeout=10, intervalo=INTERVALO_PADRAO, descricao="condição"):
+    """
+    Aguarda até que a condição retorne um valor verdadeiro.
+
+    Args:
+        driver: WebDriver do Selenium
+        condicao: Função que recebe o driver e retorna um valor verdadeiro quando satisfeita
+        timeout: Tempo máximo de espera em segundos (multiplicado por fator_timeout())
+        intervalo: Intervalo entre verificações em segundos
+        descricao: Descrição da condição para os logs
+
+    Returns:
+        O valor retornado pela condição, ou None se o tempo esgotar
+    """
+    limite = timeout * fator_timeout()
+    inicio = time.time()
+    try:
+        resultado = WebDriverWait(
+            driver, limite, poll_frequency=intervalo,
+            ignored_exceptions=(StaleElementReferenceException,)
+        ).until(condicao)
+        logger.debug(f"Condição '{descricao}' satisfeita em {time.time() - inicio:.2f}s")
+        return resultado
+    except TimeoutException:
+        logger.warning(f"Tempo esgotado ({limite:.0f}s) aguardando {descricao}")
+        return None
+
+def pagina_estavel(estavel_ms=500):
+    """Condição: documento carregado, jQuery.active == 0 e DOM sem mudanças por estavel_ms."""
+    return lambda driver: driver.execute_script(_SCRIPT_PAGINA_ESTAVEL, estavel_ms)
+
+def linha_com_cnpj(cnpj, seletor_celula='td[name="nomeRazao"]'):
+    """Condição: a tabela de resultados tem uma linha com o CNPJ. Retorna a célula encontrada."""
+    digitos = ''.join(filter(str.isdigit, str(cnpj)))
+    return lambda driver: driver.execute_script(_SCRIPT_LINHA_CNPJ, seletor_celula, digitos)
+
+def elementos_com_texto(seletor):
+    """Condição: existe ao menos um elemento do seletor com texto. Retorna a lista de elementos."""
+    return lambda driver: driver.execute_script(_SCRIPT_ELEMENTOS_COM_TEXTO, seletor)
+
+def primeiro_visivel(seletores):
+    """Condição: algum dos seletores CSS tem um elemento visível. Retorna o primeiro na ordem dada."""
+    seletores = list(seletores)
+    return lambda driver: driver.execute_script(_SCRIPT_PRIMEIRO_VISIVEL, seletores)
+
+def select_com_opcoes(alvo, minimo=2):
+    """
+    Condição: o select possui pelo menos `minimo` opções (além de "Selecione...").
+
+    Args:
+        alvo: WebElement do select ou seletor CSS para localizá-lo
+        minimo: Quantidade mínima de opções
+
+    Returns:
+        Função de condição que retorna o elemento select quando satisfeita
+    """
+    def condicao(driver):
+        if isinstance(alvo, str):
+            elementos = driver.find_elements(By.CSS_SELECTOR, alvo)
+            if not elementos:
+                return False
+            elemento = elementos[0]
+        else:
+            elemento = alvo
+        quantidade = driver.execute_script(
+            "return arguments[0].options ? arguments[0].options.length : 0;", elemento)
+        return elemento if quantidade >= minimo else False
+    return condicao
+
+def aguardar_pagina_estavel(driver, timeout=20, estavel_ms=500):
+    """
+    Aguarda a página terminar de carregar e o DOM parar de mudar.
+
+    Args:
+        driver: WebDriver do Selenium
+        timeout: Tempo máximo de espera em segundos
+        estavel_ms: Tempo sem mudanças no DOM para considerar a página estável
+
+    Returns:
+        bool: True se a página estabilizou, False se o tempo esgotou
+    """
+    return bool(aguardar(driver, pagina_estavel(estavel_ms), timeout,
+                         descricao="página estável (jQuery inativo e DOM sem mudanças)"))
@@ -4,14 +4,20 @@ exchange_manager.py
 Classe para gerenciar conexões e e-mails do Exchange
 """
 import os
+import json
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Optional
 from dotenv import load_dotenv
 
 # Importações para o Exchange Email
 from exchangelib import Credentials, Account, DELEGATE, HTMLBody, Message, Mailbox, Configuration, FileAttachment
+from exchangelib.items import SAVE_ONLY
+from exchangelib.errors import ErrorServerBusy
 from exchangelib.protocol import BaseProtocol, NoVerifyHTTPAdapter
+from exchangelib.version import Build, Version
 from exchangelib import EWSTimeZone
 
 # Configurar logging
@@ -21,11 +27,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger('exchange_manager')
 
+# Rascunhos por chamada CreateItem em create_drafts_bulk (EMAIL_LOTE_RASCUNHOS)
+LOTE_RASCUNHOS_PADRAO = 25
+
+# Lotes de rascunhos enviados ao mesmo tempo (EMAIL_CONCORRENCIA)
+CONCORRENCIA_PADRAO = 4
+
+# Tentativas de reenvio quando o servidor responde ErrorServerBusy
+TENTATIVAS_SERVIDOR_OCUPADO = 5
+
+def _env_int(nome, padrao):
+    """Lê um inteiro positivo da variável de ambiente, ou o padrão se ausente/inválido."""
+    try:
+        return max(1, int(os.getenv(nome, padrao)))
+    except ValueError:
+        return padrao
+
+MB = 1024 * 1024
+
+# Tamanho máximo de cada mensagem/requisição de rascunhos, em MB (EMAIL_TAMANHO_MAXIMO_MB).
+# Os anexos vão codificados em base64 (4/3 do tamanho) no XML da chamada ao EWS.
+TAMANHO_MAXIMO_MENSAGEM_MB = 25
+
+# Folga estimada para cabeçalhos, destinatários e envelope SOAP de cada mensagem
+TAMANHO_ESTRUTURA_MENSAGEM = 16 * 1024
+
+def tamanho_maximo_mensagem():
+    """Tamanho máximo estimado de uma mensagem ou lote, em bytes (EMAIL_TAMANHO_MAXIMO_MB, padrão 25)."""
+    return _env_int("EMAIL_TAMANHO_MAXIMO_MB", TAMANHO_MAXIMO_MENSAGEM_MB) * MB
+
+def _tamanho_codificado(tamanho):
+    """Tamanho em base64 de um conteúdo de `tamanho` bytes."""
+    return (tamanho + 2) // 3 * 4
+
+def concorrencia_padrao():
+    """Quantidade de lotes de rascunhos enviados em paralelo (EMAIL_CONCORRENCIA, padrão 4)."""
+    return _env_int("EMAIL_CONCORRENCIA", CONCORRENCIA_PADRAO)
+
+# Endpoint, autenticação e versão resolvidos nas conexões anteriores (EXCHANGE_CACHE_CONEXAO)
+ARQUIVO_CACHE_CONEXAO = os.path.join("logs", "exchange_conexao.json")
+
+def _arquivo_cache_conexao():
+    """Caminho do cache de conexão, lido na utilização para respeitar o .env."""
+    return os.getenv("EXCHANGE_CACHE_CONEXAO", ARQUIVO_CACHE_CONEXAO)
+
+def _ler_cache_conexao() -> dict:
+    """Lê o cache de conexão ({} se não existir ou for inválido)."""
+    try:
+        with open(_arquivo_cache_conexao(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _gravar_cache_conexao(cache: dict) -> None:
+    """Grava o cache de conexão de forma atômica (arquivo temporário + replace)."""
+    arquivo = _arquivo_cache_conexao()
+    pasta = os.path.dirname(arquivo)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(arquivo + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(arquivo + ".tmp", arquivo)
+
 class ExchangeEmailManager:
     """Gerencia operações de e-mail usando a API Exchange"""
 
-    def __init__(self):
-        """Inicializa o gerenciador de e-mail Exchange"""
+    def __init__(self, concorrencia: Optional[int] = None):
+        """
+        Inicializa o gerenciador de e-mail Exchange
+
+        Args:
+            concorrencia: Lotes de rascunhos enviados ao mesmo tempo (padrão: EMAIL_CONCORRENCIA ou 4).
+                Define também o tamanho do pool de conexões, por isso deve ser informada antes do connect.
+        """
         load_dotenv()  # Carregar variáveis de ambiente do .env
         self.email = os.getenv("EMAIL_USUARIO")
         self.password = os.getenv("EMAIL_SENHA")
@@ -33,6 +107,11 @@ class ExchangeEmailManager:
         self.service_endpoint = os.getenv("EMAIL_SERVICE_ENDPOINT") # Endpoint EWS
         self.account = None
         self.tz = EWSTimeZone.localzone()
+        self.concorrencia = max(1, concorrencia_padrao() if concorrencia is None else concorrencia)
+        # Tamanho e tempos de leitura/envio de cada anexo do último create_drafts_bulk
+        self.metricas_anexos = []
+        # Resultado de cada parte dos rascunhos do último create_drafts_bulk: {índice do rascunho: [bool por parte]}
+        self.resultado_partes = {}
 
         if not all([self.email, self.password]):
              raise ValueError("EMAIL_USUARIO e EMAIL_SENHA devem ser definidos no arquivo .env")
@@ -40,13 +119,99 @@ class ExchangeEmailManager:
         # Desabilitar verificação SSL se necessário (manter comentado se não usar cert auto-assinado)
         # BaseProtocol.HTTP_ADAPTER_CLS = NoVerifyHTTPAdapter
 
+        # Uma conexão por thread do envio concorrente de rascunhos (o pool é criado com o protocolo, no connect)
+        BaseProtocol.SESSION_POOLSIZE = max(BaseProtocol.SESSION_POOLSIZE, self.concorrencia)
+
         logger.info(f"ExchangeEmailManager inicializado para {self.email}")
 
+    def __enter__(self):
+        """Abre (ou reaproveita) a conexão para uso em bloco with, compartilhada entre as etapas."""
+        if not self.connect():
+            raise ConnectionError("Falha ao conectar ao Exchange")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Fecha as conexões HTTP do protocolo ao final do bloco with."""
+        self.close()
+        return False
+
+    def close(self) -> None:
+        """Fecha as conexões HTTP abertas com o servidor."""
+        if self.account is not None:
+            try:
+                self.account.protocol.close()
+            except Exception as e:
+                logger.debug(f"Erro ao fechar conexões com o Exchange: {e}")
+            self.account = None
+
+    def _config_cached(self, credentials, service_endpoint: Optional[str] = None) -> Optional[Configuration]:
+        """
+        Monta a configuração a partir do endpoint, autenticação e versão guardados de uma
+        conexão anterior, evitando o autodiscover e a detecção de versão.
+
+        Args:
+            credentials: Credenciais da conta.
+            service_endpoint: Endpoint configurado; se informado, o cache só é usado se for o mesmo.
+
+        Returns:
+            Configuration ou None se não houver cache utilizável.
+        """
+        cache = _ler_cache_conexao().get(self.email)
+        if not cache or (service_endpoint and cache.get("service_endpoint") != service_endpoint):
+            return None
+        try:
+            version = Version(build=Build(*cache["build"]), api_version=cache.get("api_version"))
+            return Configuration(service_endpoint=cache["service_endpoint"], credentials=credentials,
+                                 auth_type=cache.get("auth_type"), version=version)
+        except Exception as e:
+            logger.debug(f"Cache de conexão do Exchange inválido: {e}")
+            return None
+
+    def _save_connection_cache(self) -> None:
+        """Guarda o endpoint, a autenticação e a versão resolvidos na conexão atual."""
+        try:
+            build = self.account.version.build
+            cache = _ler_cache_conexao()
+            cache[self.email] = {
+                "service_endpoint": self.account.protocol.service_endpoint,
+                "auth_type": self.account.protocol.auth_type,
+                "build": [build.major_version, build.minor_version, build.major_build, build.minor_build],
+                "api_version": self.account.version.api_version,
+            }
+            _gravar_cache_conexao(cache)
+        except Exception as e:
+            logger.warning(f"Não foi possível guardar o cache de conexão do Exchange: {e}")
+
+    def _ping(self) -> None:
+        """Verifica a conexão com uma única chamada leve (ResolveNames do próprio usuário)."""
+        self.account.protocol.resolve_names([self.email])
+
     def connect(self) -> bool:
-        """Estabelece conexão com a conta Exchange"""
+        """Estabelece conexão com a conta Exchange (reaproveita a conexão já aberta)"""
+        if self.account is not None:
+            return True
         try:
             logger.info(f"Conectando à conta Exchange: {self.email}")
             credentials = Credentials(username=self.email, password=self.password)
+            endpoint = self.service_endpoint or (f"https://{self.server}/EWS/Exchange.asmx" if self.server else None)
+
+            # Endpoint, autenticação e versão de uma conexão anterior: sem autodiscover nem detecção de versão
+            config = self._config_cached(credentials, endpoint)
+            if config is not None:
+                logger.info(f"Conectando via endpoint EWS em cache: {config.service_endpoint}")
+                self.account = Account(
+                    primary_smtp_address=self.email,
+                    config=config,
+                    autodiscover=False,
+                    access_type=DELEGATE
+                )
+                try:
+                    self._ping()
+                    logger.info("Conexão com a conta Exchange estabelecida com sucesso")
+                    return True
+                except Exception as e:
+                    logger.warning(f"Endpoint em cache não respondeu ({e}). Refazendo a conexão...")
+                    self.close()
 
             # Priorizar a conexão direta via endpoint EWS para maior velocidade
             if self.service_endpoint:
@@ -78,19 +243,116 @@ class ExchangeEmailManager:
                     access_type=DELEGATE
                 )
 
-            # Testa a conexão
-            logger.info(f"Pasta raiz: {self.account.root}")
+            # Testa a conexão com uma chamada leve, sem percorrer as pastas
+            self._ping()
+            self._save_connection_cache()
             logger.info(f"Conexão com a conta Exchange estabelecida com sucesso")
             return True
 
         except Exception as e:
             logger.error(f"Erro ao conectar à conta Exchange: {str(e)}", exc_info=True)
+            self.account = None
             return False
 
+    def _build_draft(self, to_email, subject: str, body_html: str, attachment_paths: List[str],
+                     metricas: Optional[List[dict]] = None) -> Message:
+        """
+        Monta (sem salvar) a mensagem de rascunho com destinatários, corpo em HTML e anexos.
+
+        Args:
+            to_email: E-mail(s) do destinatário (string separada por ';' ou lista).
+            subject: Assunto do e-mail.
+            body_html: Corpo do e-mail em HTML.
+            attachment_paths: Lista de caminhos para os arquivos a serem anexados.
+            metricas: Lista onde é acrescentado {'arquivo', 'bytes', 'leitura_ms'} de cada anexo (opcional).
+
+        Returns:
+            Message: Mensagem pronta para ser salva na pasta de rascunhos.
+        """
+        # Preparar lista de destinatários, suportando string com emails separados por ';' ou lista de emails
+        if isinstance(to_email, str):
+            emails = [e.strip() for e in to_email.split(';') if e.strip()]
+        else:
+            emails = list(to_email)
+        recipients = [Mailbox(email_address=addr) for addr in emails]
+
+        # Construir mensagem usando body_html
+        message = Message(
+            account=self.account,
+            folder=self.account.drafts,
+            subject=subject,
+            body=HTMLBody(body_html),
+            to_recipients=recipients
+        )
+
+        # Anexar arquivos
+        for file_path in attachment_paths:
+            try:
+                inicio = time.perf_counter()
+                with open(file_path, 'rb') as f:
+                    file_content = f.read()
+                file_name = os.path.basename(file_path)
+                attachment = FileAttachment(name=file_name, content=file_content)
+                message.attach(attachment)
+                if metricas is not None:
+                    metricas.append({'arquivo': file_name, 'bytes': len(file_content),
+                                     'leitura_ms': (time.perf_counter() - inicio) * 1000})
+                logger.info(f"Anexado arquivo: {file_name}")
+            except FileNotFoundError:
+                logger.error(f"Erro: Arquivo de anexo não encontrado em {file_path}")
+                # Decide se continua sem o anexo ou retorna False
+                # return False # Descomente para falhar se um anexo não for encontrado
+            except Exception as e:
+                logger.error(f"Erro ao anexar arquivo {file_path}: {str(e)}")
+                # return False # Descomente para falhar em qualquer erro de anexo
+        return message
+
+    def _split_draft(self, draft: dict, limite: int) -> List[dict]:
+        """
+        Divide o rascunho em partes cujo tamanho estimado não passa do limite de mensagem,
+        antes de ler o conteúdo dos anexos.
+
+        Args:
+            draft: Dicionário com as chaves 'to_email', 'subject', 'body_html' e 'attachment_paths'.
+            limite: Tamanho máximo estimado de cada mensagem, em bytes.
+
+        Returns:
+            List[dict]: Partes no formato de `draft`, com a chave 'tamanho' (estimativa em bytes).
+            Se houver mais de uma, o assunto recebe o sufixo (parte/total).
+
+        Raises:
+            ValueError: Se um anexo sozinho já excede o limite.
+        """
+        base = len(draft['body_html'].encode('utf-8')) + TAMANHO_ESTRUTURA_MENSAGEM
+        grupos = [[]]
+        tamanhos = [base]
+        for caminho in draft['attachment_paths']:
+            try:
+                tamanho = _tamanho_codificado(os.path.getsize(caminho))
+            except OSError:
+                tamanho = 0  # o erro é registrado ao anexar, como antes
+            if base + tamanho > limite:
+                raise ValueError(f"Anexo {os.path.basename(caminho)} ({tamanho / MB:.1f} MB codificado) "
+                                 f"excede o limite de mensagem de {limite / MB:.1f} MB")
+            if grupos[-1] and tamanhos[-1] + tamanho > limite:
+                grupos.append([])
+                tamanhos.append(base)
+            grupos[-1].append(caminho)
+            tamanhos[-1] += tamanho
+
+        if len(grupos) == 1:
+            return [dict(draft, tamanho=tamanhos[0])]
+        return [dict(draft, subject=f"{draft['subject']} ({numero}/{len(grupos)})", attachment_paths=grupo,
+                     tamanho=tamanho)
+                for numero, (grupo, tamanho) in enumerate(zip(grupos, tamanhos), 1)]
+
     def create_draft_with_attachments(self, to_email: str, subject: str, body_html: str, attachment_paths: List[str]) -> bool:
         """
         Cria um e-mail de rascunho com anexos e corpo em HTML.
 
+        Se os anexos excederem o tamanho máximo de mensagem (EMAIL_TAMANHO_MAXIMO_MB),
+        são criados vários rascunhos, um por parte.
+
         Args:
             to_email: E-mail do destinatário.
             subject: Assunto do e-mail.
@@ -106,41 +368,24 @@ class ExchangeEmailManager:
                 if not self.connect():
                     return False
 
-            # Preparar lista de destinatários, suportando string com emails separados por ';' ou lista de emails
-            if isinstance(to_email, str):
-                emails = [e.strip() for e in to_email.split(';') if e.strip()]
-            else:
-                emails = list(to_email)
-            recipients = [Mailbox(email_address=addr) for addr in emails]
-
-            # Construir mensagem usando body_html
-            message = Message(
-                account=self.account,
-                folder=self.account.drafts,
-                subject=subject,
-                body=HTMLBody(body_html),
-                to_recipients=recipients
-            )
-
-            # Anexar arquivos
-            for file_path in attachment_paths:
-                try:
-                    with open(file_path, 'rb') as f:
-                        file_content = f.read()
-                    file_name = os.path.basename(file_path)
-                    attachment = FileAttachment(name=file_name, content=file_content)
-                    message.attach(attachment)
-                    logger.info(f"Anexado arquivo: {file_name}")
-                except FileNotFoundError:
-                    logger.error(f"Erro: Arquivo de anexo não encontrado em {file_path}")
-                    # Decide se continua sem o anexo ou retorna False
-                    # return False # Descomente para falhar se um anexo não for encontrado
-                except Exception as e:
-                    logger.error(f"Erro ao anexar arquivo {file_path}: {str(e)}")
-                    # return False # Descomente para falhar em qualquer erro de anexo
-
-            # Salvar como rascunho
-            message.save()
+            draft = {'to_email': to_email, 'subject': subject, 'body_html': body_html,
+                     'attachment_paths': attachment_paths}
+            partes = self._split_draft(draft, tamanho_maximo_mensagem())
+            if len(partes) > 1:
+                logger.warning(f"Anexos para {to_email} excedem o limite de mensagem: divididos em {len(partes)} rascunhos")
+            resultado_partes = []
+            try:
+                for parte in partes:
+                    message = self._build_draft(to_email, parte['subject'], body_html, parte['attachment_paths'])
+                    # Salvar como rascunho; a mensagem (e o conteúdo dos anexos) é liberada antes da próxima parte
+                    message.save()
+                    del message
+                    resultado_partes.append(True)
+            except Exception:
+                if len(partes) > 1:
+                    resultado_partes += [False] * (len(partes) - len(resultado_partes))
+                    self._log_partial_draft(to_email, list(zip(partes, resultado_partes)))
+                raise
 
             logger.info(f"Rascunho de e-mail criado para {to_email} - Assunto: {subject}")
             return True
@@ -149,5 +394,220 @@ class ExchangeEmailManager:
             logger.error(f"Erro ao criar rascunho de e-mail para {to_email}: {str(e)}", exc_info=True)
             return False
 
+    def _save_chunk(self, lote, resultados):
+        """
+        Monta e salva um lote de rascunhos com uma chamada bulk_create, repetindo com espera
+        crescente os itens recusados por servidor ocupado (ErrorServerBusy).
+
+        Os anexos do lote são lidos apenas aqui, de forma que só os lotes em envio
+        ficam em memória, e são liberados quando o lote termina.
+
+        Args:
+            lote: Lista de (índice, parte) a salvar, com as partes geradas por `_split_draft`.
+            resultados: Lista de resultados das partes, atualizada nos índices do lote.
+        """
+        partes = dict(lote)
+        pendentes, metricas = [], []
+        for indice, parte in lote:
+            anexos = []
+            try:
+                pendentes.append((indice, self._build_draft(parte['to_email'], parte['subject'], parte['body_html'],
+                                                            parte['attachment_paths'], anexos)))
+            except Exception as e:
+                logger.error(f"Erro ao montar rascunho para {parte.get('to_email')}: {str(e)}")
+            for anexo in anexos:
+                anexo['cliente'] = parte.get('rotulo') or parte['to_email']
+            metricas.extend(anexos)
+        if not pendentes:
+            return
+
+        inicio = time.perf_counter()
+        for tentativa in range(TENTATIVAS_SERVIDOR_OCUPADO):
+            try:
+                respostas = self.account.bulk_create(
+                    folder=self.account.drafts,
+                    items=[mensagem for _, mensagem in pendentes],
+                    message_disposition=SAVE_ONLY
+                )
+            except ErrorServerBusy as e:
+                espera = getattr(e, 'back_off', None) or 2 ** tentativa
+                logger.warning(f"Servidor Exchange ocupado. Aguardando {espera}s para reenviar {len(pendentes)} rascunho(s)")
+                time.sleep(espera)
+                continue
+            except Exception as e:
+                logger.error(f"Erro ao criar lote de {len(pendentes)} rascunho(s): {str(e)}", exc_info=True)
+                break
+
+            ocupados, espera = [], 0
+            for (indice, mensagem), resposta in zip(pendentes, respostas):
+                parte = partes[indice]
+                destinatario = parte['to_email']
+                if isinstance(resposta, ErrorServerBusy):
+                    ocupados.append((indice, mensagem))
+                    espera = max(espera, getattr(resposta, 'back_off', None) or 2 ** tentativa)
+                elif isinstance(resposta, Exception):
+                    logger.error(f"Erro ao criar rascunho de e-mail para {destinatario}: {resposta}")
+                else:
+                    resultados[indice] = True
+                    logger.info(f"Rascunho de e-mail criado para {destinatario} - Assunto: {parte['subject']}")
+            if not ocupados:
+                break
+            logger.warning(f"Servidor Exchange ocupado. Aguardando {espera}s para reenviar {len(ocupados)} rascunho(s)")
+            time.sleep(espera)
+            pendentes = ocupados
+        else:
+            logger.error(f"{len(pendentes)} rascunho(s) não criado(s): servidor Exchange continuou ocupado")
+
+        # O tempo de envio do lote é atribuído aos anexos proporcionalmente ao tamanho
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        total = sum(anexo['bytes'] for anexo in metricas) or 1
+        for anexo in metricas:
+            anexo['envio_ms'] = duracao_ms * anexo['bytes'] / total
+        self.metricas_anexos.extend(metricas)
+
+    def create_drafts_bulk(self, drafts: List[dict], chunk_size: Optional[int] = None,
+                           max_workers: Optional[int] = None) -> List[bool]:
+        """
+        Cria vários rascunhos com poucas chamadas CreateItem (account.bulk_create em lotes).
+
+        Os lotes são enviados em paralelo por um pool de threads que compartilha a
+        mesma conta e o mesmo pool de conexões do protocolo. O tamanho de cada
+        mensagem e de cada lote é estimado antes de ler os anexos: um rascunho acima
+        do limite (EMAIL_TAMANHO_MAXIMO_MB) é dividido em partes, e um lote não
+        passa desse limite, para evitar requisições grandes demais para o servidor.
+
+        Args:
+            drafts: Lista de dicionários com as chaves 'to_email', 'subject', 'body_html' e 'attachment_paths'
+                (e, opcionalmente, 'rotulo': nome do cliente nas métricas de anexos).
+            chunk_size: Rascunhos por chamada ao servidor (padrão: EMAIL_LOTE_RASCUNHOS ou 25).
+            max_workers: Lotes enviados ao mesmo tempo (padrão: a concorrência do gerenciador).
+                Valores acima dela são limitados a ela, que é o tamanho do pool de conexões.
+
+        Returns:
+            List[bool]: Resultado de cada rascunho (True se todas as partes foram criadas), na mesma ordem de `drafts`.
+            O resultado de cada parte fica em `resultado_partes`; as partes já criadas de um
+            rascunho incompleto são registradas no log, para não serem refeitas.
+        """
+        resultados = [False] * len(drafts)
+        self.metricas_anexos = []
+        self.resultado_partes = {}
+        if not drafts:
+            return resultados
+        if not self.account:
+            logger.warning("Conta não conectada. Tentando conectar...")
+            if not self.connect():
+                return resultados
+
+        if chunk_size is None:
+            chunk_size = _env_int("EMAIL_LOTE_RASCUNHOS", LOTE_RASCUNHOS_PADRAO)
+        if max_workers is None or max_workers > self.concorrencia:
+            max_workers = self.concorrencia
+        limite = tamanho_maximo_mensagem()
+
+        # Divide os rascunhos grandes em partes; um anexo acima do limite afeta apenas o próprio rascunho
+        partes, origem = [], []
+        for indice, draft in enumerate(drafts):
+            try:
+                divididas = self._split_draft(draft, limite)
+            except ValueError as e:
+                logger.error(f"Rascunho para {draft.get('to_email')} não criado: {e}")
+                continue
+            if len(divididas) > 1:
+                logger.warning(f"Anexos para {draft['to_email']} excedem o limite de mensagem: "
+                               f"divididos em {len(divididas)} rascunhos")
+            partes.extend(divididas)
+            origem.extend([indice] * len(divididas))
+
+        # Lotes limitados pela quantidade de rascunhos e pelo tamanho estimado da requisição
+        lotes, tamanho_lote = [], 0
+        for indice, parte in enumerate(partes):
+            if not lotes or len(lotes[-1]) >= chunk_size or tamanho_lote + parte['tamanho'] > limite:
+                lotes.append([])
+                tamanho_lote = 0
+            lotes[-1].append((indice, parte))
+            tamanho_lote += parte['tamanho']
+
+        resultados_partes = [False] * len(partes)
+        inicio = time.perf_counter()
+        if max_workers > 1 and len(lotes) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(lotes))) as executor:
+                futuros = [(lote, executor.submit(self._save_chunk, lote, resultados_partes)) for lote in lotes]
+            for lote, futuro in futuros:
+                try:
+                    futuro.result()
+                except Exception as e:
+                    self._log_failed_chunk(lote, e)
+        else:
+            for lote in lotes:
+                try:
+                    self._save_chunk(lote, resultados_partes)
+                except Exception as e:
+                    self._log_failed_chunk(lote, e)
+
+        partes_por_rascunho = {}
+        for indice, parte, sucesso in zip(origem, partes, resultados_partes):
+            partes_por_rascunho.setdefault(indice, []).append((parte, sucesso))
+        for indice, lista in partes_por_rascunho.items():
+            self.resultado_partes[indice] = [sucesso for _, sucesso in lista]
+            resultados[indice] = all(self.resultado_partes[indice])
+            if len(lista) > 1 and not resultados[indice]:
+                self._log_partial_draft(drafts[indice]['to_email'], lista)
+
+        logger.info(f"Rascunhos criados em lote: {sum(resultados)} de {len(drafts)} "
+                    f"({len(lotes)} lote(s), até {max_workers} em paralelo, {time.perf_counter() - inicio:.1f}s)")
+        self._log_attachment_metrics()
+        return resultados
+
+    def _log_failed_chunk(self, lote, erro) -> None:
+        """
+        Registra um lote interrompido por erro inesperado em `_save_chunk`.
+
+        Args:
+            lote: Lista de (índice, parte) do lote.
+            erro: Exceção levantada.
+        """
+        destinatarios = ', '.join(dict.fromkeys(parte['to_email'] for _, parte in lote))
+        logger.error(f"Erro inesperado ao criar lote de {len(lote)} rascunho(s) ({destinatarios}): {erro}",
+                     exc_info=erro)
+
+    def _log_partial_draft(self, to_email, partes) -> None:
+        """
+        Registra as partes já criadas e as que faltam de um rascunho dividido, para que
+        apenas as faltantes sejam refeitas (refazer o rascunho inteiro duplicaria as criadas).
+
+        Args:
+            to_email: Destinatário do rascunho.
+            partes: Lista de (parte, sucesso), com as partes geradas por `_split_draft`.
+        """
+        criadas = [parte['subject'] for parte, sucesso in partes if sucesso]
+        if not criadas:
+            return
+        logger.error(f"Rascunho para {to_email} criado parcialmente. Partes já criadas (não refazer): "
+                     f"{'; '.join(criadas)}")
+        for parte, sucesso in partes:
+            if not sucesso:
+                logger.error(f"  Parte não criada: {parte['subject']} - anexos: "
+                             f"{', '.join(os.path.basename(caminho) for caminho in parte['attachment_paths'])}")
+
+    def _log_attachment_metrics(self, limite: int = 10) -> None:
+        """Registra o volume e o tempo dos anexos por cliente, dos mais lentos para os mais rápidos."""
+        por_cliente = {}
+        for anexo in self.metricas_anexos:
+            total = por_cliente.setdefault(anexo['cliente'], {'arquivos': 0, 'bytes': 0, 'leitura_ms': 0.0, 'envio_ms': 0.0})
+            total['arquivos'] += 1
+            total['bytes'] += anexo['bytes']
+            total['leitura_ms'] += anexo['leitura_ms']
+            total['envio_ms'] += anexo.get('envio_ms', 0.0)
+        if not por_cliente:
+            return
+        ordenados = sorted(por_cliente.items(), key=lambda item: item[1]['leitura_ms'] + item[1]['envio_ms'], reverse=True)
+        logger.info(f"Anexos por cliente (os {min(limite, len(ordenados))} mais lentos de {len(ordenados)}):")
+        for cliente, total in ordenados[:limite]:
+            logger.info(f"  {cliente}: {total['arquivos']} arquivo(s), {total['bytes'] / 1024:.0f} KB, "
+                        f"leitura {total['leitura_ms']:.0f} ms, envio {total['envio_ms']:.0f} ms")
+        for anexo in sorted(self.metricas_anexos, key=lambda a: a.get('envio_ms', 0.0), reverse=True):
+            logger.debug(f"Anexo {anexo['arquivo']} ({anexo['cliente']}): {anexo['bytes'] / 1024:.0f} KB, "
+                         f"leitura {anexo['leitura_ms']:.1f} ms, envio {anexo.get('envio_ms', 0.0):.1f} ms")
+
     # Você pode adicionar aqui o método para ler e-mails enviados se necessário
     # def read_sent_emails(self, years=3): ...
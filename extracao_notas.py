@@ -0,0 +1,231 @@
+"""
+Módulo com a extração do número da NFS-e dos arquivos PDF e XML da pasta de entrada.
+
+A extração de cada arquivo é independente das demais, então o lote é
+distribuído num pool de processos (PROCESSOS_EXTRACAO, padrão: número de
+núcleos). As funções deste módulo não registram logs nem alteram arquivos: cada
+extração devolve um dicionário com o resultado e as mensagens, e quem chama
+registra os logs e faz as renomeações em série.
+"""
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader  # para extrair número interno de PDFs
+
+def numero_processos():
+    """
+    Quantidade de processos da extração (PROCESSOS_EXTRACAO, padrão: número de núcleos).
+    Lido a cada chamada para respeitar o .env carregado depois da importação.
+    """
+    try:
+        return max(1, int(os.getenv("PROCESSOS_EXTRACAO", os.cpu_count() or 1)))
+    except ValueError:
+        return os.cpu_count() or 1
+
+# Campos lidos do XML da NFS-e: {campo: (tags aceitas, tag ancestral exigida ou None)}.
+# As tags são comparadas sem namespace e sem diferenciar maiúsculas, cobrindo o
+# layout do portal (numero_nfse, valor_total, tomador/cpfcnpj) e o ABRASF.
+CAMPOS_XML = {
+    'numero': (('numero_nfse',), None),
+    'cnpj_tomador': (('cpfcnpj', 'cpf_cnpj', 'cnpj'), 'tomador'),
+    'valor': (('valor_total', 'valor_servico', 'valor_servicos', 'valorservicos'), None),
+    'competencia': (('competencia', 'data_competencia', 'data_fato_gerador', 'data_nfse', 'dataemissao'), None),
+}
+
+def _tag_local(tag):
+    """Nome da tag sem namespace, em minúsculas."""
+    return tag.rsplit('}', 1)[-1].lower()
+
+def extrair_campos_xml(caminho, campos=CAMPOS_XML):
+    """
+    Lê os campos da NFS-e num único passe incremental (iterparse) sobre o XML.
+
+    A leitura para assim que todos os campos pedidos forem encontrados, e os
+    elementos já lidos são descartados, de forma que exportações grandes do
+    portal são lidas com memória constante.
+
+    Args:
+        caminho: Caminho do arquivo XML
+        campos: Dicionário {campo: (tags, ancestral)} no formato de CAMPOS_XML
+
+    Returns:
+        dict: {campo: texto} com os campos encontrados (a primeira ocorrência de cada um)
+    """
+    encontrados = {}
+    pilha = []
+    elementos = []
+    # O arquivo é aberto aqui para ser fechado mesmo quando a leitura para antes do fim
+    # (no Windows, um arquivo aberto não pode ser renomeado em seguida)
+    with open(caminho, 'rb') as f:
+        for evento, elemento in ET.iterparse(f, events=('start', 'end')):
+            tag = _tag_local(elemento.tag)
+            if evento == 'start':
+                pilha.append(tag)
+                elementos.append(elemento)
+                continue
+            pilha.pop()
+            elementos.pop()
+            texto = (elemento.text or '').strip()
+            if texto:
+                for campo, (tags, ancestral) in campos.items():
+                    if campo in encontrados or tag not in tags:
+                        continue
+                    if ancestral is None or any(ancestral in nome for nome in pilha):
+                        encontrados[campo] = texto
+            # Remove o elemento lido do pai, para que a árvore não cresça durante a leitura
+            elemento.clear()
+            if elementos:
+                elementos[-1].remove(elemento)
+            if len(encontrados) == len(campos):
+                break
+    return encontrados
+
+def extrair_numero_xml(caminho, resultado=None):
+    """
+    Extrai o número da nota de um XML: pelo nome no formato <ano>_<numero> ou pela tag numero_nfse.
+
+    Args:
+        caminho: Caminho do arquivo XML
+        resultado: Dicionário do resultado, onde são guardados os demais campos lidos (opcional)
+
+    Returns:
+        str: Número da nota
+
+    Raises:
+        ValueError: Se a tag numero_nfse não existir ou não for numérica
+    """
+    # Tenta primeiro extrair via nome no formato <ano>_<numero> (já renomeado)
+    m = re.match(r"\d{4}_(\d+)", os.path.basename(caminho))
+    if m:
+        return m.group(1)
+    # Fallback: extrair número do conteúdo do XML (tag numero_nfse), junto com os demais campos
+    campos = extrair_campos_xml(caminho)
+    if resultado is not None:
+        resultado['campos'] = campos
+    num_text = campos.get('numero')
+    if num_text and num_text.isdigit():
+        return num_text
+    raise ValueError('Tag numero_nfse inválida')
+
+def regiao_numero_pdf():
+    """
+    Região opcional da página 1 onde fica o número (REGIAO_NUMERO_PDF="x0,y0,x1,y1", em pontos
+    do PDF, origem no canto inferior esquerdo). Retorna None se não configurada ou inválida.
+    """
+    valor = os.getenv("REGIAO_NUMERO_PDF", "").strip()
+    if not valor:
+        return None
+    try:
+        x0, y0, x1, y1 = (float(parte) for parte in valor.split(","))
+        return (x0, y0, x1, y1)
+    except ValueError:
+        return None
+
+def _texto_na_regiao(page, regiao):
+    """Extrai apenas os trechos de texto da página cuja posição está dentro da região."""
+    x0, y0, x1, y1 = regiao
+    trechos = []
+
+    def visitante(texto, cm, tm, fonte, tamanho):
+        x, y = tm[4], tm[5]
+        if x0 <= x <= x1 and y0 <= y <= y1:
+            trechos.append(texto)
+
+    page.extract_text(visitor_text=visitante)
+    return ''.join(trechos)
+
+def extrair_numero_pdf(caminho, resultado, regiao=None):
+    """
+    Extrai o número interno da nota do texto do PDF (após 'Número da NFS-e').
+
+    As páginas são lidas uma a uma e a leitura para na primeira página em que o
+    número aparece (normalmente o cabeçalho da página 1). Com `regiao`, a página 1
+    é lida primeiro apenas nessa região.
+
+    Args:
+        caminho: Caminho do arquivo PDF
+        resultado: Dicionário do resultado, onde são acrescentados avisos, a página e o texto para depuração
+        regiao: Região (x0, y0, x1, y1) da página 1 onde procurar primeiro (opcional)
+
+    Returns:
+        str: Número da nota
+
+    Raises:
+        ValueError: Se o número não for encontrado
+    """
+    # Procura número interno após 'Número da NFS-e' (flexível, sem acento e ignore case)
+    padrao = re.compile(r'n[uú]mero da nfs-?e[:\s]*([0-9]+)', re.IGNORECASE)
+    reader = PdfReader(caminho)
+
+    if regiao and reader.pages:
+        m = padrao.search(_texto_na_regiao(reader.pages[0], regiao))
+        if m:
+            resultado['pagina'] = 1
+            return m.group(1)
+
+    textos = []
+    for pagina, page in enumerate(reader.pages, 1):
+        textos.append(page.extract_text() or '')
+        m = padrao.search(textos[-1])
+        if m:
+            resultado['pagina'] = pagina
+            return m.group(1)
+
+    text = ''.join(textos)
+    resultado['texto'] = text[:2000]
+    resultado['avisos'].append(f"Regex não encontrou número no PDF {os.path.basename(caminho)}")
+    # Segunda tentativa com expressão mais abrangente
+    m = re.search(r'nfs-?e[\s\:]*([0-9]+)', text, re.IGNORECASE)
+    if m:
+        resultado['avisos'].append(f"Número encontrado com regex alternativo: {m.group(1)}")
+        return m.group(1)
+    raise ValueError('número interno não encontrado')
+
+def extrair_arquivo(caminho):
+    """
+    Extrai o número da nota de um arquivo PDF ou XML. Executado nos processos do pool.
+
+    Args:
+        caminho: Caminho do arquivo
+
+    Returns:
+        dict: {'caminho', 'tipo' ('pdf' ou 'xml'), 'numero' (str ou None),
+            'erro' (str ou None), 'avisos' (list), 'texto' (início do texto do PDF, para depuração),
+            'pagina' (página do PDF onde o número foi achado), 'duracao' (segundos),
+            'campos' (demais campos lidos do XML: cnpj_tomador, valor, competencia)}
+    """
+    inicio = time.perf_counter()
+    tipo = os.path.splitext(caminho)[1].lower().lstrip('.')
+    resultado = {'caminho': caminho, 'tipo': tipo, 'numero': None, 'erro': None, 'avisos': [], 'texto': '',
+                 'pagina': None, 'duracao': 0.0, 'campos': {}}
+    try:
+        if tipo == 'xml':
+            resultado['numero'] = extrair_numero_xml(caminho, resultado)
+        else:
+            resultado['numero'] = extrair_numero_pdf(caminho, resultado, regiao_numero_pdf())
+    except Exception as e:
+        resultado['erro'] = str(e)
+    resultado['duracao'] = time.perf_counter() - inicio
+    return resultado
+
+def extrair_arquivos(caminhos, processos=None):
+    """
+    Extrai o número da nota de vários arquivos, em paralelo quando houver mais de um.
+
+    Args:
+        caminhos: Lista de caminhos de arquivos PDF/XML
+        processos: Quantidade de processos (se None, usa `numero_processos()`)
+
+    Returns:
+        list: Resultados de `extrair_arquivo`, na mesma ordem dos caminhos
+    """
+    caminhos = list(caminhos)
+    processos = min(processos or numero_processos(), len(caminhos))
+    if processos <= 1:
+        return [extrair_arquivo(caminho) for caminho in caminhos]
+    # Lotes de alguns arquivos por tarefa reduzem a comunicação entre processos
+    chunksize = max(1, len(caminhos) // (processos * 4))
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        return list(executor.map(extrair_arquivo, caminhos, chunksize=chunksize))
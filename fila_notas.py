@@ -0,0 +1,253 @@
+"""
+Módulo com a fila de notas pendentes da planilha de controle.
+
+A planilha é lida uma única vez por execução. As linhas pendentes (primeira
+coluna vazia e Empresa ou CNPJ preenchidos) são calculadas de forma vetorizada
+e entregues em ordem. Os números das notas emitidas são aplicados em memória,
+e a planilha só é relida quando o arquivo for alterado por fora (data de
+modificação e conteúdo diferentes dos conhecidos).
+"""
+import os
+import hashlib
+import logging
+from typing import NamedTuple
+import pandas as pd
+
+# Configuração de logger
+logger = logging.getLogger('fila_notas')
+
+COLUNA_EMPRESA = 'Empresa - Razão Social'
+COLUNA_CNPJ = 'CNPJ'
+
+def _hash_arquivo(caminho, bloco=1024 * 1024):
+    """Calcula o hash SHA-1 do conteúdo do arquivo."""
+    sha1 = hashlib.sha1()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            sha1.update(parte)
+    return sha1.hexdigest()
+
+def mascara_pendentes(df):
+    """
+    Calcula de forma vetorizada quais linhas estão pendentes de emissão.
+
+    Args:
+        df (pd.DataFrame): DataFrame da planilha de controle
+
+    Returns:
+        pd.Series: Série booleana, True para linhas sem número e com Empresa ou CNPJ
+    """
+    vazia = pd.Series(index=df.index, dtype=object)
+    primeira_coluna = df.iloc[:, 0]
+    numero_vazio = primeira_coluna.isna() | (primeira_coluna.astype(str).str.strip() == "")
+    tem_dados = df.get(COLUNA_EMPRESA, vazia).notna() | df.get(COLUNA_CNPJ, vazia).notna()
+    return numero_vazio & tem_dados
+
+class NotaPendente(NamedTuple):
+    """Linha pendente da planilha de controle."""
+    linha_excel: int
+    empresa: object
+    cnpj: object
+    dados: dict
+
+def selecionar_notas_pendentes(df):
+    """
+    Seleciona todas as linhas pendentes de emissão, na ordem da planilha.
+
+    Apenas as linhas pendentes são convertidas em dicionário; o restante da
+    planilha (o histórico de notas já emitidas) não é percorrido linha a linha.
+
+    Args:
+        df (pd.DataFrame): DataFrame da planilha de controle
+
+    Returns:
+        list: Lista de NotaPendente
+    """
+    if df is None or df.empty:
+        return []
+    posicoes = mascara_pendentes(df).to_numpy().nonzero()[0]
+    registros = df.iloc[posicoes].to_dict("records")
+    # +2 porque pandas é 0-based, Excel começa na linha 1, e temos 1 linha de header
+    return [NotaPendente(int(posicao) + 2, dados.get(COLUNA_EMPRESA), dados.get(COLUNA_CNPJ), dados)
+            for posicao, dados in zip(posicoes, registros)]
+
+def contar_notas(df):
+    """
+    Conta as linhas da planilha por situação.
+
+    Args:
+        df (pd.DataFrame): DataFrame da planilha de controle
+
+    Returns:
+        dict: {'pendentes', 'emitidas', 'invalidas', 'total'}; inválidas são linhas sem
+            número e sem Empresa/CNPJ, mas com alguma outra coluna preenchida
+            (linhas totalmente vazias não são contadas)
+    """
+    if df is None or df.empty:
+        return {'pendentes': 0, 'emitidas': 0, 'invalidas': 0, 'total': 0}
+    pendentes = mascara_pendentes(df)
+    primeira_coluna = df.iloc[:, 0]
+    emitidas = primeira_coluna.notna() & (primeira_coluna.astype(str).str.strip() != "")
+    preenchidas = df.notna().any(axis=1)
+    invalidas = preenchidas & ~emitidas & ~pendentes
+    return {
+        'pendentes': int(pendentes.sum()),
+        'emitidas': int(emitidas.sum()),
+        'invalidas': int(invalidas.sum()),
+        'total': len(df),
+    }
+
+class NotaQueue:
+    """
+    Fila em memória das notas pendentes da planilha de controle.
+
+    Substitui a releitura da planilha e a varredura desde a primeira linha a
+    cada nota: a planilha é carregada uma vez, as linhas
+    pendentes são entregues em ordem e cada linha é entregue uma única vez por
+    execução (uma nota com falha não volta para a fila).
+    """
+
+    def __init__(self, caminho_excel, carregar, logger_fila=None):
+        """
+        Inicializa a fila sem ler a planilha.
+
+        Args:
+            caminho_excel: Caminho do arquivo Excel de controle
+            carregar: Função que recebe o caminho e retorna o DataFrame (ou None em caso de erro)
+            logger_fila: Logger para registro de logs (opcional)
+        """
+        self.caminho_excel = caminho_excel
+        self.carregar = carregar
+        self.logger = logger_fila or logger
+        self.df = None
+        self.carregamentos = 0
+        self._assinatura = None
+        self._hash = None
+        self._pendentes = []
+        self._entregues = set()
+
+    def _assinatura_arquivo(self):
+        """Retorna (data de modificação, tamanho) do arquivo, ou None se não existir."""
+        try:
+            estado = os.stat(self.caminho_excel)
+            return (estado.st_mtime, estado.st_size)
+        except OSError:
+            return None
+
+    def _registrar_versao(self):
+        """Guarda a assinatura e o hash da versão atual do arquivo."""
+        self._assinatura = self._assinatura_arquivo()
+        try:
+            self._hash = _hash_arquivo(self.caminho_excel)
+        except OSError:
+            self._hash = None
+
+    def carregar_planilha(self):
+        """
+        Lê a planilha e recalcula as linhas pendentes.
+
+        Returns:
+            bool: True se a planilha foi carregada, False caso contrário
+        """
+        df = self.carregar(self.caminho_excel)
+        if df is None:
+            return False
+        self.df = df
+        self.carregamentos += 1
+        self._registrar_versao()
+
+        # Linhas já entregues nesta execução não voltam para a fila
+        self._pendentes = [nota for nota in selecionar_notas_pendentes(df)
+                           if nota.linha_excel not in self._entregues]
+        contagem = contar_notas(df)
+        self.logger.info(f"Fila de notas: {len(self._pendentes)} pendente(s), {contagem['emitidas']} emitida(s), "
+                         f"{contagem['invalidas']} inválida(s) em {contagem['total']} linha(s)")
+        return True
+
+    def atualizar_se_modificado(self):
+        """
+        Relê a planilha apenas se o arquivo foi alterado por fora desde a última leitura.
+
+        A data de modificação e o tamanho são verificados primeiro; o hash do conteúdo
+        só é calculado quando eles mudam (o OneDrive pode alterar a data sem mudar o conteúdo).
+
+        Returns:
+            bool: True se a planilha foi relida, False caso contrário
+        """
+        assinatura = self._assinatura_arquivo()
+        if self.df is not None and assinatura == self._assinatura:
+            return False
+        try:
+            hash_atual = _hash_arquivo(self.caminho_excel)
+        except OSError:
+            hash_atual = None
+        if self.df is not None and hash_atual is not None and hash_atual == self._hash:
+            self._assinatura = assinatura
+            return False
+        self.logger.info("Planilha de controle alterada fora da automação. Recarregando...")
+        return self.carregar_planilha()
+
+    def proxima(self):
+        """
+        Entrega a próxima nota pendente, na ordem da planilha.
+
+        Returns:
+            dict: {'linha_excel': int, 'dados': dict} ou None se não houver pendentes
+        """
+        if self.df is None or not self._pendentes:
+            self.logger.warning("Não foi encontrada nenhuma linha sem número com dados válidos. Todas as notas podem já ter sido processadas ou não há notas pendentes.")
+            return None
+        nota = self._pendentes.pop(0)
+        self._entregues.add(nota.linha_excel)
+        self.logger.info(f"Próxima nota: linha {nota.linha_excel} do Excel - Empresa: {nota.empresa} "
+                         f"({len(self._pendentes)} restante(s) na fila)")
+        return {'linha_excel': nota.linha_excel, 'dados': nota.dados}
+
+    def registrar_numero(self, linha_excel, numero_nota):
+        """
+        Aplica em memória o número da nota emitida na linha correspondente.
+
+        Args:
+            linha_excel: Linha do Excel (1-based, já considerando o cabeçalho)
+            numero_nota: Número da nota emitida
+        """
+        if self.df is None:
+            return
+        posicao = linha_excel - 2
+        if 0 <= posicao < len(self.df):
+            primeira_coluna = self.df.columns[0]
+            if self.df[primeira_coluna].dtype != object:
+                self.df[primeira_coluna] = self.df[primeira_coluna].astype(object)
+            self.df.iat[posicao, 0] = numero_nota
+        self._pendentes = [nota for nota in self._pendentes if nota.linha_excel != linha_excel]
+
+    def notas_pendentes(self):
+        """Lista das notas ainda na fila (NotaPendente), na ordem da planilha."""
+        return list(self._pendentes)
+
+    def descartar(self, linhas_excel):
+        """
+        Retira notas da fila nesta execução (não voltam mesmo que a planilha seja relida).
+
+        Args:
+            linhas_excel: Linhas do Excel das notas a retirar
+        """
+        linhas = set(linhas_excel)
+        self._entregues.update(linhas)
+        self._pendentes = [nota for nota in self._pendentes if nota.linha_excel not in linhas]
+
+    def registrar_gravacao(self):
+        """
+        Registra que a própria automação gravou a planilha, para que a nova
+        versão do arquivo não seja tratada como alteração externa e relida.
+        """
+        self._registrar_versao()
+
+    @property
+    def pendentes(self):
+        """Quantidade de notas ainda na fila."""
+        return len(self._pendentes)
+
+    def contagem(self):
+        """Contagem de linhas pendentes, emitidas e inválidas da planilha em memória."""
+        return contar_notas(self.df)
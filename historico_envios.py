@@ -0,0 +1,368 @@
+"""
+Módulo com o histórico local dos e-mails de notas fiscais enviados.
+
+Em vez de percorrer três anos da pasta Itens Enviados a cada `--historico`, os
+envios são indexados de forma incremental num banco SQLite local
+(logs/historico_envios.db, ou o caminho da variável de ambiente HISTORICO_ENVIOS):
+a cada atualização são pedidos ao Exchange apenas os campos usados (assunto,
+data, destinatários e nomes dos anexos), em páginas grandes, e apenas os
+e-mails enviados depois da última data já indexada (marca d'água).
+
+O banco também registra os rascunhos criados pela automação, o que permite
+medir o tempo entre a criação do rascunho e o envio. As consultas (última nota
+enviada a uma empresa, notas nunca enviadas, latência de envio por cliente) e a
+exportação para Excel ficam disponíveis pela linha de comando:
+
+    python historico_envios.py ultima EMPRESA
+    python historico_envios.py nunca-enviadas
+    python historico_envios.py latencia
+    python historico_envios.py exportar [arquivo.xlsx]
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# Configuração de logger
+logger = logging.getLogger('historico_envios')
+
+# Banco padrão do histórico (pode ser alterado pela variável de ambiente HISTORICO_ENVIOS)
+ARQUIVO_HISTORICO = os.path.join("logs", "historico_envios.db")
+
+# Período considerado na primeira indexação
+DIAS_HISTORICO = 3 * 365
+
+# Itens por página nas consultas ao Exchange (máximo aceito pelo EWS: 1000)
+TAMANHO_PAGINA = 1000
+
+# Nome dos anexos renomeados pela automação: <ano>_<numero> - <empresa>.pdf
+PADRAO_ANEXO = re.compile(r'(\d{4})_(\d+) - (.+)\.pdf')
+
+FUSO = ZoneInfo("America/Sao_Paulo")
+
+def _arquivo_historico():
+    """Caminho do banco, lido na utilização para respeitar o .env carregado depois da importação."""
+    return os.getenv("HISTORICO_ENVIOS", ARQUIVO_HISTORICO)
+
+def conectar():
+    """
+    Abre o banco do histórico, criando as tabelas se necessário.
+
+    Returns:
+        sqlite3.Connection: Conexão com o banco
+    """
+    arquivo = _arquivo_historico()
+    pasta = os.path.dirname(arquivo)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conexao = sqlite3.connect(arquivo)
+    conexao.row_factory = sqlite3.Row
+    conexao.executescript("""
+        CREATE TABLE IF NOT EXISTS envios (
+            id TEXT PRIMARY KEY,
+            assunto TEXT,
+            data_envio TEXT NOT NULL,
+            empresa TEXT NOT NULL,
+            ano INTEGER,
+            numero INTEGER NOT NULL,
+            destinatarios TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_envios_empresa ON envios (empresa, data_envio);
+        CREATE INDEX IF NOT EXISTS idx_envios_numero ON envios (numero);
+        CREATE INDEX IF NOT EXISTS idx_envios_data ON envios (data_envio);
+        CREATE TABLE IF NOT EXISTS rascunhos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero INTEGER NOT NULL,
+            empresa TEXT,
+            criado_em TEXT NOT NULL,
+            destinatarios TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_rascunhos_numero ON rascunhos (numero, criado_em);
+        CREATE TABLE IF NOT EXISTS estado (
+            chave TEXT PRIMARY KEY,
+            valor TEXT
+        );
+    """)
+    return conexao
+
+def _utc(data, precisao="seconds"):
+    """Converte uma data com fuso para texto ISO em UTC (ordenável no banco)."""
+    return data.astimezone(timezone.utc).isoformat(timespec=precisao)
+
+def _local(texto):
+    """Converte o texto ISO em UTC do banco para data local sem fuso (compatível com Excel)."""
+    return datetime.fromisoformat(texto).astimezone(FUSO).replace(tzinfo=None)
+
+def atualizar(account, conexao=None):
+    """
+    Indexa os e-mails enviados depois da marca d'água (na primeira vez, os últimos três anos).
+
+    Args:
+        account: Conta do Exchange (exchangelib.Account)
+        conexao: Conexão com o banco (opcional; se None, abre e fecha uma)
+
+    Returns:
+        int: Quantidade de envios de notas novos no histórico
+    """
+    propria = conexao is None
+    conexao = conexao or conectar()
+    try:
+        linha = conexao.execute("SELECT valor FROM estado WHERE chave = 'marca_dagua'").fetchone()
+        if linha:
+            desde = datetime.fromisoformat(linha["valor"])
+        else:
+            desde = datetime.now(timezone.utc) - timedelta(days=DIAS_HISTORICO)
+        logger.info(f"Atualizando histórico de envios a partir de {_local(_utc(desde))}")
+
+        mails = (account.sent
+                 .filter(datetime_sent__gte=desde)
+                 .only('id', 'subject', 'datetime_sent', 'to_recipients', 'attachments')
+                 .order_by('datetime_sent'))
+        mails.page_size = TAMANHO_PAGINA
+
+        novos, lidos, marca = 0, 0, desde
+        for msg in mails:
+            lidos += 1
+            marca = max(marca, msg.datetime_sent)
+            for att in msg.attachments or []:
+                m = PADRAO_ANEXO.match(getattr(att, 'name', '') or '')
+                if m:
+                    destinatarios = [r.email_address for r in msg.to_recipients or []]
+                    cursor = conexao.execute(
+                        "INSERT OR IGNORE INTO envios (id, assunto, data_envio, empresa, ano, numero, destinatarios) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (msg.id, msg.subject, _utc(msg.datetime_sent), m.group(3), int(m.group(1)),
+                         int(m.group(2)), json.dumps(destinatarios)))
+                    novos += cursor.rowcount
+                    break
+        # E-mails com a mesma data da marca são relidos na próxima vez e ignorados pelo id
+        conexao.execute("INSERT OR REPLACE INTO estado (chave, valor) VALUES ('marca_dagua', ?)", (_utc(marca),))
+        conexao.commit()
+        logger.info(f"Histórico de envios atualizado: {lidos} e-mail(s) lido(s), {novos} envio(s) de nota novo(s)")
+        return novos
+    finally:
+        if propria:
+            conexao.close()
+
+def listar_envios(conexao=None, empresas=None, dias=DIAS_HISTORICO):
+    """
+    Lista os envios do histórico, do mais recente para o mais antigo.
+
+    Args:
+        conexao: Conexão com o banco (opcional)
+        empresas: Conjunto de empresas a considerar (None para todas)
+        dias: Considera apenas os envios dos últimos `dias` dias
+
+    Returns:
+        list: Dicionários com as chaves 'assunto', 'data_envio', 'empresa', 'numero' e 'destinatarios'
+    """
+    propria = conexao is None
+    conexao = conexao or conectar()
+    try:
+        limite = _utc(datetime.now(timezone.utc) - timedelta(days=dias))
+        linhas = conexao.execute(
+            "SELECT assunto, data_envio, empresa, numero, destinatarios FROM envios "
+            "WHERE data_envio >= ? ORDER BY data_envio DESC", (limite,)).fetchall()
+    finally:
+        if propria:
+            conexao.close()
+    return [{
+        'assunto': linha['assunto'],
+        'data_envio': _local(linha['data_envio']),
+        'empresa': linha['empresa'],
+        'numero': linha['numero'],
+        'destinatarios': json.loads(linha['destinatarios'] or '[]'),
+    } for linha in linhas if empresas is None or linha['empresa'] in empresas]
+
+def registrar_rascunhos(rascunhos, conexao=None):
+    """
+    Registra no histórico os rascunhos criados, com a data e hora atuais.
+
+    Args:
+        rascunhos: Lista de dicionários com as chaves 'numero', 'empresa' e 'destinatarios'
+        conexao: Conexão com o banco (opcional)
+    """
+    if not rascunhos:
+        return
+    criado_em = _utc(datetime.now(timezone.utc), "milliseconds")
+    propria = conexao is None
+    conexao = conexao or conectar()
+    try:
+        conexao.executemany(
+            "INSERT INTO rascunhos (numero, empresa, criado_em, destinatarios) VALUES (?, ?, ?, ?)",
+            [(int(r['numero']), r.get('empresa'), criado_em, json.dumps(r.get('destinatarios') or []))
+             for r in rascunhos])
+        conexao.commit()
+    finally:
+        if propria:
+            conexao.close()
+
+def ultimo_envio(empresa, conexao=None):
+    """
+    Retorna o envio mais recente para a empresa.
+
+    Args:
+        empresa: Nome reduzido da empresa (como no nome dos anexos)
+        conexao: Conexão com o banco (opcional)
+
+    Returns:
+        dict: {'numero', 'data_envio', 'destinatarios'} ou None se não houver envio
+    """
+    propria = conexao is None
+    conexao = conexao or conectar()
+    try:
+        linha = conexao.execute(
+            "SELECT numero, data_envio, destinatarios FROM envios WHERE empresa = ? "
+            "ORDER BY data_envio DESC LIMIT 1", (empresa,)).fetchone()
+    finally:
+        if propria:
+            conexao.close()
+    if linha is None:
+        return None
+    return {'numero': linha['numero'], 'data_envio': _local(linha['data_envio']),
+            'destinatarios': json.loads(linha['destinatarios'] or '[]')}
+
+def notas_nunca_enviadas(notas, conexao=None):
+    """
+    Filtra as notas que não aparecem em nenhum envio do histórico.
+
+    Args:
+        notas: Iterável de dicionários com as chaves 'Numero' e 'Empresa_reduzido'
+            (formato de `email_automation.ler_informacoes_excel`)
+        conexao: Conexão com o banco (opcional)
+
+    Returns:
+        list: Dicionários {'numero', 'empresa', 'rascunho'} com a data do último rascunho criado (ou None)
+    """
+    propria = conexao is None
+    conexao = conexao or conectar()
+    try:
+        enviadas = {linha[0] for linha in conexao.execute("SELECT DISTINCT numero FROM envios")}
+        rascunhos = dict(conexao.execute("SELECT numero, MAX(criado_em) FROM rascunhos GROUP BY numero").fetchall())
+    finally:
+        if propria:
+            conexao.close()
+    pendentes = []
+    for nota in notas:
+        numero = int(nota['Numero'])
+        if numero not in enviadas:
+            pendentes.append({'numero': numero, 'empresa': nota.get('Empresa_reduzido'),
+                              'rascunho': _local(rascunhos[numero]) if numero in rascunhos else None})
+    return pendentes
+
+def latencia_por_empresa(conexao=None):
+    """
+    Calcula, por empresa, o tempo entre a criação do rascunho e o envio de cada nota.
+
+    Para cada envio é considerado o último rascunho da mesma nota criado antes dele;
+    envios sem rascunho registrado são ignorados.
+
+    Args:
+        conexao: Conexão com o banco (opcional)
+
+    Returns:
+        list: Dicionários {'empresa', 'envios', 'media_ms', 'minimo_ms', 'maximo_ms'}, por empresa
+    """
+    propria = conexao is None
+    conexao = conexao or conectar()
+    try:
+        linhas = conexao.execute("""
+            SELECT empresa, COUNT(*) AS envios, AVG(latencia) AS media_ms,
+                   MIN(latencia) AS minimo_ms, MAX(latencia) AS maximo_ms
+            FROM (
+                SELECT e.empresa,
+                       (julianday(e.data_envio) - julianday((
+                           SELECT MAX(r.criado_em) FROM rascunhos r
+                           WHERE r.numero = e.numero AND julianday(r.criado_em) <= julianday(e.data_envio)
+                       ))) * 86400000 AS latencia
+                FROM envios e
+            )
+            WHERE latencia IS NOT NULL
+            GROUP BY empresa
+            ORDER BY empresa
+        """).fetchall()
+    finally:
+        if propria:
+            conexao.close()
+    return [{'empresa': linha['empresa'], 'envios': linha['envios'], 'media_ms': round(linha['media_ms']),
+             'minimo_ms': round(linha['minimo_ms']), 'maximo_ms': round(linha['maximo_ms'])} for linha in linhas]
+
+def exportar_excel(arquivo, empresas=None, dias=DIAS_HISTORICO, conexao=None):
+    """
+    Exporta os envios do histórico para uma planilha Excel.
+
+    Args:
+        arquivo: Caminho da planilha gerada
+        empresas: Conjunto de empresas a considerar (None para todas)
+        dias: Considera apenas os envios dos últimos `dias` dias
+        conexao: Conexão com o banco (opcional)
+
+    Returns:
+        int: Quantidade de envios exportados (0 não gera o arquivo)
+    """
+    import pandas as pd
+    envios = listar_envios(conexao, empresas, dias)
+    if not envios:
+        return 0
+    for envio in envios:
+        envio['destinatarios'] = '; '.join(envio['destinatarios'])
+    pd.DataFrame(envios, columns=['assunto', 'data_envio', 'empresa', 'numero', 'destinatarios']).to_excel(
+        arquivo, index=False)
+    return len(envios)
+
+def _formatar_data(data):
+    """Data no formato dd/mm/aaaa hh:mm:ss, ou '-' se ausente."""
+    return data.strftime("%d/%m/%Y %H:%M:%S") if data else "-"
+
+def main(argumentos=None):
+    """Consultas ao histórico de envios pela linha de comando."""
+    parser = argparse.ArgumentParser(description='Consultas ao histórico de envios de notas fiscais')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    ultima = comandos.add_parser('ultima', help='Última nota enviada a uma empresa')
+    ultima.add_argument('empresa', help='Nome reduzido da empresa')
+    nunca = comandos.add_parser('nunca-enviadas', help='Notas da planilha de controle nunca enviadas por e-mail')
+    nunca.add_argument('--planilha', default=None, help='Planilha de controle (padrão: a usada pela automação de e-mails)')
+    comandos.add_parser('latencia', help='Tempo entre a criação do rascunho e o envio, por empresa (ms)')
+    exportar = comandos.add_parser('exportar', help='Exporta o histórico para Excel')
+    exportar.add_argument('arquivo', nargs='?', default='historico_envios.xlsx')
+    args = parser.parse_args(argumentos)
+
+    conexao = conectar()
+    try:
+        if args.comando == 'ultima':
+            envio = ultimo_envio(args.empresa, conexao)
+            if envio is None:
+                print(f"Nenhum envio registrado para {args.empresa}")
+                return 1
+            print(f"{args.empresa}: nota {envio['numero']} enviada em {_formatar_data(envio['data_envio'])} "
+                  f"para {', '.join(envio['destinatarios']) or '-'}")
+        elif args.comando == 'nunca-enviadas':
+            # A leitura da planilha é a mesma da automação de e-mails (colunas e conversão do número)
+            from email_automation import ARQUIVO_EXCEL_INFO, ler_informacoes_excel
+            notas = ler_informacoes_excel(args.planilha or ARQUIVO_EXCEL_INFO)
+            pendentes = notas_nunca_enviadas(notas, conexao)
+            for nota in pendentes:
+                print(f"{nota['numero']}\t{nota['empresa'] or '-'}\trascunho: {_formatar_data(nota['rascunho'])}")
+            print(f"{len(pendentes)} nota(s) nunca enviada(s) de {len(notas)}")
+        elif args.comando == 'latencia':
+            latencias = latencia_por_empresa(conexao)
+            if not latencias:
+                print("Nenhum envio com rascunho registrado")
+            for item in latencias:
+                print(f"{item['empresa']}\t{item['envios']} envio(s)\tmédia {item['media_ms']} ms\t"
+                      f"mín {item['minimo_ms']} ms\tmáx {item['maximo_ms']} ms")
+        else:
+            total = exportar_excel(args.arquivo, conexao=conexao)
+            print(f"{total} envio(s) exportado(s) para {args.arquivo}" if total else "Nenhum envio no histórico")
+    finally:
+        conexao.close()
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Módulo com o índice persistente dos arquivos já identificados na pasta de entrada.
+
+Para cada conteúdo (hash SHA-1) guarda o número da nota e o tipo do arquivo
+(pdf ou xml) extraídos numa execução anterior, e para cada nome de arquivo o
+tamanho, a data de modificação e o hash. Nas execuções seguintes, arquivos com
+nome, tamanho e data conhecidos são reconhecidos sem sequer ser lidos; os
+demais são identificados pelo hash do conteúdo, e apenas os arquivos novos são
+abertos e interpretados.
+
+O índice fica em logs/indice_entrada.json (ou no caminho da variável de
+ambiente INDICE_ENTRADA).
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+
+# Configuração de logger
+logger = logging.getLogger('indice_entrada')
+
+# Arquivo padrão do índice (pode ser alterado pela variável de ambiente INDICE_ENTRADA)
+ARQUIVO_INDICE = os.path.join("logs", "indice_entrada.json")
+
+_indice = None
+_trava = threading.Lock()
+
+def _arquivo_indice():
+    """Caminho do índice, lido na primeira utilização para respeitar o .env carregado depois da importação."""
+    return os.getenv("INDICE_ENTRADA", ARQUIVO_INDICE)
+
+def _carregar():
+    """Carrega o índice do disco na primeira utilização."""
+    global _indice
+    if _indice is None:
+        try:
+            with open(_arquivo_indice(), "r", encoding="utf-8") as f:
+                _indice = json.load(f)
+        except FileNotFoundError:
+            _indice = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Índice da pasta de entrada inválido, começando vazio: {e}")
+            _indice = {}
+        _indice.setdefault("arquivos", {})
+        _indice.setdefault("conteudos", {})
+    return _indice
+
+def hash_arquivo(caminho, bloco=1024 * 1024):
+    """Calcula o hash SHA-1 do conteúdo do arquivo."""
+    sha1 = hashlib.sha1()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            sha1.update(parte)
+    return sha1.hexdigest()
+
+def consultar(caminho):
+    """
+    Procura o arquivo no índice.
+
+    Args:
+        caminho: Caminho do arquivo
+
+    Returns:
+        tuple: (hash do conteúdo, {'numero', 'tipo'} ou None se o conteúdo é desconhecido)
+    """
+    estado = os.stat(caminho)
+    with _trava:
+        indice = _carregar()
+        arquivo = indice["arquivos"].get(os.path.basename(caminho))
+        if arquivo and arquivo.get("tamanho") == estado.st_size and arquivo.get("mtime_ns") == estado.st_mtime_ns:
+            conteudo = arquivo["hash"]
+        else:
+            conteudo = None
+    if conteudo is None:
+        conteudo = hash_arquivo(caminho)
+    with _trava:
+        return conteudo, _carregar()["conteudos"].get(conteudo)
+
+def registrar(caminho, conteudo, numero, tipo):
+    """
+    Registra no índice (em memória) o número e o tipo identificados para o arquivo.
+
+    Args:
+        caminho: Caminho atual do arquivo (já renomeado)
+        conteudo: Hash do conteúdo, retornado por `consultar`
+        numero: Número da nota
+        tipo: 'pdf' ou 'xml'
+    """
+    estado = os.stat(caminho)
+    with _trava:
+        indice = _carregar()
+        indice["conteudos"][conteudo] = {"numero": str(numero), "tipo": tipo}
+        indice["arquivos"][os.path.basename(caminho)] = {
+            "tamanho": estado.st_size, "mtime_ns": estado.st_mtime_ns, "hash": conteudo}
+
+def salvar():
+    """Grava o índice em disco de forma atômica (arquivo temporário + replace)."""
+    arquivo = _arquivo_indice()
+    with _trava:
+        if _indice is None:
+            return
+        try:
+            pasta = os.path.dirname(arquivo)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            temporario = arquivo + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(_indice, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, arquivo)
+        except OSError as e:
+            logger.warning(f"Não foi possível salvar o índice da pasta de entrada: {e}")
@@ -0,0 +1,180 @@
+"""
+Módulo para localizar campos do formulário com uma única chamada ao navegador.
+
+Em vez de um find_elements e um is_displayed (cada um uma requisição ao
+WebDriver) por seletor candidato, a lista inteira de candidatos de um ou mais
+campos é enviada num único execute_script. A visibilidade e o estado habilitado
+são avaliados no próprio navegador, e os fallbacks por posição e por input
+oculto também são resolvidos na mesma chamada.
+
+A ordem dos candidatos vem do cache de seletores, e os acertos e falhas são
+registrados nele.
+"""
+import logging
+import cache_seletores
+
+# Configuração de logger
+logger = logging.getLogger('localizador_js')
+
+# Recebe {campo: [seletores]}, o requisito de cada elemento e os fallbacks opcionais.
+# Seletores que começam com '/' ou '(' são avaliados como XPath; os demais como CSS.
+# Retorna {campo: {elemento, indice, origem}} ou {campo: null}.
+_SCRIPT_LOCALIZAR_CAMPOS = """
+var grupos = arguments[0], requisito = arguments[1], opcoes = arguments[2] || {};
+
+function visivel(el) {
+    if (el.type === 'hidden') return false;
+    var estilo = window.getComputedStyle(el);
+    return estilo.display !== 'none' && estilo.visibility !== 'hidden' && el.getClientRects().length > 0;
+}
+function serve(el) {
+    if (requisito === 'existente') return true;
+    if (!visivel(el)) return false;
+    return requisito !== 'habilitado' || !el.disabled;
+}
+function buscar(seletor) {
+    var c = seletor.charAt(0);
+    if (c === '/' || c === '(') {
+        var r = document.evaluate(seletor, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        var lista = [];
+        for (var i = 0; i < r.snapshotLength; i++) lista.push(r.snapshotItem(i));
+        return lista;
+    }
+    return document.querySelectorAll(seletor);
+}
+function texto(el, atributo) {
+    return (el.getAttribute(atributo) || '').toLowerCase();
+}
+
+var resultado = {}, usados = [];
+Object.keys(grupos).forEach(function(campo) {
+    resultado[campo] = null;
+    var candidatos = grupos[campo];
+    for (var i = 0; i < candidatos.length && !resultado[campo]; i++) {
+        var elementos;
+        try { elementos = buscar(candidatos[i]); } catch (e) { continue; }
+        for (var j = 0; j < elementos.length; j++) {
+            if (serve(elementos[j])) {
+                resultado[campo] = {elemento: elementos[j], indice: i, origem: 'seletor'};
+                usados.push(elementos[j]);
+                break;
+            }
+        }
+    }
+});
+
+// Fallback posicional: inputs visíveis e habilitados, na ordem da página
+var posicionais = opcoes.posicionais;
+if (posicionais && posicionais.campos.some(function(c) { return !resultado[c]; })) {
+    var inputs = Array.prototype.filter.call(
+        document.querySelectorAll('input[type="number"], input[type="text"], input:not([type])'),
+        function(el) {
+            if (!visivel(el) || el.disabled || usados.indexOf(el) >= 0) return false;
+            var descricao = texto(el, 'placeholder') + ' ' + texto(el, 'name');
+            return !(posicionais.excluir || []).some(function(t) { return descricao.indexOf(t) >= 0; });
+        });
+    if (inputs.length >= posicionais.campos.length) {
+        posicionais.campos.forEach(function(campo, i) {
+            if (!resultado[campo]) {
+                resultado[campo] = {elemento: inputs[i], indice: -1, origem: 'posicional'};
+                usados.push(inputs[i]);
+            }
+        });
+    }
+}
+
+// Fallback de inputs ocultos cujo name ou id contém um dos termos do campo
+var ocultos = opcoes.ocultos;
+if (ocultos) {
+    Array.prototype.forEach.call(document.querySelectorAll('input[type="hidden"]'), function(el) {
+        var nome = texto(el, 'name'), id = texto(el, 'id');
+        Object.keys(ocultos).forEach(function(campo) {
+            if (resultado[campo]) return;
+            if (ocultos[campo].some(function(t) { return nome.indexOf(t) >= 0 || id.indexOf(t) >= 0; })) {
+                resultado[campo] = {elemento: el, indice: -1, origem: 'oculto'};
+            }
+        });
+    });
+}
+return resultado;
+"""
+
+def localizar_campos(driver, grupos, requisito="visivel", prefixo_cache="", posicionais=None,
+                     ocultos=None, logger_busca=None):
+    """
+    Localiza vários campos com uma única chamada execute_script.
+
+    Args:
+        driver: WebDriver do Selenium
+        grupos: Dicionário {nome_campo: [seletores CSS/XPath]} na ordem de preferência original
+        requisito: "visivel", "habilitado" (visível e não desabilitado) ou "existente"
+        prefixo_cache: Prefixo da chave no cache de seletores (chave = prefixo + nome_campo).
+            Use None para não consultar nem atualizar o cache.
+        posicionais: Fallback posicional opcional {"campos": [nomes na ordem da página],
+            "excluir": [termos de placeholder/name a ignorar]}
+        ocultos: Fallback opcional {nome_campo: [termos]} para inputs hidden
+        logger_busca: Logger para registro de logs (opcional)
+
+    Returns:
+        dict: {nome_campo: (elemento, origem)}, onde origem é o seletor que funcionou,
+            "posicional" ou "oculto". Campos não encontrados ficam com (None, None).
+    """
+    log = logger_busca or logger
+
+    def chave(campo):
+        return None if prefixo_cache is None else f"{prefixo_cache}{campo}"
+
+    ordenados = {campo: cache_seletores.ordenar(chave(campo), seletores)
+                 for campo, seletores in grupos.items()}
+    opcoes = {}
+    if posicionais:
+        opcoes["posicionais"] = {"campos": list(posicionais["campos"]),
+                                 "excluir": list(posicionais.get("excluir", []))}
+    if ocultos:
+        opcoes["ocultos"] = {campo: list(termos) for campo, termos in ocultos.items()}
+
+    try:
+        brutos = driver.execute_script(_SCRIPT_LOCALIZAR_CAMPOS, ordenados, requisito, opcoes) or {}
+    except Exception as e:
+        log.warning(f"Erro ao localizar campos via JavaScript: {e}")
+        brutos = {}
+
+    resultado = {}
+    for campo in grupos:
+        candidatos = ordenados.get(campo, [])
+        achado = brutos.get(campo)
+        if not achado:
+            # Campo ainda não renderizado ou script com erro: nada a concluir sobre os seletores
+            resultado[campo] = (None, None)
+            continue
+
+        indice = achado.get("indice", -1)
+        if indice is not None and indice >= 0:
+            for seletor in candidatos[:indice]:
+                cache_seletores.registrar_falha(chave(campo), seletor)
+            origem = candidatos[indice]
+            cache_seletores.registrar_acerto(chave(campo), origem)
+        else:
+            origem = achado.get("origem")
+        resultado[campo] = (achado.get("elemento"), origem)
+    return resultado
+
+def localizar_elemento(driver, chave, seletores, requisito="visivel", logger_busca=None):
+    """
+    Localiza um único elemento com uma chamada execute_script, usando o cache de seletores.
+
+    Args:
+        driver: WebDriver do Selenium
+        chave: Nome lógico do elemento no cache (ex.: "campo_valor_servico"), ou None
+        seletores: Lista de seletores CSS e/ou XPath na ordem original
+        requisito: "visivel", "habilitado" ou "existente"
+        logger_busca: Logger para registro de logs (opcional)
+
+    Returns:
+        tuple: (elemento, seletor) encontrados, ou (None, None)
+    """
+    if chave is None:
+        return localizar_campos(driver, {"elemento": seletores}, requisito, prefixo_cache=None,
+                                logger_busca=logger_busca)["elemento"]
+    return localizar_campos(driver, {chave: seletores}, requisito,
+                            logger_busca=logger_busca)[chave]
@@ -20,6 +20,17 @@ import platform
 import pandas as pd
 from pathlib import Path
 from preencher_dados_servico import preencher_dados_servico
+from sessao_nfse import SessaoNFSe
+import captura
+from localizador_js import localizar_campos
+from preenchimento import preencher_campo, preencher_campos
+import cache_seletores
+import numeracao_notas
+import diario_excel
+import planilha_controle
+import tributos_federais
+from fila_notas import NotaQueue
+from esperas import aguardar, aguardar_pagina_estavel, elementos_com_texto, primeiro_visivel
 import pyperclip
 from selenium.webdriver.common.keys import Keys
 
@@ -41,20 +52,10 @@ console.setFormatter(formatter)
 logging.getLogger('').addHandler(console)
 logger = logging.getLogger('NFSe_Automacao')
 
-# Pasta para salvar os screenshots
-SCREENSHOTS_FOLDER = "logs/imagens"
-# Garante que a pasta existe
-os.makedirs(SCREENSHOTS_FOLDER, exist_ok=True)
-
-# Função para salvar screenshots na pasta correta
+# Função para salvar screenshots na pasta de capturas da nota atual
 def salvar_screenshot(driver, nome_arquivo):
-    """Salva um screenshot na pasta de imagens com o nome especificado"""
-    caminho_completo = os.path.join(SCREENSHOTS_FOLDER, nome_arquivo)
-    try:
-        driver.save_screenshot(caminho_completo)
-        logger.info(f"Screenshot salvo em {caminho_completo}")
-    except Exception as e:
-        logger.error(f"Erro ao salvar screenshot {nome_arquivo}: {e}")
+    """Agenda um screenshot no pipeline de capturas (gravado em segundo plano, conforme CAPTURA_NIVEL)"""
+    return captura.capturar_screenshot(driver, nome_arquivo)
 
 # Instala automaticamente o ChromeDriver compatível
 logger.info("Verificando e instalando ChromeDriver compatível...")
@@ -105,28 +106,13 @@ logger.info(f"Senha configurada: {'*' * 8}")
 SALVAR_HTML = True
 
 def salvar_html(driver, nome_arquivo):
-    """Função auxiliar para salvar o HTML da página atual"""
+    """Função auxiliar para agendar o HTML da página atual no pipeline de capturas"""
     if SALVAR_HTML:
-        try:
-            with open(f"logs/html/{nome_arquivo}.html", "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
-            logger.info(f"HTML da página salvo em logs/html/{nome_arquivo}.html")
-        except Exception as e:
-            logger.error(f"Erro ao salvar HTML: {e}")
+        captura.capturar_html(driver, nome_arquivo)
 
 def simular_digitacao_humana(elemento, texto):
-    """Simula digitação humana inserindo caracteres um a um com tempos variáveis entre eles"""
-    # Limpa o campo primeiro
-    elemento.clear()
-    
-    # Velocidades de digitação variáveis
-    for caractere in texto:
-        elemento.send_keys(caractere)
-        # Pequena pausa aleatória para simular digitação real
-        time.sleep(random.uniform(0.05, 0.15))
-    
-    # Pausa final após completar a digitação
-    time.sleep(random.uniform(0.2, 0.5))
+    """Preenche o campo conforme MODO_PREENCHIMENTO (digitação caractere a caractere ou modo rápido)"""
+    preencher_campo(elemento, texto)
 
 def simular_colar_texto(elemento, texto):
     """Simula colar texto usando Ctrl+V após copiar para o clipboard"""
@@ -206,6 +192,10 @@ def verificar_mensagens_erro(driver):
         except:
             continue
     
+    # Mensagem de erro na tela: grava o contexto das últimas etapas (gravador de voo)
+    if mensagens:
+        captura.capturar_screenshot(driver, "erro_mensagem_portal.png")
+    
     return mensagens
 
 def verificar_login_sucesso(driver):
@@ -270,32 +260,14 @@ def verificar_login_sucesso(driver):
 
 def esperar_pagina_carregar(driver, timeout=30):
     """
-    Aguarda a página carregar completamente usando diferentes técnicas
+    Aguarda a página carregar completamente: document.readyState, jQuery.active == 0
+    e DOM estável. Retorna assim que as condições forem satisfeitas.
     """
     logger.info("Aguardando carregamento completo da página...")
     start_time = time.time()
     
-    # Método 1: Aguardar document.readyState
-    try:
-        wait_curto = WebDriverWait(driver, min(timeout, 10))
-        wait_curto.until(lambda d: d.execute_script('return document.readyState') == 'complete')
-    except:
-        logger.warning("Tempo esgotado aguardando document.readyState == 'complete'")
-    
-    # Método 2: Aguardar jQuery (se existir)
-    try:
-        jquery_present = driver.execute_script("return typeof jQuery !== 'undefined'")
-        if jquery_present:
-            wait_curto = WebDriverWait(driver, min(timeout, 5))
-            wait_curto.until(lambda d: d.execute_script('return jQuery.active') == 0)
-    except:
-        logger.warning("Tempo esgotado aguardando jQuery.active == 0 ou jQuery não encontrado")
-    
-    # Método 3: Aguardar AJAX (se aplicável)
-    # Pausa genérica para permitir processamento AJAX
-    remaining_time = timeout - (time.time() - start_time)
-    if remaining_time > 0:
-        time.sleep(min(remaining_time, 2))
+    if not aguardar_pagina_estavel(driver, timeout=timeout):
+        logger.warning("Tempo esgotado aguardando a página estabilizar")
     
     elapsed = time.time() - start_time
     logger.info(f"Página carregada em {elapsed:.2f} segundos")
@@ -467,7 +439,7 @@ def fechar_aviso(driver):
             # Tenta clicar no botão
             fechar_btn.click()
             logger.info("Botão 'Fechar' clicado com sucesso")
-            time.sleep(2)  # Pequena pausa para o aviso fechar
+            aguardar_pagina_estavel(driver, timeout=10)  # Aguarda o aviso fechar
             salvar_screenshot(driver, "apos_fechar_aviso.png")
             return True
         except Exception as e:
@@ -480,7 +452,7 @@ def fechar_aviso(driver):
             logger.info("Botão 'Fechar' encontrado por texto")
             elementos_texto[0].click()
             logger.info("Botão 'Fechar' clicado com sucesso")
-            time.sleep(2)
+            aguardar_pagina_estavel(driver, timeout=10)
             return True
     except Exception as e:
         logger.warning(f"Erro ao buscar botão 'Fechar' por texto: {e}")
@@ -489,7 +461,7 @@ def fechar_aviso(driver):
     try:
         driver.execute_script("document.querySelector('button[name=\"fechar\"]').click();")
         logger.info("Botão 'Fechar' clicado via JavaScript")
-        time.sleep(2)
+        aguardar_pagina_estavel(driver, timeout=10)
         return True
     except Exception as e:
         logger.warning(f"Clique via JavaScript no botão 'Fechar' falhou: {e}")
@@ -560,7 +532,6 @@ def realizar_login(driver, cpf_cnpj, senha):
         
         # Aguarda processamento do login
         esperar_pagina_carregar(driver, timeout=20)
-        time.sleep(5)  # Aguarda um pouco mais
         
         # Captura estado após processamento
         salvar_screenshot(driver, "apos_login.png")
@@ -620,7 +591,6 @@ def clicar_emitir_nota_fiscal(driver):
                     elementos[0].click()
                     logger.info("Clique direto realizado com sucesso")
                     
-                    time.sleep(2)  # Pequena pausa após o clique
                     esperar_pagina_carregar(driver, timeout=20)
                     
                     salvar_screenshot(driver, "apos_emitir_nota_fiscal.png")
@@ -633,7 +603,6 @@ def clicar_emitir_nota_fiscal(driver):
                         driver.execute_script("arguments[0].click();", elementos[0])
                         logger.info("Clique via JavaScript realizado com sucesso")
                         
-                        time.sleep(2)
                         esperar_pagina_carregar(driver, timeout=20)
                         
                         salvar_screenshot(driver, "apos_emitir_nota_fiscal_js.png")
@@ -649,7 +618,6 @@ def clicar_emitir_nota_fiscal(driver):
                                 driver.execute_script(onclick)
                                 logger.info("Execução de função onclick bem-sucedida")
                                 
-                                time.sleep(2)
                                 esperar_pagina_carregar(driver, timeout=20)
                                 
                                 salvar_screenshot(driver, "apos_emitir_nota_fiscal_onclick.png")
@@ -684,7 +652,6 @@ def clicar_emitir_nota_fiscal(driver):
                 elementos_texto[0].click()
                 logger.info("Botão 'Emitir Nota Fiscal' clicado com sucesso")
                 
-                time.sleep(2)
                 esperar_pagina_carregar(driver, timeout=20)
                 
                 salvar_screenshot(driver, "apos_emitir_nota_fiscal_xpath.png")
@@ -743,7 +710,6 @@ def clicar_proximo(driver):
                     elementos[0].click()
                     logger.info("Clique direto realizado com sucesso")
                     
-                    time.sleep(2)  # Pequena pausa após o clique
                     esperar_pagina_carregar(driver, timeout=20)
                     
                     salvar_screenshot(driver, "apos_proximo.png")
@@ -756,7 +722,6 @@ def clicar_proximo(driver):
                         driver.execute_script("arguments[0].click();", elementos[0])
                         logger.info("Clique via JavaScript realizado com sucesso")
                         
-                        time.sleep(2)
                         esperar_pagina_carregar(driver, timeout=20)
                         
                         salvar_screenshot(driver, "apos_proximo_js.png")
@@ -772,7 +737,6 @@ def clicar_proximo(driver):
                                 driver.execute_script(onclick)
                                 logger.info("Execução de função onclick bem-sucedida")
                                 
-                                time.sleep(2)
                                 esperar_pagina_carregar(driver, timeout=20)
                                 
                                 salvar_screenshot(driver, "apos_proximo_onclick.png")
@@ -808,7 +772,6 @@ def clicar_proximo(driver):
                 elementos_texto[0].click()
                 logger.info("Botão 'Próximo' clicado com sucesso")
                 
-                time.sleep(2)
                 esperar_pagina_carregar(driver, timeout=20)
                 
                 salvar_screenshot(driver, "apos_proximo_xpath.png")
@@ -992,7 +955,7 @@ def selecionar_tipo_tomador(driver, tipo="Pessoa Jurídica"):
                 driver.execute_script(f"arguments[0].value = '{valor}'; arguments[0].dispatchEvent(new Event('change'));", select_element)
                 logger.info(f"Selecionado '{tipo}' via JavaScript")
         
-        time.sleep(1)  # Pequena pausa para processar a seleção
+        aguardar_pagina_estavel(driver, timeout=5)  # Aguarda o portal processar a seleção
         
         # Verifica se a seleção foi aplicada
         valor_atual = select_element.get_attribute("value")
@@ -1032,8 +995,8 @@ def carregar_dados_excel(caminho_excel):
             logger.error(f"Arquivo Excel não encontrado: {caminho_excel}")
             return None
         
-        # Altere header para 0, pois agora o cabeçalho está na primeira linha
-        df = pd.read_excel(caminho_excel, sheet_name=0, header=0)
+        # Cabeçalho na primeira linha; reaproveita o cache colunar enquanto a planilha não mudar
+        df = planilha_controle.carregar_planilha(caminho_excel, logger_planilha=logger)
         
         logger.info(f"Arquivo Excel carregado com sucesso. {len(df)} linhas encontradas.")
         logger.info(f"Colunas disponíveis: {list(df.columns)}")
@@ -1044,68 +1007,6 @@ def carregar_dados_excel(caminho_excel):
         logger.error(f"Erro ao carregar arquivo Excel: {e}")
         return None
 
-def encontrar_proxima_nota(df):
-    """
-    Encontra a próxima nota a ser processada (primeira linha sem número na primeira coluna mas com dados válidos).
-    
-    Args:
-        df (pd.DataFrame): DataFrame com os dados do Excel
-        
-    Returns:
-        dict: Dados da próxima nota a ser processada ou None se não encontrar
-    """
-    try:
-        if df is None or df.empty:
-            logger.error("DataFrame está vazio ou é None")
-            return None
-        
-        logger.info("Procurando a próxima nota a ser processada...")
-          # Assumindo que a primeira coluna contém os números das notas
-        primeira_coluna = df.columns[0]
-        logger.info(f"Analisando coluna: {primeira_coluna}")
-        
-        # Encontra a primeira linha sem número mas que tenha dados válidos
-        for idx in range(len(df)):
-            linha = df.iloc[idx]
-            numero_nota = linha[primeira_coluna]
-            empresa = linha['Empresa - Razão Social']
-            cnpj = linha['CNPJ']
-              # Verifica se o número da nota está vazio
-            numero_vazio = pd.isna(numero_nota) or numero_nota == "" or numero_nota is None
-            
-            # Verifica se a linha tem dados válidos (empresa ou CNPJ)
-            tem_dados = not (pd.isna(empresa) and pd.isna(cnpj))
-            
-            if numero_vazio and tem_dados:
-                logger.info(f"Encontrada linha sem número na posição {idx + 1} (linha {idx + 2} do Excel)")
-                
-                # Retorna os dados desta linha como dicionário
-                dados_nota = linha.to_dict()
-                
-                # Log dos dados encontrados (mascarando informações sensíveis)                logger.info("Dados da próxima nota a ser processada:")
-                logger.info(f"  Empresa: {linha['Empresa - Razão Social']}")
-                
-                for coluna, valor in dados_nota.items():
-                    if pd.notna(valor) and valor != "":
-                        # Mascarar CNPJ se necessário
-                        if 'CNPJ' in coluna and len(str(valor)) > 6:
-                            valor_log = f"{str(valor)[:4]}****{str(valor)[-2:]}"
-                        else:
-                            valor_log = valor
-                        logger.info(f"  {coluna}: {valor_log}")
-                
-                return {
-                    'linha_excel': idx + 2,  # +2 porque pandas é 0-based, Excel começa na linha 1, e temos 1 linha de header
-                    'dados': dados_nota
-                }
-        
-        logger.warning("Não foi encontrada nenhuma linha sem número com dados válidos. Todas as notas podem já ter sido processadas ou não há notas pendentes.")
-        return None
-        
-    except Exception as e:
-        logger.error(f"Erro ao procurar próxima nota: {e}")
-        return None
-
 def mapear_dados_nota(dados_nota):
     """
     Mapeia os dados do Excel para as variáveis necessárias para emissão da nota fiscal.
@@ -1184,7 +1085,10 @@ def mapear_dados_nota(dados_nota):
 
 def atualizar_numero_nota_excel(caminho_excel, linha_excel, numero_nota):
     """
-    Atualiza o número da nota fiscal no arquivo Excel após a emissão.
+    Registra o número da nota fiscal emitida no diário de gravação.
+    
+    A planilha é atualizada depois, em lote, por `gravar_diario_excel`; o diário
+    garante que o número não se perde se a execução for interrompida antes disso.
     
     Args:
         caminho_excel (str): Caminho para o arquivo Excel
@@ -1192,12 +1096,51 @@ def atualizar_numero_nota_excel(caminho_excel, linha_excel, numero_nota):
         numero_nota (str): Número da nota fiscal emitida
         
     Returns:
-        bool: True se a atualização foi bem-sucedida, False caso contrário
+        bool: True se o número foi registrado, False caso contrário
     """
     try:
-        logger.info(f"Atualizando Excel - Linha {linha_excel} com número da nota: {numero_nota}")
+        logger.info(f"Registrando número da nota {numero_nota} para a linha {linha_excel} do Excel")
+        diario_excel.registrar_numero(linha_excel, numero_nota)
+        return True
+        
+    except Exception as e:
+        logger.error(f"Erro ao registrar número da nota no diário: {e}")
         
-        # Faz backup do arquivo original antes de qualquer modificação
+        # Sugere ao usuário atualizar manualmente
+        logger.error(f"\nPor favor, atualize manualmente o arquivo Excel:")
+        logger.error(f"1. Abra o arquivo: {caminho_excel}")
+        logger.error(f"2. Vá até a linha {linha_excel}")
+        logger.error(f"3. Na primeira coluna, insira o número da nota: {numero_nota}")
+        
+        return False
+
+def _mesmo_numero(valor_celula, numero_nota):
+    """Compara o valor de uma célula com o número da nota (123, 123.0 e "123" são iguais)."""
+    try:
+        return int(float(valor_celula)) == int(float(numero_nota))
+    except (ValueError, TypeError):
+        return str(valor_celula).strip() == str(numero_nota).strip()
+
+def gravar_numeros_excel(caminho_excel, numeros):
+    """
+    Grava vários números de nota na primeira coluna do Excel com uma única abertura e gravação.
+    
+    Células que já têm outro número são mantidas, para que a reaplicação do diário
+    nunca sobrescreva um número lançado depois; essas linhas são devolvidas como
+    conflitos, para que o número emitido não se perca.
+    
+    Args:
+        caminho_excel (str): Caminho para o arquivo Excel
+        numeros (dict): {linha_excel: numero_nota}, linhas 1-based já considerando o cabeçalho
+        
+    Returns:
+        tuple: (True se a atualização foi bem-sucedida, {linha_excel: valor já existente} das linhas em conflito)
+    """
+    conflitos = {}
+    try:
+        logger.info(f"Atualizando Excel com {len(numeros)} número(s) de nota")
+        
+        # Faz um único backup do arquivo original antes da gravação do lote
         backup_path = caminho_excel.replace('.xlsx', f'_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
         import shutil
         shutil.copy2(caminho_excel, backup_path)
@@ -1212,46 +1155,50 @@ def atualizar_numero_nota_excel(caminho_excel, linha_excel, numero_nota):
             book = load_workbook(caminho_excel)
             sheet = book.active
             
-            # Atualiza o valor na célula correta (linha Excel é 1-based)
-            # A primeira coluna é A(1)
-            cell = sheet.cell(row=linha_excel, column=1)
-            valor_anterior = cell.value
-            cell.value = numero_nota
-            
-            logger.info(f"Atualizando célula A{linha_excel}: Valor anterior: {valor_anterior} -> Novo valor: {numero_nota}")
+            for linha_excel, numero_nota in numeros.items():
+                # A primeira coluna é A(1)
+                cell = sheet.cell(row=linha_excel, column=1)
+                valor_anterior = cell.value
+                if valor_anterior not in (None, "") and not _mesmo_numero(valor_anterior, numero_nota):
+                    logger.warning(f"Célula A{linha_excel} já contém {valor_anterior}; número {numero_nota} não gravado")
+                    conflitos[linha_excel] = valor_anterior
+                    continue
+                cell.value = numero_nota
+                logger.info(f"Atualizando célula A{linha_excel}: Valor anterior: {valor_anterior} -> Novo valor: {numero_nota}")
             
             # Salva o arquivo atualizado
             book.save(caminho_excel)
-            logger.info(f"Arquivo Excel atualizado com sucesso na linha {linha_excel}, coluna A")
+            logger.info(f"Arquivo Excel atualizado com sucesso ({len(numeros) - len(conflitos)} linha(s))")
             
-            return True
+            return True, conflitos
             
         except ImportError:
             # Se openpyxl não estiver instalado, usa pandas como fallback
-            logger.warning("Biblioteca openpyxl não encontrada. Usando pandas como alternativa.")            # Carrega o arquivo Excel com pandas (pode perder alguma formatação)
+            logger.warning("Biblioteca openpyxl não encontrada. Usando pandas como alternativa.")
+            # Carrega o arquivo Excel com pandas (pode perder alguma formatação)
             df = pd.read_excel(caminho_excel, sheet_name=0, header=0)
+            df[df.columns[0]] = df[df.columns[0]].astype(object)
             
-            # Calcula o índice do DataFrame (0-based)
-            # Converte linha Excel (1-based) para índice DataFrame (0-based)
-            indice_df = linha_excel - 2
-            
-            if indice_df < 0 or indice_df >= len(df):
-                logger.error(f"Linha {linha_excel} está fora do intervalo válido do DataFrame (índice {indice_df})")
-                return False
-            
-            # Registra o valor anterior antes de atualizar
-            primeira_coluna = df.columns[0]
-            valor_anterior = df.iloc[indice_df, 0]
-            
-            # Atualiza a primeira coluna
-            df.iloc[indice_df, 0] = numero_nota
-            logger.info(f"Atualizando valor na linha {linha_excel}: {valor_anterior} -> {numero_nota}")
+            for linha_excel, numero_nota in numeros.items():
+                # Converte linha Excel (1-based) para índice DataFrame (0-based)
+                indice_df = linha_excel - 2
+                if indice_df < 0 or indice_df >= len(df):
+                    logger.error(f"Linha {linha_excel} está fora do intervalo válido do DataFrame (índice {indice_df})")
+                    return False, {}
+                
+                valor_anterior = df.iloc[indice_df, 0]
+                if pd.notna(valor_anterior) and valor_anterior != "" and not _mesmo_numero(valor_anterior, numero_nota):
+                    logger.warning(f"Linha {linha_excel} já contém {valor_anterior}; número {numero_nota} não gravado")
+                    conflitos[linha_excel] = valor_anterior
+                    continue
+                df.iloc[indice_df, 0] = numero_nota
+                logger.info(f"Atualizando valor na linha {linha_excel}: {valor_anterior} -> {numero_nota}")
             
             # Salva o arquivo atualizado, preservando o índice original
             df.to_excel(caminho_excel, sheet_name='Sheet1', index=False, header=True)
-            logger.info(f"Arquivo Excel atualizado com pandas na linha {linha_excel}")
+            logger.info(f"Arquivo Excel atualizado com pandas ({len(numeros) - len(conflitos)} linha(s))")
             
-            return True
+            return True, conflitos
         
     except Exception as e:
         logger.error(f"Erro ao atualizar arquivo Excel: {e}")
@@ -1261,10 +1208,62 @@ def atualizar_numero_nota_excel(caminho_excel, linha_excel, numero_nota):
         # Sugere ao usuário atualizar manualmente
         logger.error(f"\nPor favor, atualize manualmente o arquivo Excel:")
         logger.error(f"1. Abra o arquivo: {caminho_excel}")
-        logger.error(f"2. Vá até a linha {linha_excel}")
-        logger.error(f"3. Na primeira coluna, insira o número da nota: {numero_nota}")
+        for linha_excel, numero_nota in numeros.items():
+            logger.error(f"   Linha {linha_excel}, primeira coluna: {numero_nota}")
         
-        return False
+        return False, {}
+
+def aplicar_diario_na_fila(fila):
+    """
+    Aplica na fila em memória os números do diário ainda não gravados na planilha,
+    para que essas linhas não sejam oferecidas novamente.
+    
+    Args:
+        fila (NotaQueue): Fila de notas
+    """
+    for linha_excel, numero_nota in diario_excel.entradas_pendentes().items():
+        fila.registrar_numero(linha_excel, numero_nota)
+
+def conferir_tributos_pendentes(fila, conferidas):
+    """
+    Confere as retenções federais das notas pendentes ainda não conferidas, antes de
+    abrir o portal. As notas com divergência são listadas e, se o operador não quiser
+    emiti-las assim, retiradas da fila desta execução.
+    
+    Args:
+        fila (NotaQueue): Fila de notas
+        conferidas (set): Linhas já conferidas nesta execução (atualizado)
+    """
+    novas = [nota for nota in fila.notas_pendentes() if nota.linha_excel not in conferidas]
+    if not novas:
+        return
+    conferidas.update(nota.linha_excel for nota in novas)
+    divergentes = tributos_federais.conferir_lote(novas, fila.df.columns, logger_tributos=logger)
+    if not divergentes:
+        return
+    for linha_excel, divergencias in divergentes.items():
+        logger.warning(f"Linha {linha_excel}: retenções divergentes - {'; '.join(divergencias)}")
+    resposta = input(f"{len(divergentes)} nota(s) com retenções divergentes do cálculo. Emitir mesmo assim? (s/n): ")
+    if resposta.lower() != 's':
+        fila.descartar(divergentes)
+        logger.warning(f"Notas com retenções divergentes retiradas da fila: linhas {', '.join(map(str, divergentes))}")
+
+def gravar_diario_excel(fila=None):
+    """
+    Grava na planilha os números pendentes do diário (uma abertura e um backup por lote).
+    
+    Args:
+        fila (NotaQueue): Fila de notas (opcional), informada da nova versão do arquivo
+        
+    Returns:
+        bool: True se não havia pendências ou se a gravação foi bem-sucedida
+    """
+    if fila is not None and fila.atualizar_se_modificado():
+        aplicar_diario_na_fila(fila)
+    sucesso = diario_excel.aplicar_pendentes(EXCEL_PATH, gravar_numeros_excel)
+    if sucesso and fila is not None:
+        fila.registrar_gravacao()
+    return sucesso
 
 def buscar_empresa_por_cnpj(driver, cnpj, nome_empresa):
     """
@@ -1317,8 +1316,9 @@ def buscar_empresa_por_cnpj(driver, cnpj, nome_empresa):
         logger.info(f"CNPJ inserido no campo de busca")
         salvar_screenshot(driver, "apos_inserir_cnpj.png")
         
-        # Aguarda os resultados
-        time.sleep(2)
+        # Aguarda os resultados aparecerem (retorna assim que houver linhas na tabela)
+        aguardar(driver, elementos_com_texto('td[name="nomeRazao"], table.tabela-resultado tr'),
+                 timeout=20, descricao="resultados da busca de CNPJ")
         
         # Busca os resultados da pesquisa
         logger.info("Procurando resultados da busca de CNPJ...")
@@ -1398,8 +1398,8 @@ def preencher_dados_tomador(driver, dados_nota):
         logger.info("Iniciando preenchimento dos dados do tomador...")
         wait = WebDriverWait(driver, 10)
         
-        # Aguarda um pouco para a página carregar após selecionar tipo do tomador
-        time.sleep(2)
+        # Aguarda a página estabilizar após selecionar tipo do tomador
+        aguardar_pagina_estavel(driver, timeout=10)
         
         # Verifica se o checkbox "Endereço Alternativo" está selecionado
         logger.info("Verificando se o checkbox 'Endereço Alternativo' está marcado...")
@@ -1554,7 +1554,7 @@ def preencher_dados_tomador(driver, dados_nota):
                             try:
                                 botao_proximo.click()
                                 logger.info("Botão 'Próximo' clicado com sucesso")
-                                time.sleep(2)
+                                aguardar_pagina_estavel(driver, timeout=20)
                                 salvar_screenshot(driver, "apos_clicar_proximo_endereco_alternativo.png")
                                 
                                 # Verifica se a página mudou após o clique
@@ -1576,7 +1576,7 @@ def preencher_dados_tomador(driver, dados_nota):
                                 try:
                                     driver.execute_script("arguments[0].click();", botao_proximo)
                                     logger.info("Botão 'Próximo' clicado via JavaScript")
-                                    time.sleep(2)
+                                    aguardar_pagina_estavel(driver, timeout=20)
                                     salvar_screenshot(driver, "apos_clicar_proximo_endereco_alternativo_js.png")
                                     
                                     # Verifica se a página mudou após o clique via JavaScript
@@ -1627,7 +1627,7 @@ def preencher_dados_tomador(driver, dados_nota):
                             try:
                                 botao_proximo.click()
                                 logger.info("Botão 'Próximo' clicado com sucesso via XPath")
-                                time.sleep(2)
+                                aguardar_pagina_estavel(driver, timeout=20)
                                 salvar_screenshot(driver, "apos_clicar_proximo_xpath_endereco_alternativo.png")
                                 return True
                             except Exception as e:
@@ -1635,7 +1635,7 @@ def preencher_dados_tomador(driver, dados_nota):
                                 try:
                                     driver.execute_script("arguments[0].click();", botao_proximo)
                                     logger.info("Botão 'Próximo' clicado via JavaScript (XPath)")
-                                    time.sleep(2)
+                                    aguardar_pagina_estavel(driver, timeout=20)
                                     salvar_screenshot(driver, "apos_clicar_proximo_xpath_js_endereco_alternativo.png")
                                     return True
                                 except Exception as e2:
@@ -1737,46 +1737,41 @@ def preencher_dados_tomador(driver, dados_nota):
             }
         }
         
-        # Tenta preencher cada campo de endereço
-        campos_preenchidos = 0
-        campos_falharam = []
-        
-        for nome_campo, config in campos_endereco.items():
-            valor = config['valor']
-            
-            # Se não tiver um valor, e o campo não for obrigatório, pula
-            if not valor and not config['obrigatorio']:
+        # Localiza todos os campos de endereço numa única chamada ao navegador
+        campos_considerados = {nome: config for nome, config in campos_endereco.items()
+                               if config['valor'] or config['obrigatorio']}
+        for nome_campo in campos_endereco:
+            if nome_campo not in campos_considerados:
                 logger.info(f"Campo {nome_campo} não é obrigatório e não tem valor. Pulando...")
-                continue
-            
-            # Tenta cada seletor para encontrar o campo
-            campo_encontrado = False
-            for seletor in config['seletores']:
-                try:
-                    elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
-                    if elementos:
-                        elemento = elementos[0]
-                        logger.info(f"Campo {nome_campo} encontrado com seletor: {seletor}")
-                        
-                        # Torna o elemento visível
-                        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elemento)
-                        time.sleep(0.5)
-                        
-                        # Limpa e preenche o campo
-                        elemento.clear()
-                        simular_digitacao_humana(elemento, valor)
-                        logger.info(f"Campo {nome_campo} preenchido com: '{valor}'")
-                        
-                        campos_preenchidos += 1
-                        campo_encontrado = True
-                        break
-                except Exception as e:
-                    logger.warning(f"Erro ao procurar/preencher {nome_campo} com seletor {seletor}: {e}")
-            
-            if not campo_encontrado and config['obrigatorio']:
+        
+        localizados = localizar_campos(
+            driver, {nome: config['seletores'] for nome, config in campos_considerados.items()},
+            requisito="existente", prefixo_cache="endereco_", logger_busca=logger)
+        
+        campos_a_preencher = []
+        campos_falharam = []
+        for nome_campo, config in campos_considerados.items():
+            elemento, seletor = localizados[nome_campo]
+            if elemento is not None:
+                logger.info(f"Campo {nome_campo} encontrado com seletor: {seletor}")
+                campos_a_preencher.append({'nome': nome_campo, 'elemento': elemento, 'valor': config['valor']})
+            elif config['obrigatorio']:
                 logger.error(f"Não foi possível encontrar campo obrigatório: {nome_campo}")
                 campos_falharam.append(nome_campo)
         
+        # O CEP é preenchido antes e a página estabiliza, para que um eventual preenchimento
+        # automático do endereço pelo portal não sobrescreva os demais campos depois.
+        # Os demais campos são preenchidos de uma vez no modo rápido (MODO_PREENCHIMENTO=rapido)
+        cep = [c for c in campos_a_preencher if c['nome'] == 'cep']
+        demais = [c for c in campos_a_preencher if c['nome'] != 'cep']
+        falhas_preenchimento = preencher_campos(driver, cep, logger)
+        if cep:
+            aguardar_pagina_estavel(driver, timeout=10)
+        falhas_preenchimento += preencher_campos(driver, demais, logger)
+        
+        campos_preenchidos = len(campos_a_preencher) - len(falhas_preenchimento)
+        campos_falharam += [nome for nome in falhas_preenchimento if campos_endereco[nome]['obrigatorio']]
+        
         # Se todos os campos obrigatórios foram preenchidos
         if not campos_falharam:
             logger.info(f"Dados de endereço preenchidos com sucesso: {campos_preenchidos} campo(s)")
@@ -1811,7 +1806,7 @@ def preencher_dados_tomador(driver, dados_nota):
                         try:
                             botao_proximo.click()
                             logger.info("Botão 'Próximo' clicado com sucesso")
-                            time.sleep(2)
+                            aguardar_pagina_estavel(driver, timeout=20)
                             salvar_screenshot(driver, "apos_clicar_proximo_endereco.png")
                             return True
                         except Exception as e:
@@ -1819,7 +1814,7 @@ def preencher_dados_tomador(driver, dados_nota):
                             try:
                                 driver.execute_script("arguments[0].click();", botao_proximo)
                                 logger.info("Botão 'Próximo' clicado via JavaScript")
-                                time.sleep(2)
+                                aguardar_pagina_estavel(driver, timeout=20)
                                 salvar_screenshot(driver, "apos_clicar_proximo_endereco_js.png")
                                 return True
                             except Exception as e2:
@@ -1886,18 +1881,23 @@ def procurar_e_clicar_proximo(driver):
     ]
     
     # Utiliza a função procurar_e_clicar com texto específico
-    return procurar_e_clicar(driver, seletores_proximo, texto_botao="Próximo", max_tentativas=3, espera=1)
+    return procurar_e_clicar(driver, seletores_proximo, texto_botao="Próximo", max_tentativas=3, espera=1,
+                             chave="botao_proximo")
 
-def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, espera=1):
+def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, espera=1, chave=None):
     """
     Procura e clica em um elemento usando uma lista de seletores e múltiplas estratégias
     
+    Quando `chave` é informada, o seletor e o método de clique que funcionaram são
+    guardados no cache de seletores e tentados primeiro nas próximas chamadas.
+    
     Args:
         driver: WebDriver do Selenium
         seletores (list): Lista de seletores CSS para procurar
         texto_botao (str, opcional): Texto do botão para busca adicional por texto
         max_tentativas (int, opcional): Número máximo de tentativas para cada método
         espera (int, opcional): Tempo de espera entre tentativas em segundos
+        chave (str, opcional): Nome lógico do elemento no cache de seletores (ex.: "botao_proximo")
         
     Returns:
         bool: True se o clique foi bem-sucedido, False caso contrário
@@ -1919,8 +1919,8 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
         "button[disabledenableaftersubmit='enable']"
     ]
     
-    # Combina seletores específicos com os seletores fornecidos
-    todos_seletores = seletores_especificos + seletores
+    # Combina seletores específicos com os seletores fornecidos, com os que acertaram antes na frente
+    todos_seletores = cache_seletores.ordenar(chave, seletores_especificos + seletores)
     
     # Adiciona XPaths baseados no texto do botão
     xpaths = []
@@ -1932,20 +1932,15 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
             f"//a[contains(text(), '{texto_botao}')]",
             f"//span[contains(text(), '{texto_botao}')]/parent::button"
         ]
+        xpaths = cache_seletores.ordenar(chave, xpaths)
     logger.info(f"Usando seletores: {todos_seletores}")
+    # Uma única espera para qualquer um dos seletores ficar visível, em vez de
+    # uma espera de vários segundos para cada seletor
+    aguardar(driver, primeiro_visivel(todos_seletores), timeout=10,
+             descricao="elemento clicável visível")
     # Tenta cada seletor CSS fornecido
     for seletor in todos_seletores:
         try:
-            # Espera pelo elemento ficar visível primeiro
-            try:
-                WebDriverWait(driver, 5).until(
-                    EC.visibility_of_element_located((By.CSS_SELECTOR, seletor))
-                )
-                logger.info(f"Elemento ficou visível com seletor: {seletor}")
-            except Exception as e:
-                logger.debug(f"Elemento não ficou visível com seletor {seletor}: {e}")
-                
-            # Mesmo se o wait falhar, tenta localizar diretamente
             elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
             elementos_visiveis = [e for e in elementos if e.is_displayed()]
             
@@ -1955,7 +1950,6 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
                 
                 # Rola até o elemento para garantir que esteja visível
                 driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elemento)
-                time.sleep(espera)
                 
                 # Tenta diferentes métodos de clique com várias tentativas
                 metodos = [
@@ -1975,6 +1969,9 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
                     )},
                     {"nome": "submit", "func": lambda e=elemento: driver.execute_script("arguments[0].form.submit();", e)},
                 ]
+                # Método que funcionou da última vez primeiro
+                ordem_metodos = cache_seletores.ordenar(chave, [m["nome"] for m in metodos], tipo="metodos")
+                metodos.sort(key=lambda m: ordem_metodos.index(m["nome"]))
                 
                 for metodo in metodos:
                     for tentativa in range(max_tentativas):
@@ -1982,17 +1979,14 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
                             logger.info(f"Tentando clicar com método: {metodo['nome']} (tentativa {tentativa+1}/{max_tentativas})")
                             metodo["func"]()
                             logger.info(f"Elemento clicado com sucesso via {metodo['nome']}")
+                            cache_seletores.registrar_acerto(chave, seletor, metodo["nome"])
                             
-                            # Aguarda a página carregar
-                            time.sleep(2)
-                            esperar_pagina_carregar(driver, 5)
+                            # Aguarda a página reagir ao clique
+                            esperar_pagina_carregar(driver, 20)
                             
                             # Salva screenshot para verificação
                             salvar_screenshot(driver, f"apos_clicar_elemento_{metodo['nome'].replace(' ', '_')}.png")
                             
-                            # Verifica se realmente mudou de página
-                            time.sleep(1)  # Espera um pouco mais para verificar
-                            
                             return True
                             
                         except Exception as e:
@@ -2001,7 +1995,10 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
                             
                             if tentativa == max_tentativas - 1:
                                 logger.warning(f"Todas as tentativas com {metodo['nome']} falharam.")
+                                cache_seletores.registrar_falha(chave, metodo=metodo["nome"])
                                 continue
+            else:
+                cache_seletores.registrar_falha(chave, seletor)
                         
         except Exception as e:
             logger.debug(f"Erro ao procurar elemento com seletor {seletor}: {e}")
@@ -2019,12 +2016,12 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
                     
                     # Rola até o elemento
                     driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elemento)
-                    time.sleep(espera)
                     
                     try:
                         elemento.click()
                         logger.info("Elemento clicado com sucesso via XPath")
-                        time.sleep(2)
+                        cache_seletores.registrar_acerto(chave, xpath, "clique direto")
+                        esperar_pagina_carregar(driver, 20)
                         salvar_screenshot(driver, "apos_clicar_elemento_xpath.png")
                         return True
                     except Exception as e:
@@ -2032,11 +2029,14 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
                         try:
                             driver.execute_script("arguments[0].click();", elemento)
                             logger.info("Elemento clicado via JavaScript (XPath)")
-                            time.sleep(2)
+                            cache_seletores.registrar_acerto(chave, xpath, "JavaScript")
+                            esperar_pagina_carregar(driver, 20)
                             salvar_screenshot(driver, "apos_clicar_elemento_xpath_js.png")
                             return True
                         except Exception as e2:
                             logger.warning(f"Clique via JavaScript (XPath) falhou: {e2}")
+                else:
+                    cache_seletores.registrar_falha(chave, xpath)
                             
             except Exception as e:
                 logger.debug(f"Erro ao procurar elemento com XPath {xpath}: {e}")
@@ -2047,67 +2047,34 @@ def procurar_e_clicar(driver, seletores, texto_botao=None, max_tentativas=3, esp
 
 def extrair_numero_nota_fiscal(driver, df=None, linha_atual=None):
     """
-    Determina o próximo número da nota fiscal na sequência com base no último número existente no Excel.
+    Determina o número da nota fiscal emitida.
+    
+    O número é reservado no estado de numeração (semeado uma vez pela planilha) e
+    conferido com o número exibido na página de confirmação, que prevalece se divergir.
     
     Args:
-        driver: WebDriver do Selenium (mantido por compatibilidade)
-        df: DataFrame com os dados do Excel (opcional)
+        driver: WebDriver do Selenium (página de confirmação da emissão)
+        df: DataFrame com os dados do Excel (opcional, usado para semear a numeração)
         linha_atual: Índice da linha atual sendo processada (opcional)
         
     Returns:
-        str: Próximo número da nota fiscal na sequência
+        str: Número da nota fiscal, ou None se não for possível determiná-lo
     """
-    logger.info("Definindo próximo número da nota fiscal com base na sequência...")
+    logger.info("Definindo número da nota fiscal com base na sequência...")
     
     try:
-        # Se o DataFrame não foi fornecido, carrega novamente do arquivo Excel
-        if df is None:
-            try:
-                from pathlib import Path
-                import pandas as pd
-                
-                # Tenta encontrar o arquivo Excel no diretório atual
-                excel_path = EXCEL_PATH
-                df = pd.read_excel(excel_path)
-                logger.info(f"DataFrame carregado do Excel: {excel_path}")
-            except Exception as e:
-                logger.error(f"Erro ao carregar Excel para determinar número da nota: {e}")
-                return None
-        
-        if df is None or df.empty:
-            logger.error("DataFrame vazio ou não carregado")
-            return None
-            
-        # Pega a primeira coluna (onde ficam os números das notas)
-        primeira_coluna = df.columns[0]
-        
-        # Filtra apenas valores não vazios e converte para números quando possível
-        numeros_nota = []
-        for valor in df[primeira_coluna]:
-            if pd.notna(valor) and str(valor).strip() != '':
-                try:
-                    # Tenta converter para número inteiro
-                    numeros_nota.append(int(float(valor)))
-                except (ValueError, TypeError):
-                    # Se não for número, tenta extrair números da string
-                    import re
-                    numeros = re.findall(r'\d+', str(valor))
-                    if numeros:
-                        try:
-                            numeros_nota.append(int(numeros[0]))
-                        except (ValueError, IndexError):
-                            pass
-        
-        # Se encontrou números de nota, pega o maior e incrementa
-        if numeros_nota:
-            ultimo_numero = max(numeros_nota)
-            proximo_numero = ultimo_numero + 1
-            logger.info(f"Último número de nota encontrado: {ultimo_numero}. Próximo número: {proximo_numero}")
-            return str(proximo_numero)
+        numero = numeracao_notas.reservar_numero(df)
+        numero_pagina = numeracao_notas.ler_numero_confirmacao(driver)
+        if numero_pagina is None:
+            logger.info(f"Número não encontrado na página de confirmação. Usando o número da sequência: {numero}")
+        elif numero_pagina != numero:
+            logger.warning(f"A página de confirmação exibe o número {numero_pagina}, diferente do esperado {numero}. "
+                           "Usando o número do portal.")
+            numeracao_notas.corrigir_numero(numero, numero_pagina)
+            numero = numero_pagina
         else:
-            # Se não encontrou nenhum número, começa do 1
-            logger.warning("Nenhum número de nota encontrado no Excel. Iniciando do número 1.")
-            return "1"
+            logger.info(f"Número {numero} conferido com a página de confirmação")
+        return str(numero)
     
     except Exception as e:
         logger.error(f"Erro ao determinar próximo número da nota: {e}")
@@ -2121,472 +2088,510 @@ def salvar_html_confirmacao(driver):
     Args:
         driver: WebDriver do Selenium
     """
+    captura.capturar_html(driver, "pagina_confirmacao_nota")
+    return None
+
+def configurar_navegador():
+    """
+    Configura e inicia uma nova instância do Chrome.
+
+    Returns:
+        WebDriver: Navegador Chrome pronto para uso
+    """
+    logger.info("Configurando navegador...")
+    logger.info(f"Sistema Operacional detectado: {platform.system()}")
+
+    # Configurações do Chrome
+    chrome_opts = Options()
+    chrome_opts.add_argument("--start-maximized")
+    chrome_opts.add_argument("--disable-notifications")
+
+    # Argumentos para reduzir logs desnecessários
+    chrome_opts.add_argument("--disable-logging")
+    chrome_opts.add_argument("--log-level=3")  # Só mostra erros críticos
+    chrome_opts.add_argument("--disable-dev-shm-usage")
+    chrome_opts.add_argument("--no-sandbox")
+    chrome_opts.add_argument("--disable-gpu-sandbox")
+    chrome_opts.add_argument("--disable-software-rasterizer")
+    chrome_opts.add_argument("--disable-background-timer-throttling")
+    chrome_opts.add_argument("--disable-backgrounding-occluded-windows")
+    chrome_opts.add_argument("--disable-renderer-backgrounding")
+    chrome_opts.add_argument("--disable-features=TranslateUI")
+    chrome_opts.add_argument("--disable-features=VizDisplayCompositor")
+    chrome_opts.add_argument("--disable-extensions")
+    chrome_opts.add_argument("--disable-plugins")
+    chrome_opts.add_argument("--disable-default-apps")
+    chrome_opts.add_argument("--disable-sync")
+    chrome_opts.add_argument("--no-first-run")
+    chrome_opts.add_argument("--no-default-browser-check")
+    chrome_opts.add_argument("--disable-background-networking")
+    chrome_opts.add_argument("--disable-component-update")
+
+    # Configurações experimentais para reduzir ruído
+    chrome_opts.add_experimental_option('excludeSwitches', ['enable-logging'])
+    chrome_opts.add_experimental_option('useAutomationExtension', False)
+
+    # Inicia o navegador
+    driver = webdriver.Chrome(options=chrome_opts)
+    logger.info("Navegador iniciado com sucesso!")
+    return driver
+
+def autenticar_portal(driver):
+    """
+    Executa o fluxo completo de autenticação: página inicial, login, área fiscal,
+    CAPTCHA manual, redirecionamento e fechamento do aviso.
+
+    Args:
+        driver: WebDriver do Selenium
+
+    Returns:
+        bool: True se a página de destino foi alcançada, False caso contrário
+    """
+    # PASSO 2: NAVEGANDO PARA A PÁGINA INICIAL
+    logger.info(f"Acessando URL: {NFS_URL}")
+    driver.get(NFS_URL)
+
+    # Aguarda carregamento da página
+    esperar_pagina_carregar(driver, timeout=30)
+    # Captura estado inicial
+    salvar_screenshot(driver, "pagina_inicial.png")
+
+    # Log informativo
+    logger.info(f"Título da página: {driver.title}")
+    logger.info(f"URL atual: {driver.current_url}")
+    # Salvar HTML inicial
+    salvar_html(driver, "pagina_inicial")
+
+    # PASSO 3: PROCESSO DE LOGIN
+    logger.info("Iniciando processo de login...")
+    if not realizar_login(driver, CPF_CNPJ, SENHA):
+        logger.error("Falha no login")
+        return False
+    logger.info("LOGIN REALIZADO COM SUCESSO!")
+
+    # PASSO 4: ACESSAR ÁREA FISCAL
+    logger.info("Tentando acessar área fiscal...")
+    if not clicar_acessar_fiscal(driver):
+        return False
+    logger.info("Botão 'Acessar' clicado com sucesso!")
+
+    # AVISO SOBRE CAPTCHA NESTE MOMENTO
+    logger.info("\n" + "*"*80)
+    logger.info("ATENÇÃO: RESOLVA O CAPTCHA AGORA!")
+    logger.info("Um CAPTCHA deve aparecer após clicar no botão 'Acessar'.")
+    logger.info("Por favor resolva o CAPTCHA manualmente na janela do navegador.")
+    logger.info("*"*80 + "\n")
+
+    # Pausa para permitir resolução manual de CAPTCHA
+    input("Pressione ENTER depois de resolver o CAPTCHA para continuar...")
+
+    # PASSO 5: AGUARDAR REDIRECIONAMENTO PARA A PÁGINA DE DESTINO
+    logger.info(f"Aguardando redirecionamento para: {PAGINA_DESTINO}")
+    logger.info("Este processo pode levar vários minutos. Por favor, aguarde...")
+    # Aguarda até 5 minutos (300 segundos) pelo redirecionamento
+    if not aguardar_pagina_destino(driver, PAGINA_DESTINO, tempo_maximo=300):
+        return False
+
+    logger.info("PÁGINA DE DESTINO ALCANÇADA COM SUCESSO!")
+    # Captura estado final
+    salvar_screenshot(driver, "pagina_destino.png")
+    salvar_html(driver, "pagina_destino")
+
+    # PASSO 6: FECHAR AVISO NA PÁGINA DE DESTINO
+    logger.info("Tentando fechar o aviso na página de destino...")
+    aviso_fechado = fechar_aviso(driver)
+
+    if aviso_fechado:
+        logger.info("AVISO FECHADO COM SUCESSO!")
+        salvar_screenshot(driver, "apos_fechar_aviso.png")
+    else:
+        logger.warning("Não foi possível fechar o aviso automaticamente. Pode ser necessário fechá-lo manualmente.")
+
+    logger.info("AUTENTICAÇÃO CONCLUÍDA COM SUCESSO!")
+    return True
+
+def emitir_nota(driver, dados_nota, linha_excel, fila):
+    """
+    Preenche e emite uma nota a partir do formulário de emissão já aberto.
+
+    Args:
+        driver: WebDriver do Selenium (sessão já autenticada)
+        dados_nota (dict): Dados mapeados da nota fiscal
+        linha_excel (int): Linha da nota no Excel
+        fila (NotaQueue): Fila de notas com a planilha de controle em memória
+
+    Returns:
+        str: 'emitida', 'nao_emitida' (cancelada ou não finalizada),
+             'falha' (erro no preenchimento) ou 'interrompida' (usuário encerrou a automação)
+    """
+    logger.info("Aguardando carregamento da próxima página...")
+    aguardar_pagina_estavel(driver, timeout=20)
+
+    # PASSO 8: CLICAR NO BOTÃO "PRÓXIMO"
+    logger.info("Tentando clicar no botão 'Próximo'...")
+    if not clicar_proximo(driver):
+        return 'falha'
+    logger.info("BOTÃO 'PRÓXIMO' CLICADO COM SUCESSO!")
+
+    # Verificar se o fluxo de emissão foi iniciado corretamente
+    aguardar_pagina_estavel(driver, timeout=20)
+    if not verificar_emissao_iniciada(driver):
+        return 'falha'
+    logger.info("FLUXO DE EMISSÃO DE NOTA FISCAL INICIADO COM SUCESSO!")
+
+    # PASSO 9: SELECIONAR TIPO DO TOMADOR
+    logger.info("Selecionando 'Pessoa Jurídica' como tipo do tomador...")
+    if not selecionar_tipo_tomador(driver, tipo="Pessoa Jurídica"):
+        return 'falha'
+    logger.info("TIPO DO TOMADOR 'PESSOA JURÍDICA' SELECIONADO COM SUCESSO!")
+    salvar_screenshot(driver, "tipo_tomador_selecionado.png")
+    logger.info("Continuando com o preenchimento dos dados da nota fiscal...")
+
+    # Buscar empresa por CNPJ usando o módulo busca_empresa
     try:
-        html_content = driver.page_source
-        with open("logs/html/pagina_confirmacao_nota.html", "w", encoding="utf-8") as f:
-            f.write(html_content)
-        logger.info("HTML da página de confirmação salvo em logs/html/pagina_confirmacao_nota.html")
+        # Importa a função de busca de empresa
+        from busca_empresa import preencher_busca_cnpj
+
+        # Obtém os dados necessários
+        cnpj = dados_nota.get('cnpj_tomador', '')
+        nome_empresa = dados_nota.get('razao_social', '')
+
+        # Log dos dados (mascarando o CNPJ por segurança)
+        if len(cnpj) > 6:
+            cnpj_mascarado = f"{cnpj[:4]}****{cnpj[-2:]}"
+        else:
+            cnpj_mascarado = "****"
+
+        logger.info(f"Buscando empresa: {nome_empresa}")
+        logger.info(f"CNPJ: {cnpj_mascarado}")
+
+        # Salva screenshot antes da busca
+        salvar_screenshot(driver, "antes_busca_empresa.png")
+
+        # Usa a função do módulo busca_empresa para localizar e selecionar a empresa
+        # Passa o logger para manter o registro de logs consistente
+        busca_resultado = preencher_busca_cnpj(driver, cnpj, nome_empresa, logger)
+
+        if busca_resultado:
+            logger.info("EMPRESA ENCONTRADA E SELECIONADA COM SUCESSO!")
+            salvar_screenshot(driver, "apos_selecao_empresa.png")
+        else:
+            logger.warning("Não foi possível encontrar ou selecionar a empresa pelo CNPJ automaticamente.")
+            logger.warning("Tentando abordagem alternativa...")
+
+            # Pergunta ao usuário se deseja continuar manualmente
+            continuar_manual = input("Empresa não encontrada automaticamente. Deseja selecionar manualmente? (s/n): ")
+            if continuar_manual.lower() == 's':
+                logger.info("Aguardando seleção manual da empresa pelo usuário...")
+                input("Selecione a empresa manualmente e pressione ENTER para continuar...")
+                logger.info("Continuando após seleção manual da empresa")
+            else:
+                logger.warning("Processo interrompido pelo usuário após falha na busca por empresa")
+                return 'interrompida'
+    except ImportError as e:
+        logger.error(f"Erro ao importar módulo busca_empresa.py: {e}")
+        logger.error("Verifique se o arquivo busca_empresa.py está presente no diretório")
+        return 'interrompida'
     except Exception as e:
-        logger.warning(f"Erro ao salvar HTML: {e}")
-    
-    return None
+        logger.error(f"Erro durante a busca de empresa: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+
+        # Pergunta ao usuário se deseja continuar manualmente
+        continuar_manual = input("Erro durante a busca de empresa. Deseja continuar manualmente? (s/n): ")
+        if continuar_manual.lower() == 's':
+            logger.info("Continuando manualmente após erro...")
+        else:
+            logger.warning("Processo interrompido pelo usuário após erro")
+            return 'interrompida'
+
+    # PASSO 10: PREENCHER DADOS DO TOMADOR
+    logger.info("Preenchendo dados do tomador com informações do Excel...")
+    logger.info(f"CNPJ Tomador: {dados_nota.get('cnpj_tomador', '')[:4]}****{dados_nota.get('cnpj_tomador', '')[-2:]}")
+    logger.info(f"Razão Social: {dados_nota.get('razao_social', '')}")
+    if not preencher_dados_tomador(driver, dados_nota):
+        return 'falha'
+    logger.info("DADOS DO TOMADOR PREENCHIDOS COM SUCESSO!")
+
+    # PASSO 11: PREENCHER DADOS DO SERVIÇO
+    logger.info("Preenchendo dados do serviço...")
+    try:
+        # Tenta importar o módulo especializado
+        from preencher_dados_servico import preencher_formulario_servico
+
+        # Usa a função do módulo especializado passando o logger
+        preenchimento_servico = preencher_formulario_servico(driver, dados_nota, logger)
+    except ImportError:
+        logger.warning("Módulo preencher_dados_servico não encontrado, usando função interna")
+        preenchimento_servico = preencher_dados_servico(driver, dados_nota)
+    except Exception as e:
+        logger.error(f"Erro ao usar módulo especializado: {e}")
+        logger.warning("Tentando com a função interna...")
+        preenchimento_servico = preencher_dados_servico(driver, dados_nota)
+
+    if not preenchimento_servico:
+        return 'falha'
+    logger.info("DADOS DO SERVIÇO PREENCHIDOS COM SUCESSO!")
+
+    # PASSO 12: AVANÇAR NO FLUXO
+    logger.info("Tentando avançar para a próxima etapa...")
+    if not procurar_e_clicar_proximo(driver):
+        logger.warning("Não foi possível avançar automaticamente")
+        logger.info("Formulário preenchido - continue manualmente")
+        return 'falha'
+
+    logger.info("AVANÇOU COM SUCESSO PARA A PRÓXIMA ETAPA!")
+    salvar_screenshot(driver, "formulario_preenchido_avancar.png")
+
+    # PASSO 13: PREENCHER TRIBUTOS FEDERAIS
+    logger.info("Preenchendo tributos federais (IR, PIS, COFINS, CSLL)...")
+    try:
+        # Tenta importar o módulo especializado para tributos
+        from preencher_tributos import preencher_tributos
+
+        # Verifica se há tributos definidos na nota
+        tem_tributos = any([
+            dados_nota.get('irrf', dados_nota.get('valor_ir', 0)) != 0,
+            dados_nota.get('pis', dados_nota.get('valor_pis', 0)) != 0,
+            dados_nota.get('cofins', dados_nota.get('valor_cofins', 0)) != 0,
+            dados_nota.get('csll', dados_nota.get('valor_csll', 0)) != 0
+        ])
+
+        # Se tem tributos, preenche os campos
+        if tem_tributos:
+            logger.info("Preenchendo campos de tributos federais...")
+            # Usa a função do módulo especializado passando o logger
+            preenchimento_tributos = preencher_tributos(driver, dados_nota, logger)
+
+            if preenchimento_tributos:
+                logger.info("TRIBUTOS FEDERAIS PREENCHIDOS COM SUCESSO!")
+            else:
+                logger.warning("Houve problemas ao preencher tributos federais")
+                # Pergunta se deseja continuar mesmo assim
+                continuar_tributos = input("Houve problemas ao preencher os tributos federais. Deseja continuar mesmo assim? (s/n): ")
+                if continuar_tributos.lower() != 's':
+                    logger.warning("Processo interrompido pelo usuário após falha nos tributos federais")
+                    return 'interrompida'
+        else:
+            logger.info("Nota não possui tributos federais para preencher")
+    except ImportError:
+        logger.warning("Módulo preencher_tributos não encontrado, pulando essa etapa")
+    except Exception as e:
+        logger.error(f"Erro ao preencher tributos federais: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        # Pergunta se deseja continuar mesmo assim
+        continuar_tributos = input("Erro ao preencher os tributos federais. Deseja continuar mesmo assim? (s/n): ")
+        if continuar_tributos.lower() != 's':
+            logger.warning("Processo interrompido pelo usuário após erro nos tributos federais")
+            return 'interrompida'
+
+    salvar_screenshot(driver, "apos_preencher_tributos.png")
+
+    # PASSO 14: FINALIZAR EMISSÃO
+    logger.info("FORMULÁRIO PREENCHIDO - PRONTO PARA EMISSÃO")
+    logger.info("Verifique manualmente se todos os dados estão corretos")
+
+    # Pergunta ao usuário se deseja continuar com a emissão
+    continuar = input("Todos os dados estão corretos? Pressione ENTER para emitir a nota ou 'n' para cancelar: ")
+    if continuar.lower() == 'n':
+        logger.info("Emissão de nota fiscal cancelada pelo usuário")
+        return 'nao_emitida'
+
+    logger.info("Finalizando a emissão da nota fiscal...")
+    # Lista de seletores possíveis para o botão Emitir
+    seletores_emitir = [
+        # Seletor exato do HTML problemático
+        "button.__estrutura_componente_base.botao.botao-com-variante.estrutura_botao.disabled_user_select.estrutura_botao_colorido",
+        "button[name='confirmar']",
+        "button[myaccesskey='e']",
+        "button[disabledenableaftersubmit='enable']",
+
+        # Seletores alternativos
+        "button[name='emitir']",
+        "button.botao-primario",
+        "button.__estrutura_componente_base.botao.botao-primario",
+        "button[type='submit']"
+    ]
+
+    # Tenta clicar usando a função procurar_e_clicar com texto específico
+    emitir_sucesso = procurar_e_clicar(driver, seletores_emitir, texto_botao="Emitir", max_tentativas=3, espera=1,
+                                       chave="botao_emitir")
+
+    if not emitir_sucesso:
+        logger.warning("Não foi possível clicar no botão para finalizar a emissão")
+        logger.info("Prossiga manualmente para completar a emissão da nota fiscal")
+        return 'nao_emitida'
+
+    logger.info("NOTA FISCAL EMITIDA COM SUCESSO!")
+    salvar_screenshot(driver, "nota_emitida.png")
+    # Aguarda um tempo para ter certeza que a página de confirmação carregou
+    logger.info("Aguardando carregamento da página de confirmação...")
+    aguardar_pagina_estavel(driver, timeout=30)
+    # Determina o próximo número da nota fiscal na sequência
+    logger.info("Determinando próximo número da nota fiscal...")
+    numero_nota = extrair_numero_nota_fiscal(driver, fila.df, linha_excel)
+
+    if numero_nota:
+        logger.info(f"NÚMERO DA NOTA DETERMINADO: {numero_nota}")
+
+        # Atualiza o número da nota no Excel
+        logger.info(f"Atualizando Excel com o número da nota: {numero_nota}")
+        atualizacao_sucesso = atualizar_numero_nota_excel(
+            EXCEL_PATH, linha_excel, numero_nota)
+        # O número vale para a sequência mesmo que o registro falhe
+        fila.registrar_numero(linha_excel, numero_nota)
+
+        if atualizacao_sucesso:
+            logger.info("NÚMERO REGISTRADO NO DIÁRIO! A planilha será atualizada no próximo lote.")
+        else:
+            logger.error("FALHA AO REGISTRAR O NÚMERO DA NOTA")
+            logger.error(f"Por favor, atualize manualmente o número da nota {numero_nota} na linha {linha_excel} do Excel")
+    else:
+        logger.warning("Não foi possível extrair o número da nota automaticamente")
+        numero_manual = input("Por favor, informe o número da nota fiscal emitida (deixe em branco para ignorar): ")
+        if numero_manual.strip():
+            logger.info(f"Atualizando Excel com o número informado manualmente: {numero_manual}")
+            atualizacao_sucesso = atualizar_numero_nota_excel(
+                EXCEL_PATH, linha_excel, numero_manual)
+            fila.registrar_numero(linha_excel, numero_manual)
+            if atualizacao_sucesso:
+                logger.info("NÚMERO REGISTRADO NO DIÁRIO! A planilha será atualizada no próximo lote.")
+            else:
+                logger.error("FALHA AO REGISTRAR O NÚMERO DA NOTA")
+        else:
+            logger.warning("Nenhum número informado. O Excel não será atualizado.")
+
+    return 'emitida'
 
 def main():
     # Importa módulos necessários no escopo local da função
-    import os
-    import platform
-    import sys
     import traceback
-    
+
     # PASSO 1: CARREGAMENTO DOS DADOS DO EXCEL
     logger.info("="*80)
     logger.info("INICIANDO AUTOMAÇÃO DE EMISSÃO DE NOTAS FISCAIS")
     logger.info("="*80)
-    
-    # Carrega os dados do Excel
-    df_excel = carregar_dados_excel(EXCEL_PATH)
-    if df_excel is None:
+
+    # Grava os números que ficaram no diário (ex.: execução anterior interrompida)
+    gravar_diario_excel()
+    # Números emitidos que não puderam ser gravados por conflito continuam sendo apontados
+    diario_excel.avisar_conflitos(logger)
+
+    # Carrega os dados do Excel uma única vez; a fila entrega as notas pendentes em ordem
+    fila = NotaQueue(EXCEL_PATH, carregar_dados_excel, logger_fila=logger)
+    if not fila.carregar_planilha():
         logger.error("Falha ao carregar dados do Excel. Encerrando automação.")
         return
+    # Números do diário que não puderam ser gravados não podem ser emitidos de novo
+    aplicar_diario_na_fila(fila)
+    # Retenções federais de todas as pendentes conferidas antes de abrir o navegador
+    tributos_conferidos = set()
 
-    driver = None  # Inicializa variável do driver fora do loop
-    navegador_aberto = False  # Flag para controlar se o navegador já está aberto
+    # Uma única sessão do navegador é reaproveitada por todas as notas do lote
+    sessao = SessaoNFSe(
+        criar_driver=configurar_navegador,
+        autenticar=autenticar_portal,
+        url_destino=PAGINA_DESTINO,
+        logger_sessao=logger
+    )
 
-    while True:
-        # Encontra a próxima nota a ser processada
-        proxima_nota = encontrar_proxima_nota(df_excel)
-        if proxima_nota is None:
-            logger.info("Nenhuma nota pendente encontrada. Todas as notas podem já ter sido processadas.")
-            break
+    try:
+        while True:
+            # Relê a planilha apenas se ela foi alterada fora da automação
+            if fila.atualizar_se_modificado():
+                aplicar_diario_na_fila(fila)
+            # Apenas as linhas novas (primeira leitura ou planilha relida) são conferidas
+            conferir_tributos_pendentes(fila, tributos_conferidos)
 
-        # Mapeia os dados da nota
-        dados_nota = mapear_dados_nota(proxima_nota['dados'])
-        if dados_nota is None:
-            logger.error("Falha ao mapear dados da nota. Encerrando automação.")
-            continue
+            # Encontra a próxima nota a ser processada
+            proxima_nota = fila.proxima()
+            if proxima_nota is None:
+                logger.info("Nenhuma nota pendente encontrada. Todas as notas podem já ter sido processadas.")
+                break
 
-        linha_excel = proxima_nota['linha_excel']
-        logger.info(f"Nota a ser processada encontrada na linha {linha_excel} do Excel")
-        
-        # Verifica o sistema operacional
-        sistema_operacional = platform.system()
-        logger.info(f"Sistema Operacional detectado: {sistema_operacional}")
-        
-        try:
-            # PASSO 2: INICIANDO O NAVEGADOR
-            logger.info("Configurando navegador...")
-            
-            # Configurações do Chrome
-            chrome_opts = Options()
-            chrome_opts.add_argument("--start-maximized")
-            chrome_opts.add_argument("--disable-notifications")
-            
-            # Argumentos para reduzir logs desnecessários
-            chrome_opts.add_argument("--disable-logging")
-            chrome_opts.add_argument("--log-level=3")  # Só mostra erros críticos
-            chrome_opts.add_argument("--disable-dev-shm-usage")
-            chrome_opts.add_argument("--no-sandbox")
-            chrome_opts.add_argument("--disable-gpu-sandbox")
-            chrome_opts.add_argument("--disable-software-rasterizer")
-            chrome_opts.add_argument("--disable-background-timer-throttling")
-            chrome_opts.add_argument("--disable-backgrounding-occluded-windows")
-            chrome_opts.add_argument("--disable-renderer-backgrounding")
-            chrome_opts.add_argument("--disable-features=TranslateUI")
-            chrome_opts.add_argument("--disable-features=VizDisplayCompositor")
-            chrome_opts.add_argument("--disable-extensions")
-            chrome_opts.add_argument("--disable-plugins")
-            chrome_opts.add_argument("--disable-default-apps")
-            chrome_opts.add_argument("--disable-sync")
-            chrome_opts.add_argument("--no-first-run")
-            chrome_opts.add_argument("--no-default-browser-check")
-            chrome_opts.add_argument("--disable-background-networking")
-            chrome_opts.add_argument("--disable-component-update")
-            
-            # Configurações experimentais para reduzir ruído
-            chrome_opts.add_experimental_option('excludeSwitches', ['enable-logging'])
-            chrome_opts.add_experimental_option('useAutomationExtension', False)
-            
-            # Inicia o navegador
-            driver = webdriver.Chrome(options=chrome_opts)
-            logger.info("Navegador iniciado com sucesso!")
-            
-            # PASSO 3: NAVEGANDO PARA A PÁGINA INICIAL
-            logger.info(f"Acessando URL: {NFS_URL}")
-            driver.get(NFS_URL)
-            
-            # Aguarda carregamento da página
-            esperar_pagina_carregar(driver, timeout=30)
-            # Captura estado inicial
-            salvar_screenshot(driver, "pagina_inicial.png")
-            logger.info(f"Screenshot inicial salvo em {obter_caminho_absoluto('logs/imagens/pagina_inicial.png')}")
-            
-            # Log informativo
-            logger.info(f"Título da página: {driver.title}")
-            logger.info(f"URL atual: {driver.current_url}")
-              # Salvar HTML inicial
-            salvar_html(driver, "pagina_inicial")
-            
-            # PASSO 3: PROCESSO DE LOGIN
-            logger.info("Iniciando processo de login...")
-            login_sucesso = realizar_login(driver, CPF_CNPJ, SENHA)
-            
-            if login_sucesso:
-                logger.info("LOGIN REALIZADO COM SUCESSO!")
-                
-                # PASSO 4: ACESSAR ÁREA FISCAL
-                logger.info("Tentando acessar área fiscal...")
-                acessar_sucesso = clicar_acessar_fiscal(driver)
-            
-            if acessar_sucesso:
-                logger.info("Botão 'Acessar' clicado com sucesso!")
-                
-                # AVISO SOBRE CAPTCHA NESTE MOMENTO
-                logger.info("\n" + "*"*80)
-                logger.info("ATENÇÃO: RESOLVA O CAPTCHA AGORA!")
-                logger.info("Um CAPTCHA deve aparecer após clicar no botão 'Acessar'.")
-                logger.info("Por favor resolva o CAPTCHA manualmente na janela do navegador.")
-                logger.info("*"*80 + "\n")
-                
-                # Pausa para permitir resolução manual de CAPTCHA
-                input("Pressione ENTER depois de resolver o CAPTCHA para continuar...")
-                
-                # PASSO 5: AGUARDAR REDIRECIONAMENTO PARA A PÁGINA DE DESTINO
-                logger.info(f"Aguardando redirecionamento para: {PAGINA_DESTINO}")
-                logger.info("Este processo pode levar vários minutos. Por favor, aguarde...")
-                  # Aguarda até 5 minutos (300 segundos) pelo redirecionamento
-                destino_alcancado = aguardar_pagina_destino(driver, PAGINA_DESTINO, tempo_maximo=300)
-                
-                if destino_alcancado:
-                    logger.info("PÁGINA DE DESTINO ALCANÇADA COM SUCESSO!")
-                    # Captura estado final
-                    salvar_screenshot(driver, "pagina_destino.png")
-                    salvar_html(driver, "pagina_destino")
-                    
-                    # PASSO 6: FECHAR AVISO NA PÁGINA DE DESTINO
-                    logger.info("Tentando fechar o aviso na página de destino...")
-                    aviso_fechado = fechar_aviso(driver)
-                    
-                    if aviso_fechado:
-                        logger.info("AVISO FECHADO COM SUCESSO!")
-                        salvar_screenshot(driver, "apos_fechar_aviso.png")
-                    else:
-                        logger.warning("Não foi possível fechar o aviso automaticamente. Pode ser necessário fechá-lo manualmente.")
-                    
-                    logger.info("AUTENTICAÇÃO CONCLUÍDA COM SUCESSO!")
-                    
+            # Mapeia os dados da nota
+            dados_nota = mapear_dados_nota(proxima_nota['dados'])
+            if dados_nota is None:
+                logger.error("Falha ao mapear dados da nota. Encerrando automação.")
+                break
+
+            linha_excel = proxima_nota['linha_excel']
+            logger.info(f"Nota a ser processada encontrada na linha {linha_excel} do Excel")
+            # As capturas desta nota vão para logs/capturas/<execução>/linha_<n>/
+            captura.iniciar_nota(f"linha_{linha_excel}")
+
+            resultado = 'falha'
+            try:
+                # PASSOS 2 A 6: NAVEGADOR E LOGIN (apenas quando não há sessão ativa)
+                if not sessao.garantir():
+                    logger.error("Não foi possível autenticar no portal NFSe")
+                else:
                     # PASSO 7: CLICAR NO BOTÃO "EMITIR NOTA FISCAL"
                     logger.info("Tentando clicar no botão 'Emitir Nota Fiscal'...")
-                    emitir_nota_sucesso = clicar_emitir_nota_fiscal(driver)
-                    
-                    if emitir_nota_sucesso:
+                    if sessao.abrir_emissao(clicar_emitir_nota_fiscal):
                         logger.info("BOTÃO 'EMITIR NOTA FISCAL' CLICADO COM SUCESSO!")
-                        logger.info("Aguardando carregamento da próxima página...")
-                        time.sleep(3)  # Pausa para carregamento
-                        
-                        # PASSO 8: CLICAR NO BOTÃO "PRÓXIMO"
-                        logger.info("Tentando clicar no botão 'Próximo'...")
-                        proximo_sucesso = clicar_proximo(driver)
-                        
-                        if proximo_sucesso:
-                            logger.info("BOTÃO 'PRÓXIMO' CLICADO COM SUCESSO!")
-                            # Verificar se o fluxo de emissão foi iniciado corretamente
-                            time.sleep(3)  # Pequena pausa para carregamento
-                            emissao_iniciada = verificar_emissao_iniciada(driver)
-                            
-                            if emissao_iniciada:
-                                logger.info("FLUXO DE EMISSÃO DE NOTA FISCAL INICIADO COM SUCESSO!")
-                                
-                                # PASSO 9: SELECIONAR TIPO DO TOMADOR
-                                logger.info("Selecionando 'Pessoa Jurídica' como tipo do tomador...")
-                                selecao_sucesso = selecionar_tipo_tomador(driver, tipo="Pessoa Jurídica")
-                                if selecao_sucesso:
-                                    logger.info("TIPO DO TOMADOR 'PESSOA JURÍDICA' SELECIONADO COM SUCESSO!")
-                                    salvar_screenshot(driver, "tipo_tomador_selecionado.png")
-                                    logger.info("Continuando com o preenchimento dos dados da nota fiscal...")
-                                    
-                                    # Buscar empresa por CNPJ usando o módulo busca_empresa
-                                    try:
-                                        # Importa o módulo de busca de empresa
-                                        import sys
-                                        import os
-                                        
-                                        # Garante que o diretório atual está no path
-                                        if os.path.dirname(os.path.abspath(__file__)) not in sys.path:
-                                            sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-                                        
-                                        # Agora importa a função de busca de empresa
-                                        from busca_empresa import preencher_busca_cnpj
-                                        
-                                        # Obtém os dados necessários
-                                        cnpj = dados_nota.get('cnpj_tomador', '')
-                                        nome_empresa = dados_nota.get('razao_social', '')
-                                        
-                                        # Log dos dados (mascarando o CNPJ por segurança)
-                                        if len(cnpj) > 6:
-                                            cnpj_mascarado = f"{cnpj[:4]}****{cnpj[-2:]}"
-                                        else:
-                                            cnpj_mascarado = "****"
-                                        
-                                        logger.info(f"Buscando empresa: {nome_empresa}")
-                                        logger.info(f"CNPJ: {cnpj_mascarado}")
-                                        
-                                        # Salva screenshot antes da busca
-                                        salvar_screenshot(driver, "antes_busca_empresa.png")
-                                        
-                                        # Usa a função do módulo busca_empresa para localizar e selecionar a empresa
-                                        # Passa o logger para manter o registro de logs consistente
-                                        busca_resultado = preencher_busca_cnpj(driver, cnpj, nome_empresa, logger)
-                                        
-                                        if busca_resultado:
-                                            logger.info("EMPRESA ENCONTRADA E SELECIONADA COM SUCESSO!")
-                                            salvar_screenshot(driver, "apos_selecao_empresa.png")
-                                        else:
-                                            logger.warning("Não foi possível encontrar ou selecionar a empresa pelo CNPJ automaticamente.")
-                                            logger.warning("Tentando abordagem alternativa...")
-                                            
-                                            # Pergunta ao usuário se deseja continuar manualmente
-                                            continuar_manual = input("Empresa não encontrada automaticamente. Deseja selecionar manualmente? (s/n): ")
-                                            if continuar_manual.lower() == 's':
-                                                logger.info("Aguardando seleção manual da empresa pelo usuário...")
-                                                input("Selecione a empresa manualmente e pressione ENTER para continuar...")
-                                                logger.info("Continuando após seleção manual da empresa")
-                                            else:
-                                                logger.warning("Processo interrompido pelo usuário após falha na busca por empresa")
-                                                return False
-                                    except ImportError as e:
-                                        logger.error(f"Erro ao importar módulo busca_empresa.py: {e}")
-                                        logger.error("Verifique se o arquivo busca_empresa.py está presente no diretório")
-                                        return False
-                                    except Exception as e:
-                                        logger.error(f"Erro durante a busca de empresa: {e}")
-                                        import traceback
-                                        logger.error(traceback.format_exc())
-                                        
-                                        # Pergunta ao usuário se deseja continuar manualmente
-                                        continuar_manual = input("Erro durante a busca de empresa. Deseja continuar manualmente? (s/n): ")
-                                        if continuar_manual.lower() == 's':
-                                            logger.info("Continuando manualmente após erro...")
-                                        else:
-                                            logger.warning("Processo interrompido pelo usuário após erro")
-                                            return False
-                                    
-                                    # PASSO 10: PREENCHER DADOS DO TOMADOR
-                                    logger.info("Preenchendo dados do tomador com informações do Excel...")
-                                    logger.info(f"CNPJ Tomador: {dados_nota.get('cnpj_tomador', '')[:4]}****{dados_nota.get('cnpj_tomador', '')[-2:]}")
-                                    logger.info(f"Razão Social: {dados_nota.get('razao_social', '')}")
-                                    preenchimento_tomador = preencher_dados_tomador(driver, dados_nota)
-                                    
-                                    if preenchimento_tomador:
-                                        logger.info("DADOS DO TOMADOR PREENCHIDOS COM SUCESSO!")
-                                           # PASSO 11: PREENCHER DADOS DO SERVIÇO
-                                        logger.info("Preenchendo dados do serviço...")
-                                        try:
-                                            # Tenta importar o módulo especializado
-                                            from preencher_dados_servico import preencher_formulario_servico
-                                            
-                                            # Usa a função do módulo especializado passando o logger
-                                            preenchimento_servico = preencher_formulario_servico(driver, dados_nota, logger)
-                                        except ImportError:
-                                            logger.warning("Módulo preencher_dados_servico não encontrado, usando função interna")
-                                            preenchimento_servico = preencher_dados_servico(driver, dados_nota)
-                                        except Exception as e:
-                                            logger.error(f"Erro ao usar módulo especializado: {e}")
-                                            logger.warning("Tentando com a função interna...")
-                                            preenchimento_servico = preencher_dados_servico(driver, dados_nota)
-                                        
-                                        if preenchimento_servico:
-                                            logger.info("DADOS DO SERVIÇO PREENCHIDOS COM SUCESSO!")
-                                            
-                                            # PASSO 12: AVANÇAR NO FLUXO
-                                            logger.info("Tentando avançar para a próxima etapa...")
-                                            avancar_sucesso = procurar_e_clicar_proximo(driver)
-                                            
-                                            if avancar_sucesso:
-                                                logger.info("AVANÇOU COM SUCESSO PARA A PRÓXIMA ETAPA!")
-                                                salvar_screenshot(driver, "formulario_preenchido_avancar.png")
-                                                
-                                                # PASSO 13: PREENCHER TRIBUTOS FEDERAIS
-                                                logger.info("Preenchendo tributos federais (IR, PIS, COFINS, CSLL)...")
-                                                try:
-                                                    # Tenta importar o módulo especializado para tributos
-                                                    from preencher_tributos import preencher_tributos
-                                                    
-                                                    # Verifica se há tributos definidos na nota
-                                                    tem_tributos = any([
-                                                        dados_nota.get('irrf', dados_nota.get('valor_ir', 0)) != 0,
-                                                        dados_nota.get('pis', dados_nota.get('valor_pis', 0)) != 0,
-                                                        dados_nota.get('cofins', dados_nota.get('valor_cofins', 0)) != 0,
-                                                        dados_nota.get('csll', dados_nota.get('valor_csll', 0)) != 0
-                                                    ])
-                                                    
-                                                    # Se tem tributos, preenche os campos
-                                                    if tem_tributos:
-                                                        logger.info("Preenchendo campos de tributos federais...")
-                                                        # Usa a função do módulo especializado passando o logger
-                                                        preenchimento_tributos = preencher_tributos(driver, dados_nota, logger)
-                                                        
-                                                        if preenchimento_tributos:
-                                                            logger.info("TRIBUTOS FEDERAIS PREENCHIDOS COM SUCESSO!")
-                                                        else:
-                                                            logger.warning("Houve problemas ao preencher tributos federais")
-                                                            # Pergunta se deseja continuar mesmo assim
-                                                            continuar_tributos = input("Houve problemas ao preencher os tributos federais. Deseja continuar mesmo assim? (s/n): ")
-                                                            if continuar_tributos.lower() != 's':
-                                                                logger.warning("Processo interrompido pelo usuário após falha nos tributos federais")
-                                                                return
-                                                    else:
-                                                        logger.info("Nota não possui tributos federais para preencher")
-                                                except ImportError:
-                                                    logger.warning("Módulo preencher_tributos não encontrado, pulando essa etapa")
-                                                except Exception as e:
-                                                    logger.error(f"Erro ao preencher tributos federais: {e}")
-                                                    import traceback
-                                                    logger.error(traceback.format_exc())
-                                                    # Pergunta se deseja continuar mesmo assim
-                                                    continuar_tributos = input("Erro ao preencher os tributos federais. Deseja continuar mesmo assim? (s/n): ")
-                                                    if continuar_tributos.lower() != 's':
-                                                        logger.warning("Processo interrompido pelo usuário após erro nos tributos federais")
-                                                        return
-                                                
-                                                salvar_screenshot(driver, "apos_preencher_tributos.png")
-                                                
-                                                # PASSO 14: FINALIZAR EMISSÃO                                                
-                                                logger.info("FORMULÁRIO PREENCHIDO - PRONTO PARA EMISSÃO")
-                                                logger.info("Verifique manualmente se todos os dados estão corretos")
-                                                
-                                                # Pergunta ao usuário se deseja continuar com a emissão
-                                                continuar = input("Todos os dados estão corretos? Pressione ENTER para emitir a nota ou 'n' para cancelar: ")
-                                                if continuar.lower() != 'n':
-                                                    # PASSO 13: Finalizar emissão da nota fiscal
-                                                    logger.info("Finalizando a emissão da nota fiscal...")
-                                                          # Tenta clicar no botão para emitir a nota
-                                                    # Lista de seletores possíveis para o botão Emitir
-                                                    seletores_emitir = [
-                                                        # Seletor exato do HTML problemático
-                                                        "button.__estrutura_componente_base.botao.botao-com-variante.estrutura_botao.disabled_user_select.estrutura_botao_colorido",
-                                                        "button[name='confirmar']",
-                                                        "button[myaccesskey='e']",
-                                                        "button[disabledenableaftersubmit='enable']",
-                                                        
-                                                        # Seletores alternativos
-                                                        "button[name='emitir']", 
-                                                        "button.botao-primario",
-                                                        "button.__estrutura_componente_base.botao.botao-primario", 
-                                                        "button[type='submit']"
-                                                    ]
-                                                    
-                                                    # Tenta clicar usando a função procurar_e_clicar com texto específico
-                                                    emitir_sucesso = procurar_e_clicar(driver, seletores_emitir, texto_botao="Emitir", max_tentativas=3, espera=1)
-                                                    
-                                                    if emitir_sucesso:
-                                                        logger.info("NOTA FISCAL EMITIDA COM SUCESSO!")
-                                                        salvar_screenshot(driver, "nota_emitida.png")
-                                                          # Aguarda um tempo para ter certeza que a página de confirmação carregou
-                                                        logger.info("Aguardando carregamento da página de confirmação...")
-                                                        time.sleep(5)
-                                                          # Determina o próximo número da nota fiscal na sequência
-                                                        logger.info("Determinando próximo número da nota fiscal...")
-                                                        numero_nota = extrair_numero_nota_fiscal(driver, df_excel, linha_excel)
-                                                        
-                                                        if numero_nota:
-                                                            logger.info(f"NÚMERO DA NOTA DETERMINADO: {numero_nota}")
-                                                            
-                                                            # Atualiza o número da nota no Excel
-                                                            logger.info(f"Atualizando Excel com o número da nota: {numero_nota}")
-                                                            atualizacao_sucesso = atualizar_numero_nota_excel(
-                                                                EXCEL_PATH, linha_excel, numero_nota)
-                                                            
-                                                            if atualizacao_sucesso:
-                                                                logger.info("ARQUIVO EXCEL ATUALIZADO COM SUCESSO!")
-                                                            else:
-                                                                logger.error("FALHA AO ATUALIZAR O ARQUIVO EXCEL")
-                                                                logger.error(f"Por favor, atualize manualmente o número da nota {numero_nota} na linha {linha_excel} do Excel")
-                                                        else:
-                                                            logger.warning("Não foi possível extrair o número da nota automaticamente")
-                                                            numero_manual = input("Por favor, informe o número da nota fiscal emitida (deixe em branco para ignorar): ")
-                                                            if numero_manual.strip():
-                                                                logger.info(f"Atualizando Excel com o número informado manualmente: {numero_manual}")
-                                                                atualizacao_sucesso = atualizar_numero_nota_excel(
-                                                                    EXCEL_PATH, linha_excel, numero_manual)
-                                                                if atualizacao_sucesso:
-                                                                    logger.info("ARQUIVO EXCEL ATUALIZADO COM SUCESSO!")
-                                                                else:
-                                                                    logger.error("FALHA AO ATUALIZAR O ARQUIVO EXCEL")
-                                                            else:
-                                                                logger.warning("Nenhum número informado. O Excel não será atualizado.")
-                                                    else:
-                                                        logger.warning("Não foi possível clicar no botão para finalizar a emissão")
-                                                        logger.info("Prossiga manualmente para completar a emissão da nota fiscal")
-                                                else:
-                                                    logger.info("Emissão de nota fiscal cancelada pelo usuário")
-                                                
-                                                logger.info("PROCESSO DE AUTOMAÇÃO CONCLUÍDO PARA ESTA NOTA")
-                                                
-                                                # Pergunta se deseja continuar com próxima nota
-                                                continuar_proxima = input("Deseja processar a próxima nota? (s/n): ")
-                                                if continuar_proxima.lower() != 's':
-                                                    logger.info("Processo interrompido pelo usuário")
-                                                    break
-                                            else:
-                                                logger.warning("Não foi possível avançar automaticamente")
-                                                logger.info("Formulário preenchido - continue manualmente")                                                # Em caso de erro, pergunta se quer tentar a próxima nota
-                                                tentar_proxima = input("Houve erro nesta nota. Deseja tentar a próxima? (s/n): ")
-                                                if tentar_proxima.lower() != 's':
-                                                    break
-                                                    
-        except Exception as e:
-            logger.error(f"Erro durante a automação: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            
-            if 'driver' in locals():
-                salvar_screenshot(driver, "erro_execucao.png")
-                logger.info("Screenshot do erro salvo em logs/imagens/erro_execucao.png")
-                salvar_html(driver, "pagina_erro")
-            
-            logger.error("\nSUGESTÕES PARA RESOLVER O PROBLEMA:")
-            logger.error("1. Certifique-se de que o arquivo .env existe e contém as variáveis necessárias")
-            logger.error("2. Verifique se sua conexão com a internet está estável")
-            logger.error("3. Tente acessar o site manualmente para confirmar que está funcionando")
-              # Em caso de erro, pergunta se quer tentar a próxima nota
-            tentar_proxima = input("Houve erro nesta nota. Deseja tentar a próxima? (s/n): ")
-            if tentar_proxima.lower() != 's':
+                        resultado = emitir_nota(sessao.driver, dados_nota, linha_excel, fila)
+
+            except Exception as e:
+                logger.error(f"Erro durante a automação: {e}")
+                logger.error(traceback.format_exc())
+
+                if sessao.driver is not None:
+                    salvar_screenshot(sessao.driver, "erro_execucao.png")
+                    salvar_html(sessao.driver, "pagina_erro")
+
+                logger.error("\nSUGESTÕES PARA RESOLVER O PROBLEMA:")
+                logger.error("1. Certifique-se de que o arquivo .env existe e contém as variáveis necessárias")
+                logger.error("2. Verifique se sua conexão com a internet está estável")
+                logger.error("3. Tente acessar o site manualmente para confirmar que está funcionando")
+
+            # Nota com falha ou interrompida: grava as últimas etapas ainda no buffer
+            if resultado in ('falha', 'interrompida'):
+                captura.despejar_buffer(resultado)
+            captura.finalizar_nota()
+            # Seletores aprendidos nesta nota gravados de uma vez
+            cache_seletores.salvar()
+            # A planilha é gravada a cada lote de notas, e não a cada nota
+            if diario_excel.lote_completo():
+                gravar_diario_excel(fila)
+            if resultado == 'interrompida':
                 break
-                
-        finally:
-            # Verifica se podemos continuar com a próxima nota sem fechar o navegador
-            continuar_sem_fechar = False
-            
-            if 'driver' in locals() and 'emitir_sucesso' in locals() and emitir_sucesso:
-                try:
-                    # Importa o módulo fora do bloco if para evitar problemas de indentação
-                    import importlib.util
-                    spec = importlib.util.spec_from_file_location("detectar_continuar_emissao", "c:/nfe/detectar_continuar_emissao.py")
-                    modulo_detectar = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(modulo_detectar)
-                    
-                    logger.info("Verificando se podemos continuar automaticamente para a próxima nota...")
-                    continuacao_automatica = modulo_detectar.continuar_emissao_apos_nota(driver)
-                    
-                    if continuacao_automatica:
-                        logger.info("Continuando automaticamente para a próxima nota sem fechar o navegador")
-                        continuar_sem_fechar = True
-                except Exception as e:
-                    logger.error(f"Erro ao tentar continuar para próxima nota: {e}")
-                    continuacao_automatica = False
-            
-            # Se não foi possível continuar automaticamente, fecha o navegador
-            if not continuar_sem_fechar and 'driver' in locals():
-                logger.info("Fechando o navegador após processar nota")
-                driver.quit()
-                logger.info("Navegador fechado")
-                
-        # Recarrega os dados do Excel para capturar possíveis atualizações
-        df_excel = carregar_dados_excel(EXCEL_PATH)
+
+            logger.info("PROCESSO DE AUTOMAÇÃO CONCLUÍDO PARA ESTA NOTA")
+
+            if resultado == 'falha':
+                # Em caso de erro, pergunta se quer tentar a próxima nota
+                tentar_proxima = input("Houve erro nesta nota. Deseja tentar a próxima? (s/n): ")
+                if tentar_proxima.lower() != 's':
+                    break
+            else:
+                # Pergunta se deseja continuar com próxima nota
+                continuar_proxima = input("Deseja processar a próxima nota? (s/n): ")
+                if continuar_proxima.lower() != 's':
+                    logger.info("Processo interrompido pelo usuário")
+                    break
+
+            # Volta ao card 'Emitir Nota Fiscal' mantendo o navegador aberto
+            if sessao.driver is not None and not sessao.retornar_para_emissao():
+                logger.warning("Não foi possível reaproveitar a sessão. Um novo login será feito na próxima nota.")
+    except KeyboardInterrupt:
+        logger.warning("Execução interrompida pelo operador")
+        captura.despejar_buffer("interrompida_operador")
+        raise
+    finally:
+        logger.info(f"Logins realizados nesta execução: {sessao.logins_realizados}")
+        logger.info(f"Leituras da planilha de controle nesta execução: {fila.carregamentos}")
+        # Grava na planilha os números do último lote
+        gravar_diario_excel(fila)
+        sessao.encerrar()
+        cache_seletores.salvar()
+        # Grava as capturas que ainda estão na fila
+        captura.encerrar()
 
 # O fluxo completo de automação implementado é:
 #
-# 1. Inicialização e configuração do navegador
+# 1. Inicialização e configuração do navegador (uma vez por lote)
 # 2. Acesso à página inicial do sistema NFSe
 # 3. Login no sistema com CPF/CNPJ e senha
 # 4. Clicar no botão "Acessar" para entrar na área fiscal
@@ -2595,9 +2600,10 @@ def main():
 # 7. Clicar no botão "Emitir Nota Fiscal" para iniciar o processo de emissão
 # 8. Clicar no botão "Próximo" para avançar no fluxo de emissão
 # 9. Selecionar "Pessoa Jurídica" como tipo do tomador
+# 10. Após cada nota, voltar ao card "Emitir Nota Fiscal" reaproveitando a sessão
 #
 # Cada etapa possui tratamento de erros e capturas de tela para facilitar a depuração.
-# Screenshots são salvos na pasta logs/imagens com nomes descritivos.
+# Screenshots e HTMLs são gravados em segundo plano em logs/capturas/<execução>/<nota>/.
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,179 @@
+"""
+Módulo com a numeração sequencial das notas emitidas.
+
+O último número usado fica num pequeno arquivo de estado (logs/numeracao_notas.json,
+ou o caminho da variável de ambiente NUMERACAO_NOTAS). O estado é semeado uma vez
+por execução a partir do maior número da planilha de controle e avançado de forma
+atômica a cada emissão, sob uma trava de arquivo, para que duas execuções
+simultâneas não reservem o mesmo número. O número reservado é conferido com o
+número exibido na página de confirmação do portal, que prevalece quando diverge.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+# Configuração de logger
+logger = logging.getLogger('numeracao_notas')
+
+# Arquivo padrão do estado (pode ser alterado pela variável de ambiente NUMERACAO_NOTAS)
+ARQUIVO_ESTADO = os.path.join("logs", "numeracao_notas.json")
+
+# Travas de arquivo mais antigas que isso são consideradas abandonadas (segundos)
+VALIDADE_TRAVA = 60
+
+# Padrões do número da nota no texto da página de confirmação
+_PADROES_NUMERO_PAGINA = [
+    re.compile(r'N[úu]mero\s+da\s+NFS-?e\D{0,20}?(\d+)', re.IGNORECASE),
+    re.compile(r'NFS-?e\s+n[º°o.]*\s*(\d+)', re.IGNORECASE),
+    re.compile(r'Nota\s+Fiscal\s+(?:de\s+Servi[çc]os?\s+)?n[º°o.]*\s*(\d+)', re.IGNORECASE),
+]
+
+_trava = threading.Lock()
+_semeado = False
+
+def _arquivo_estado():
+    """Caminho do estado, lido na utilização para respeitar o .env carregado depois da importação."""
+    return os.getenv("NUMERACAO_NOTAS", ARQUIVO_ESTADO)
+
+@contextmanager
+def _trava_arquivo(arquivo, timeout=10):
+    """Trava entre processos baseada na criação exclusiva de um arquivo .lock."""
+    caminho = arquivo + ".lock"
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    limite = time.time() + timeout
+    while True:
+        try:
+            descritor = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(descritor)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(caminho) > VALIDADE_TRAVA:
+                    logger.warning(f"Removendo trava abandonada da numeração: {caminho}")
+                    os.remove(caminho)
+                    continue
+            except OSError:
+                continue
+            if time.time() > limite:
+                raise TimeoutError(f"Numeração de notas travada por outra execução ({caminho})")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+def _ler_estado(arquivo):
+    """Lê o estado do disco ({} se não existir ou for inválido)."""
+    try:
+        with open(arquivo, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Estado da numeração inválido, será semeado novamente: {e}")
+        return {}
+
+def _gravar_estado(arquivo, ultimo_numero):
+    """Grava o estado de forma atômica (arquivo temporário + replace)."""
+    temporario = arquivo + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({"ultimo_numero": ultimo_numero,
+                   "atualizado_em": datetime.now().isoformat(timespec="seconds")}, f, indent=2)
+    os.replace(temporario, arquivo)
+
+def maior_numero_planilha(df):
+    """
+    Retorna o maior número de nota da primeira coluna da planilha.
+
+    Valores numéricos são usados diretamente; textos usam o primeiro grupo de dígitos,
+    como a varredura original fazia.
+
+    Args:
+        df (pd.DataFrame): DataFrame da planilha de controle
+
+    Returns:
+        int: Maior número encontrado, ou 0 se não houver nenhum
+    """
+    if df is None or df.empty:
+        return 0
+    coluna = df.iloc[:, 0].dropna()
+    numeros = pd.to_numeric(coluna, errors="coerce")
+    textos = coluna[numeros.isna()].astype(str).str.extract(r'(\d+)', expand=False)
+    numeros = pd.concat([numeros.dropna(), pd.to_numeric(textos, errors="coerce").dropna()])
+    return int(numeros.max()) if not numeros.empty else 0
+
+def reservar_numero(df=None):
+    """
+    Reserva o próximo número de nota, avançando o estado de forma atômica.
+
+    Na primeira reserva da execução o estado é semeado com o maior número da
+    planilha (se for maior que o guardado), o que cobre numerações lançadas à mão.
+
+    Args:
+        df (pd.DataFrame): DataFrame da planilha de controle (usado apenas para semear)
+
+    Returns:
+        int: Número reservado
+    """
+    global _semeado
+    arquivo = _arquivo_estado()
+    with _trava, _trava_arquivo(arquivo):
+        ultimo = int(_ler_estado(arquivo).get("ultimo_numero", 0))
+        if not _semeado and df is not None:
+            maior = maior_numero_planilha(df)
+            if maior > ultimo:
+                logger.info(f"Numeração semeada pela planilha: último número {maior} (estado tinha {ultimo})")
+                ultimo = maior
+            _semeado = True
+        numero = ultimo + 1
+        _gravar_estado(arquivo, numero)
+    logger.info(f"Número de nota reservado: {numero}")
+    return numero
+
+def corrigir_numero(reservado, confirmado):
+    """
+    Ajusta o estado quando o portal confirmou um número diferente do reservado.
+
+    Args:
+        reservado: Número reservado por `reservar_numero`
+        confirmado: Número exibido na página de confirmação
+    """
+    arquivo = _arquivo_estado()
+    with _trava, _trava_arquivo(arquivo):
+        ultimo = int(_ler_estado(arquivo).get("ultimo_numero", 0))
+        # Se nada foi reservado depois, o confirmado passa a ser o último; senão só pode avançar
+        novo = int(confirmado) if ultimo == int(reservado) else max(ultimo, int(confirmado))
+        _gravar_estado(arquivo, novo)
+    logger.info(f"Numeração ajustada para {novo} (reservado {reservado}, confirmado {confirmado})")
+
+def ler_numero_confirmacao(driver):
+    """
+    Procura o número da nota no texto da página de confirmação.
+
+    Args:
+        driver: WebDriver do Selenium
+
+    Returns:
+        int: Número exibido na página, ou None se não encontrado
+    """
+    try:
+        texto = driver.execute_script("return document.body ? document.body.innerText : '';") or ""
+    except Exception as e:
+        logger.debug(f"Não foi possível ler o texto da página de confirmação: {e}")
+        return None
+    for padrao in _PADROES_NUMERO_PAGINA:
+        encontrado = padrao.search(texto)
+        if encontrado:
+            return int(encontrado.group(1))
+    return None
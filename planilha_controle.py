@@ -0,0 +1,209 @@
+"""
+Módulo com a leitura compartilhada da planilha de controle das notas fiscais.
+
+A leitura com pandas/openpyxl da planilha de controle (anos de histórico, no
+OneDrive) é a parte mais lenta da inicialização da emissão e da automação de
+e-mails. A primeira leitura de cada versão do arquivo guarda a aba já
+interpretada num cache binário colunar em logs/cache_planilha/ (ou na pasta da
+variável de ambiente CACHE_PLANILHA), identificado pela data de modificação e
+pelo tamanho do arquivo. As leituras seguintes, de qualquer um dos scripts,
+usam o cache enquanto a planilha não mudar e carregam apenas as colunas pedidas.
+
+O formato é Feather quando o pyarrow está instalado; caso contrário (ou se a
+planilha tiver colunas que o Feather não aceita) é usado o pickle do pandas.
+
+Quem precisa de poucas colunas e não do DataFrame (a automação de e-mails) usa
+`ler_registros`, que percorre a planilha em modo somente leitura do openpyxl,
+linha a linha, sem montar a aba inteira em memória.
+"""
+import os
+import glob
+import hashlib
+import logging
+import pandas as pd
+
+# Configuração de logger
+logger = logging.getLogger('planilha_controle')
+
+# Pasta padrão do cache (pode ser alterada pela variável de ambiente CACHE_PLANILHA)
+PASTA_CACHE = os.path.join("logs", "cache_planilha")
+
+try:
+    import pyarrow.ipc
+    FEATHER_DISPONIVEL = True
+except ImportError:
+    FEATHER_DISPONIVEL = False
+
+def _pasta_cache():
+    """Pasta do cache, lida na utilização para respeitar o .env carregado depois da importação."""
+    return os.getenv("CACHE_PLANILHA", PASTA_CACHE)
+
+def _prefixo_cache(caminho_excel):
+    """Prefixo dos arquivos de cache de uma planilha (independe da versão)."""
+    identificador = hashlib.sha1(os.path.abspath(caminho_excel).encode("utf-8")).hexdigest()[:12]
+    base = os.path.splitext(os.path.basename(caminho_excel))[0].strip(" _") or "planilha"
+    return os.path.join(_pasta_cache(), f"{base}_{identificador}")
+
+def _chave_versao(caminho_excel):
+    """Identifica a versão da planilha pela data de modificação e pelo tamanho."""
+    estado = os.stat(caminho_excel)
+    return f"{estado.st_mtime_ns}_{estado.st_size}"
+
+def _projetar(df, colunas):
+    """Mantém apenas as colunas pedidas que existem no DataFrame."""
+    if colunas is None:
+        return df
+    return df[[coluna for coluna in colunas if coluna in df.columns]]
+
+def _ler_cache(caminho_cache, colunas):
+    """Lê o cache, carregando apenas as colunas pedidas."""
+    if caminho_cache.endswith(".feather"):
+        if colunas is not None:
+            with pyarrow.ipc.open_file(caminho_cache) as leitor:
+                existentes = set(leitor.schema.names)
+            colunas = [coluna for coluna in colunas if coluna in existentes]
+        return pd.read_feather(caminho_cache, columns=colunas)
+    return _projetar(pd.read_pickle(caminho_cache), colunas)
+
+def _gravar_cache(df, prefixo, versao):
+    """Grava o cache da versão atual e remove os caches de versões anteriores."""
+    os.makedirs(os.path.dirname(prefixo), exist_ok=True)
+    anteriores = glob.glob(f"{glob.escape(prefixo)}_*")
+    destino = None
+    if FEATHER_DISPONIVEL:
+        destino = f"{prefixo}_{versao}.feather"
+        try:
+            df.to_feather(destino + ".tmp")
+        except Exception as e:
+            logger.debug(f"Planilha não pode ser gravada em Feather, usando pickle: {e}")
+            destino = None
+    if destino is None:
+        destino = f"{prefixo}_{versao}.pkl"
+        df.to_pickle(destino + ".tmp", compression=None)
+    os.replace(destino + ".tmp", destino)
+    for anterior in anteriores:
+        if anterior != destino:
+            try:
+                os.remove(anterior)
+            except OSError:
+                pass
+    return destino
+
+def _carregar_do_cache(prefixo, versao, colunas, log):
+    """Carrega a versão informada do cache, ou retorna None se não houver cache válido."""
+    for extensao in (".feather", ".pkl"):
+        caminho_cache = f"{prefixo}_{versao}{extensao}"
+        if os.path.exists(caminho_cache):
+            try:
+                df = _ler_cache(caminho_cache, colunas)
+                log.info(f"Planilha carregada do cache ({os.path.basename(caminho_cache)})")
+                return df
+            except Exception as e:
+                log.warning(f"Cache da planilha inválido, relendo o Excel: {e}")
+    return None
+
+def carregar_planilha(caminho_excel, colunas=None, logger_planilha=None):
+    """
+    Carrega a primeira aba da planilha de controle (cabeçalho na primeira linha).
+
+    Args:
+        caminho_excel: Caminho do arquivo Excel
+        colunas: Lista de colunas a carregar (None para todas). Colunas que não
+            existem na planilha são ignoradas; cabe ao chamador conferir as obtidas
+        logger_planilha: Logger para registro de logs (opcional)
+
+    Returns:
+        pd.DataFrame: Dados da planilha
+    """
+    log = logger_planilha or logger
+    colunas = list(colunas) if colunas is not None else None
+    prefixo = _prefixo_cache(caminho_excel)
+    versao = _chave_versao(caminho_excel)
+
+    df = _carregar_do_cache(prefixo, versao, colunas, log)
+    if df is not None:
+        return df
+
+    df = pd.read_excel(caminho_excel, sheet_name=0, header=0, engine="openpyxl")
+    try:
+        # A versão é conferida de novo para não associar ao cache um arquivo alterado durante a leitura
+        if _chave_versao(caminho_excel) == versao:
+            destino = _gravar_cache(df, prefixo, versao)
+            log.info(f"Cache da planilha atualizado: {os.path.basename(destino)}")
+    except Exception as e:
+        log.warning(f"Não foi possível gravar o cache da planilha: {e}")
+    return _projetar(df, colunas)
+
+def ler_registros(caminho_excel, colunas, logger_planilha=None):
+    """
+    Percorre a primeira aba da planilha devolvendo apenas as colunas pedidas, linha a linha.
+
+    Se houver cache da versão atual da planilha ele é usado; caso contrário a
+    planilha é lida com o openpyxl em modo somente leitura (values_only), sem
+    carregar a aba inteira nem as colunas que não foram pedidas.
+
+    Args:
+        caminho_excel: Caminho do arquivo Excel
+        colunas: Nomes das colunas desejadas, como aparecem no cabeçalho (primeira linha)
+        logger_planilha: Logger para registro de logs (opcional)
+
+    Yields:
+        tuple: Valores das colunas pedidas, na ordem pedida (células vazias como None)
+
+    Raises:
+        ValueError: Se alguma das colunas não existir no cabeçalho
+    """
+    log = logger_planilha or logger
+    colunas = list(colunas)
+
+    df = _carregar_do_cache(_prefixo_cache(caminho_excel), _chave_versao(caminho_excel), colunas, log)
+    if df is not None:
+        faltando = [coluna for coluna in colunas if coluna not in df.columns]
+        if faltando:
+            raise ValueError(f"Coluna(s) {faltando} não encontrada(s) no Excel")
+        df = df[colunas].astype(object)
+        for valores in df.where(df.notna(), None).itertuples(index=False, name=None):
+            if any(valor is not None for valor in valores):
+                yield valores
+        return
+
+    from openpyxl import load_workbook
+    book = load_workbook(caminho_excel, read_only=True, data_only=True)
+    try:
+        linhas = book.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, ())
+        posicoes = {}
+        for posicao, nome in enumerate(cabecalho):
+            # Nomes repetidos: vale a primeira ocorrência, como no pandas
+            if nome is not None:
+                posicoes.setdefault(str(nome), posicao)
+        faltando = [coluna for coluna in colunas if coluna not in posicoes]
+        if faltando:
+            raise ValueError(f"Coluna(s) {faltando} não encontrada(s) no Excel. "
+                             f"Colunas encontradas: {list(posicoes)}")
+        indices = [posicoes[coluna] for coluna in colunas]
+        log.info(f"Lendo a planilha em modo somente leitura ({len(indices)} coluna(s))")
+        for linha in linhas:
+            valores = tuple(linha[i] if i < len(linha) else None for i in indices)
+            if any(valor is not None for valor in valores):
+                yield valores
+    finally:
+        book.close()
+
+def ler_cabecalho(caminho_excel):
+    """
+    Lê apenas o cabeçalho (primeira linha) da primeira aba da planilha.
+
+    Args:
+        caminho_excel: Caminho do arquivo Excel
+
+    Returns:
+        list: Nomes das colunas, como texto (células vazias são ignoradas)
+    """
+    from openpyxl import load_workbook
+    book = load_workbook(caminho_excel, read_only=True, data_only=True)
+    try:
+        cabecalho = next(book.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        book.close()
+    return [str(nome) for nome in cabecalho if nome is not None]
@@ -8,6 +8,13 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementNotInteractableException
 from selenium.webdriver.support.ui import Select
+from esperas import aguardar, aguardar_pagina_estavel, select_com_opcoes
+from localizador_js import localizar_elemento
+from preenchimento import preencher_campo
+import captura
+
+# Seletor do campo de lista de serviços, cujas opções são carregadas após o Local da Prestação
+SELETOR_LISTA_SERVICO = 'select[name="ListaServico.codigo"]'
 
 def formatar_valor_monetario(valor):
     """
@@ -88,41 +95,33 @@ def formatar_valor_monetario(valor):
         except:
             return "0,00"
 
-def simular_digitacao_humana(elemento, texto, pressionar_enter=False, pressionar_tab=False):
+def simular_digitacao_humana(elemento, texto, pressionar_enter=False, pressionar_tab=False, digitar=False):
     """
-    Simula digitação humana inserindo caracteres um a um.
+    Preenche o campo conforme MODO_PREENCHIMENTO: digitação caractere a caractere
+    (modo humano) ou valor definido via JavaScript com eventos (modo rápido).
     
     Args:
         elemento: Elemento web onde será feita a digitação
         texto: Texto a ser digitado
         pressionar_enter: Se True, pressiona a tecla ENTER após digitar
         pressionar_tab: Se True, pressiona a tecla TAB após digitar
+        digitar: Se True, digita caractere a caractere mesmo no modo rápido
     """
-    # Limpa o campo primeiro
-    elemento.clear()
-    
-    # Velocidades de digitação variáveis
-    for caractere in texto:
-        elemento.send_keys(caractere)
-        # Pequena pausa aleatória para simular digitação real
-        time.sleep(random.uniform(0.05, 0.15))
-    
-    # Pausa final após completar a digitação
-    time.sleep(random.uniform(0.2, 0.5))
+    preencher_campo(elemento, texto, digitar=digitar)
     
     from selenium.webdriver.common.keys import Keys
     
     # Se necessário, pressiona a tecla ENTER
     if pressionar_enter:
         elemento.send_keys(Keys.ENTER)
-        # Aguarda o processamento após pressionar ENTER
-        time.sleep(3)
+        # Aguarda o processamento após pressionar ENTER (elemento.parent é o driver)
+        aguardar_pagina_estavel(elemento.parent, timeout=10)
     
     # Se necessário, pressiona a tecla TAB
     if pressionar_tab:
         elemento.send_keys(Keys.TAB)
         # Aguarda o processamento após pressionar TAB
-        time.sleep(1)
+        aguardar_pagina_estavel(elemento.parent, timeout=5)
 
 def simular_colar_texto(elemento, texto):
     """
@@ -183,11 +182,25 @@ def simular_colar_texto(elemento, texto):
 # Mantém a antiga função para compatibilidade
 simular_digitacao_humana_servico = simular_digitacao_humana
 
+def aguardar_opcoes_servico(driver, logger, timeout=15):
+    """
+    Aguarda o campo de serviço receber suas opções após o preenchimento do Local da Prestação.
+    Retorna assim que o select tiver mais de uma opção.
+    
+    Returns:
+        bool: True se as opções foram carregadas, False se o tempo esgotou
+    """
+    if aguardar(driver, select_com_opcoes(SELETOR_LISTA_SERVICO), timeout,
+                descricao="opções do campo de serviço"):
+        logger.info("Opções do campo de serviço carregadas")
+        return True
+    return False
+
 def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
     """
     Preenche o campo de local da prestação do serviço com o código especificado.
-    Após preencher, simula pressionar ENTER e espera 4 segundos para que as opções
-    do campo de serviço sejam carregadas.
+    Após preencher, simula pressionar ENTER e aguarda o campo de serviço receber
+    suas opções (`aguardar_opcoes_servico`), em vez de uma pausa fixa.
     
     Args:
         driver: WebDriver do Selenium
@@ -219,38 +232,21 @@ def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
             'input[class*="local"]'
         ]
         
-        # Primeiro, tenta input
-        campo_local = None
-        for seletor in local_seletores:
-            try:
-                elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
-                if elementos and elementos[0].is_displayed():
-                    campo_local = elementos[0]
-                    logger.info(f"Campo Local da Prestação encontrado com seletor: {seletor}")
-                    break
-            except Exception as e:
-                logger.debug(f"Erro ao procurar campo com seletor {seletor}: {e}")
+        # Se os seletores CSS não encontrarem, tenta por XPath
+        xpath_seletores = [
+            "//label[contains(text(), 'Local')]/following::input[1]",
+            "//label[contains(text(), 'Local')]/following::select[1]",
+            "//th[contains(text(), 'Local')]/following::input[1]",
+            "//div[contains(text(), 'Local')]/following::input[1]",
+            "//span[contains(text(), 'Local')]/following::input[1]",
+            "//*[contains(text(), 'Local da Prestação') or contains(text(), 'Local de Prestação')]/following::input[1]"
+        ]
         
-        # Se não encontrou, tenta por XPath
-        if not campo_local:
-            xpath_seletores = [
-                "//label[contains(text(), 'Local')]/following::input[1]",
-                "//label[contains(text(), 'Local')]/following::select[1]",
-                "//th[contains(text(), 'Local')]/following::input[1]",
-                "//div[contains(text(), 'Local')]/following::input[1]",
-                "//span[contains(text(), 'Local')]/following::input[1]",
-                "//*[contains(text(), 'Local da Prestação') or contains(text(), 'Local de Prestação')]/following::input[1]"
-            ]
-            
-            for xpath in xpath_seletores:
-                try:
-                    elementos = driver.find_elements(By.XPATH, xpath)
-                    if elementos and elementos[0].is_displayed():
-                        campo_local = elementos[0]
-                        logger.info(f"Campo Local da Prestação encontrado com XPath: {xpath}")
-                        break
-                except Exception as e:
-                    logger.debug(f"Erro ao procurar campo com XPath {xpath}: {e}")
+        # O seletor que funcionou na última execução é tentado primeiro
+        campo_local, seletor = localizar_elemento(driver, "campo_local_prestacao",
+                                                  local_seletores + xpath_seletores, logger_busca=logger)
+        if campo_local:
+            logger.info(f"Campo Local da Prestação encontrado com seletor: {seletor}")
         
         if not campo_local:
             logger.warning("Campo Local da Prestação não encontrado, continuando mesmo assim")
@@ -275,8 +271,9 @@ def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
             
             # Preencher o campo com o código especificado e pressionar ENTER
             campo_local.clear()
-            # Usa a versão modificada que pressiona ENTER automaticamente
-            simular_digitacao_humana(campo_local, local_codigo, pressionar_enter=True)
+            # Usa a versão modificada que pressiona ENTER automaticamente. O campo é sempre
+            # digitado, pois o portal só carrega as opções de serviço a partir das teclas
+            simular_digitacao_humana(campo_local, local_codigo, pressionar_enter=True, digitar=True)
             logger.info(f"Local da Prestação preenchido com {local_codigo} e tecla ENTER pressionada")
             
             # Screenshot para verificação
@@ -293,9 +290,7 @@ def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
                 pass
             
             # Aguarda a atualização da página para que as opções de serviço sejam carregadas
-            # Tempo aumentado para garantir carregamento completo
-            time.sleep(5)
-            logger.info("Aguardando 5 segundos para o carregamento completo das opções de serviço")
+            aguardar_opcoes_servico(driver, logger)
             return True
             
         elif tag_name == 'select':
@@ -313,7 +308,7 @@ def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
                     logger.info(f"Local da Prestação selecionado por valor: {local_codigo}")
                     # Dispara evento change para garantir atualização da UI
                     driver.execute_script("arguments[0].dispatchEvent(new Event('change'));", campo_local)
-                    time.sleep(4)  # Aumentado para 4 segundos para garantir carregamento
+                    aguardar_opcoes_servico(driver, logger)
                     return True
                 except:
                     # Tenta selecionar por texto visível
@@ -324,7 +319,7 @@ def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
                                 logger.info(f"Local da Prestação selecionado por texto: {opcao.text}")
                                 # Dispara evento change para garantir atualização da UI
                                 driver.execute_script("arguments[0].dispatchEvent(new Event('change'));", campo_local)
-                                time.sleep(4)  # Aumentado para 4 segundos
+                                aguardar_opcoes_servico(driver, logger)
                                 return True
                     except Exception as e2:
                         logger.warning(f"Erro ao selecionar local por texto: {e2}")
@@ -333,7 +328,7 @@ def preencher_local_prestacao(driver, local_codigo="8561", logger=None):
                 try:
                     driver.execute_script(f"arguments[0].value = '{local_codigo}'; arguments[0].dispatchEvent(new Event('change'));", campo_local)
                     logger.info(f"Local da Prestação selecionado via JavaScript: {local_codigo}")
-                    time.sleep(4)  # Aumentado para 4 segundos
+                    aguardar_opcoes_servico(driver, logger)
                     return True
                 except Exception as e3:
                     logger.error(f"Erro ao selecionar local via JavaScript: {e3}")
@@ -370,9 +365,6 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
     try:
         logger.info(f"Selecionando código de serviço {codigo_servico}...")
         
-        # Aguarda um momento para garantir que a página está pronta após o Local da Prestação
-        time.sleep(2)
-        
         # Seletores possíveis para o campo de código de serviço
         servico_seletores = [
             'select[name="ListaServico.codigo"]',
@@ -457,33 +449,22 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
         try:
             select = Select(campo_servico)
             
-            # Verifica se as opções estão carregadas e espera se necessário
-            tentativas = 0
-            max_tentativas = 8  # Aumentado para dar mais tempo para carregamento
-            
-            while tentativas < max_tentativas:
-                options = select.options
-                if len(options) > 1:  # Tem opções além de "Selecione..."
-                    logger.info(f"Opções de serviço carregadas: {len(options)} opções disponíveis")
-                    break
-                    
-                logger.info(f"Aguardando carregamento das opções do serviço (tentativa {tentativas+1}/{max_tentativas})...")
-                
-                # Adiciona tentativa de reforçar o carregamento das opções
+            # Aguarda as opções (além de "Selecione...") serem carregadas; retorna assim que aparecerem
+            if not aguardar(driver, select_com_opcoes(campo_servico), timeout=6,
+                            descricao="opções do serviço"):
+                # Reforça o carregamento das opções e aguarda mais um pouco
                 try:
-                    if tentativas > 2:  # A partir da terceira tentativa
-                        # Tenta clicar novamente
-                        campo_servico.click()
-                        logger.info("Tentando forçar o carregamento de opções com click adicional")
-                        
-                        # Tenta disparar eventos JavaScript para forçar atualização
-                        driver.execute_script("arguments[0].dispatchEvent(new Event('change'));", campo_servico)
-                        driver.execute_script("arguments[0].dispatchEvent(new Event('focus'));", campo_servico)
+                    campo_servico.click()
+                    logger.info("Tentando forçar o carregamento de opções com click adicional")
+                    
+                    # Tenta disparar eventos JavaScript para forçar atualização
+                    driver.execute_script("arguments[0].dispatchEvent(new Event('change'));", campo_servico)
+                    driver.execute_script("arguments[0].dispatchEvent(new Event('focus'));", campo_servico)
                 except:
                     pass
-                
-                time.sleep(2)
-                tentativas += 1
+                aguardar(driver, select_com_opcoes(campo_servico), timeout=10,
+                         descricao="opções do serviço após reforço")
+            logger.info(f"Opções de serviço carregadas: {len(select.options)} opções disponíveis")
             
             # Salva screenshot para verificar estado do dropdown
             salvar_screenshot_servico(driver, "dropdown_servico.png", logger)
@@ -500,7 +481,7 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
             try:
                 select.select_by_value(codigo_servico)
                 logger.info(f"Código de serviço selecionado por valor: {codigo_servico}")
-                time.sleep(1)
+                aguardar_pagina_estavel(driver, timeout=5)
                 
                 # Salva screenshot após seleção bem-sucedida
                 salvar_screenshot_servico(driver, "servico_selecionado_por_valor.png", logger)
@@ -514,7 +495,7 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
                         if codigo_servico in opcao.text:
                             select.select_by_visible_text(opcao.text)
                             logger.info(f"Código de serviço selecionado por texto: {opcao.text}")
-                            time.sleep(1)
+                            aguardar_pagina_estavel(driver, timeout=5)
                             
                             # Salva screenshot após seleção bem-sucedida
                             salvar_screenshot_servico(driver, "servico_selecionado_por_texto_exato.png", logger)
@@ -534,7 +515,7 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
                             if texto.lower() in opcao.text.lower():
                                 select.select_by_visible_text(opcao.text)
                                 logger.info(f"Código de serviço selecionado pelo texto parcial: '{texto}' em '{opcao.text}'")
-                                time.sleep(1)
+                                aguardar_pagina_estavel(driver, timeout=5)
                                 
                                 # Salva screenshot após seleção bem-sucedida
                                 salvar_screenshot_servico(driver, "servico_selecionado_por_texto_parcial.png", logger)
@@ -544,7 +525,7 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
                     if len(select.options) > 1:
                         select.select_by_index(1)  # Seleciona a segunda opção (índice 1)
                         logger.info(f"Selecionou a primeira opção disponível: {select.options[1].text}")
-                        time.sleep(1)
+                        aguardar_pagina_estavel(driver, timeout=5)
                         
                         # Salva screenshot após seleção bem-sucedida
                         salvar_screenshot_servico(driver, "servico_selecionado_primeira_opcao.png", logger)
@@ -557,7 +538,7 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
             try:
                 driver.execute_script(f"arguments[0].value = '{codigo_servico}'; arguments[0].dispatchEvent(new Event('change'));", campo_servico)
                 logger.info(f"Código de serviço selecionado via JavaScript: {codigo_servico}")
-                time.sleep(1)
+                aguardar_pagina_estavel(driver, timeout=5)
                 
                 # Salva screenshot após seleção via JavaScript
                 salvar_screenshot_servico(driver, "servico_selecionado_javascript.png", logger)
@@ -571,7 +552,7 @@ def preencher_codigo_servico(driver, codigo_servico="1701", logger=None):
                     time.sleep(0.5)
                     select.select_by_index(1)  # Seleciona a segunda opção
                     logger.info("Selecionou a segunda opção como último recurso")
-                    time.sleep(1)
+                    aguardar_pagina_estavel(driver, timeout=5)
                     
                     # Salva screenshot após seleção por índice
                     salvar_screenshot_servico(driver, "servico_selecionado_ultimo_recurso.png", logger)
@@ -631,34 +612,18 @@ def preencher_valor_servico(driver, dados_nota, logger=None):
             'input.valor-servico'
         ]
         
-        # Tenta encontrar o campo de valor do serviço
-        campo_valor = None
-        for seletor in valor_seletores:
-            try:
-                elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
-                if elementos:
-                    campo_valor = elementos[0]
-                    logger.info(f"Campo valor do serviço encontrado com seletor: {seletor}")
-                    break
-            except Exception as e:
-                logger.debug(f"Erro ao procurar campo valor com seletor {seletor}: {e}")
+        # Se os seletores CSS não encontrarem, tenta por XPath
+        xpath_seletores = [
+            "//label[contains(text(), 'Valor')]/following::input[1]",
+            "//th[contains(text(), 'Valor')]/following::input[1]"
+        ]
         
-        # Se não encontrou, tenta por XPath
-        if not campo_valor:
-            xpath_seletores = [
-                "//label[contains(text(), 'Valor')]/following::input[1]",
-                "//th[contains(text(), 'Valor')]/following::input[1]"
-            ]
-            
-            for xpath in xpath_seletores:
-                try:
-                    elementos = driver.find_elements(By.XPATH, xpath)
-                    if elementos:
-                        campo_valor = elementos[0]
-                        logger.info(f"Campo valor do serviço encontrado com XPath: {xpath}")
-                        break
-                except Exception as e:
-                    logger.debug(f"Erro ao procurar campo valor com XPath {xpath}: {e}")
+        # Tenta encontrar o campo de valor do serviço, começando pelo seletor que funcionou por último
+        campo_valor, seletor = localizar_elemento(driver, "campo_valor_servico",
+                                                  valor_seletores + xpath_seletores,
+                                                  requisito="existente", logger_busca=logger)
+        if campo_valor:
+            logger.info(f"Campo valor do serviço encontrado com seletor: {seletor}")
         
         if not campo_valor:
             logger.error("Campo de valor do serviço não encontrado")
@@ -869,7 +834,7 @@ def preencher_dados_servico(driver, dados_nota, logger=None):
         logger.info("Iniciando preenchimento dos dados do serviço...")
         
         # Aguarda a página carregar
-        time.sleep(2)
+        aguardar_pagina_estavel(driver, timeout=15)
         
         # 1. Preencher Local da Prestação com "8561"
         local_ok = preencher_local_prestacao(driver, "8561", logger)
@@ -946,29 +911,15 @@ def preencher_formulario_tributos(driver, dados_nota, logger=None):
     
 def salvar_screenshot_servico(driver, nome_arquivo, logger=None):
     """
-    Salva um screenshot na pasta de logs
+    Agenda um screenshot na pasta de capturas da nota atual
     
     Args:
         driver: WebDriver do Selenium
         nome_arquivo: Nome do arquivo para salvar
-        logger: Logger para registro de logs (opcional)
+        logger: Logger para registro de logs (opcional, mantido por compatibilidade)
         
     Returns:
-        bool: True se salvou com sucesso, False caso contrário
+        bool: True se a captura foi agendada, False caso contrário (erro ou nível de captura)
     """
-    if logger is None:
-        logger = logging.getLogger('preencher_servico')
-        
-    try:
-        import os
-        pasta_screenshots = "logs/imagens"
-        # Garante que a pasta existe
-        os.makedirs(pasta_screenshots, exist_ok=True)
-        
-        caminho_completo = os.path.join(pasta_screenshots, nome_arquivo)
-        driver.save_screenshot(caminho_completo)
-        logger.info(f"Screenshot salvo em {caminho_completo}")
-        return True
-    except Exception as e:
-        logger.error(f"Erro ao salvar screenshot {nome_arquivo}: {e}")
-        return False
+    # A gravação é feita em segundo plano pelo pipeline de capturas
+    return captura.capturar_screenshot(driver, nome_arquivo) is not None
@@ -1,10 +1,17 @@
 import time
 import logging
+from decimal import Decimal
 import pandas as pd
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from esperas import aguardar_pagina_estavel
+import cache_seletores
+from localizador_js import localizar_campos, localizar_elemento
+from preenchimento import MODO_RAPIDO, modo_preenchimento, preencher_campos
+import captura
+import tributos_federais
 
 def formatar_valor_monetario(valor):
     """
@@ -152,32 +159,28 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
         logger.info(f"COFINS: {valor_cofins}")
         logger.info(f"CSLL: {valor_csll}")
         
-        # Calcula a soma dos tributos para conferência posterior
-        def converter_para_float(valor_texto):
+        # Calcula a soma dos tributos para conferência posterior (em Decimal, sem erro de arredondamento)
+        def converter_para_decimal(valor_texto):
             try:
-                if isinstance(valor_texto, str):
-                    return float(valor_texto.replace(".", "").replace(",", "."))
-                elif isinstance(valor_texto, (int, float)):
-                    return float(valor_texto)
-                return 0.0
-            except:
-                return 0.0
+                return tributos_federais.para_decimal(valor_texto) or Decimal('0')
+            except ValueError:
+                return Decimal('0')
         
         total_tributos = (
-            converter_para_float(valor_ir) + 
-            converter_para_float(valor_pis) + 
-            converter_para_float(valor_cofins) + 
-            converter_para_float(valor_csll)
+            converter_para_decimal(valor_ir) + 
+            converter_para_decimal(valor_pis) + 
+            converter_para_decimal(valor_cofins) + 
+            converter_para_decimal(valor_csll)
         )
-        logger.info(f"Total de tributos calculado: {total_tributos:.2f}")
+        logger.info(f"Total de tributos calculado: {tributos_federais.formatar_decimal(total_tributos)}")
         
         # Valor bruto do serviço
-        valor_servico = converter_para_float(dados_nota.get('valor_servico', dados_nota.get('valor_bruto', 0)))
-        logger.info(f"Valor bruto do serviço: {valor_servico:.2f}")
+        valor_servico = converter_para_decimal(dados_nota.get('valor_servico', dados_nota.get('valor_bruto', 0)))
+        logger.info(f"Valor bruto do serviço: {tributos_federais.formatar_decimal(valor_servico)}")
         
         # Calcula o valor líquido esperado (valor serviço - tributos)
         valor_liquido_calculado_internamente = valor_servico - total_tributos
-        logger.info(f"Valor líquido calculado internamente: {valor_liquido_calculado_internamente:.2f}")
+        logger.info(f"Valor líquido calculado internamente: {tributos_federais.formatar_decimal(valor_liquido_calculado_internamente)}")
         
         # Procura pela página ou seção de tributos federais
         # Verifica se já está na tela correta ou precisa clicar em algum botão
@@ -190,14 +193,11 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                 'input[placeholder*="IR"], input[placeholder*="PIS"], input[placeholder*="COFINS"], input[placeholder*="CSLL"]'
             ]
             
-            # Verifica todos os seletores para campos de tributos
-            campos_visiveis = []
-            for seletor in campos_tributos_seletores:
-                campos_pre_verificacao = driver.find_elements(By.CSS_SELECTOR, seletor)
-                campos_visiveis.extend([c for c in campos_pre_verificacao if c.is_displayed()])
-                if campos_visiveis:
-                    logger.info(f"Campos de tributos encontrados com seletor: {seletor}")
-                    break
+            # Verifica todos os seletores para campos de tributos numa única chamada
+            campo_visivel, seletor = localizar_elemento(driver, None, campos_tributos_seletores, logger_busca=logger)
+            campos_visiveis = [campo_visivel] if campo_visivel else []
+            if campos_visiveis:
+                logger.info(f"Campos de tributos encontrados com seletor: {seletor}")
             
             if not campos_visiveis:
                 logger.info("Nenhum campo de tributo visível, tentando encontrar botão para avançar...")
@@ -211,7 +211,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                     "//span[contains(text(), 'Tributos')]"
                 ]
                 
-                for xpath_aba in abas_tributos:
+                for xpath_aba in cache_seletores.ordenar("aba_tributos", abas_tributos):
                     elementos = driver.find_elements(By.XPATH, xpath_aba)
                     elementos_visiveis = [e for e in elementos if e.is_displayed() and e.is_enabled()]
                     
@@ -219,17 +219,14 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                         logger.info(f"Encontrou aba de tributos: {xpath_aba}")
                         try:
                             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elementos_visiveis[0])
-                            time.sleep(1)
                             driver.execute_script("arguments[0].click();", elementos_visiveis[0])
                             logger.info("Clicou na aba de tributos")
-                            time.sleep(3)  # Aguarda a atualização da UI
+                            cache_seletores.registrar_acerto("aba_tributos", xpath_aba)
+                            aguardar_pagina_estavel(driver, timeout=15)  # Aguarda a atualização da UI
                             
                             # Verifica novamente os campos após clicar na aba
-                            for seletor in campos_tributos_seletores:
-                                campos = driver.find_elements(By.CSS_SELECTOR, seletor)
-                                campos_visiveis = [c for c in campos if c.is_displayed()]
-                                if campos_visiveis:
-                                    break
+                            campo_visivel, _ = localizar_elemento(driver, None, campos_tributos_seletores, logger_busca=logger)
+                            campos_visiveis = [campo_visivel] if campo_visivel else []
                                     
                             if campos_visiveis:
                                 logger.info("Campos de tributos encontrados após clicar na aba")
@@ -258,7 +255,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                     ]
                     
                     botao_encontrado = False
-                    for xpath_botao in botoes_proxima_etapa:
+                    for xpath_botao in cache_seletores.ordenar("botao_avancar_tributos", botoes_proxima_etapa):
                         botoes = driver.find_elements(By.XPATH, xpath_botao)
                         botoes_visiveis = [b for b in botoes if b.is_displayed() and b.is_enabled()]
                         
@@ -267,7 +264,6 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                             try:
                                 # Scroll para o botão ficar visível
                                 driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", botoes_visiveis[0])
-                                time.sleep(1)
                                 
                                 # Tenta diferentes formas de clicar no botão
                                 try:
@@ -283,8 +279,8 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                                 pre_url = driver.current_url
                                 pre_html = driver.page_source[:100]  # Só uma pequena amostra para comparação
                                 
-                                # Aguarda mais tempo para a página carregar
-                                time.sleep(5)
+                                # Aguarda a página reagir ao clique
+                                aguardar_pagina_estavel(driver, timeout=20)
                                 
                                 # Verifica se houve alguma mudança na página
                                 pos_url = driver.current_url
@@ -300,18 +296,15 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                                         actions = ActionChains(driver)
                                         actions.move_to_element(botoes_visiveis[0]).click().perform()
                                         logger.info("Tentativa de clique via ActionChains")
-                                        time.sleep(5)
+                                        aguardar_pagina_estavel(driver, timeout=20)
                                     except Exception as e_action:
                                         logger.warning(f"Erro na tentativa ActionChains: {e_action}")
                                 
                                 botao_encontrado = True
+                                cache_seletores.registrar_acerto("botao_avancar_tributos", xpath_botao)
                                 
                                 # Salva um screenshot após avançar
-                                try:
-                                    driver.save_screenshot("logs/imagens/apos_avanco_tributos.png")
-                                    logger.info("Screenshot salvo após avançar para os tributos")
-                                except Exception as e_ss:
-                                    logger.debug(f"Erro ao salvar screenshot: {e_ss}")
+                                captura.capturar_screenshot(driver, "apos_avanco_tributos.png")
                                     
                                 break
                             except Exception as e:
@@ -350,7 +343,6 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                                 logger.info(f"Encontrados {len(botoes_possiveis)} botões possíveis de avançar")
                                 # Clica no primeiro botão possível
                                 driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", botoes_possiveis[0])
-                                time.sleep(1)
                                 
                                 # Tenta três métodos de clique
                                 try:
@@ -370,14 +362,10 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                                         logger.info("Clicou em botão genérico para avançar (via ActionChains)")
                                 
                                 # Aguarda carregamento
-                                time.sleep(5)
+                                aguardar_pagina_estavel(driver, timeout=20)
                                 
                                 # Salva screenshot
-                                try:
-                                    driver.save_screenshot("logs/imagens/apos_clique_generico.png")
-                                    logger.info("Screenshot salvo após clique em botão genérico")
-                                except:
-                                    pass
+                                captura.capturar_screenshot(driver, "apos_clique_generico.png")
                             except Exception as e:
                                 logger.warning(f"Erro ao clicar em botão genérico: {e}")
             else:
@@ -385,8 +373,8 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
         except Exception as e:
             logger.debug(f"Erro ao procurar botão para avançar para os tributos: {e}")
             
-        # Aguarda um momento extra para garantir que qualquer evento JavaScript seja completado
-        time.sleep(5)  # Aumentado de 3 para 5 segundos para garantir carregamento completo
+        # Aguarda qualquer evento JavaScript pendente ser completado (jQuery inativo e DOM estável)
+        aguardar_pagina_estavel(driver, timeout=20)
           
         # Verifica se existem iframes que possam conter os campos de tributos
         frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -394,15 +382,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
             logger.info(f"Encontrados {len(frames)} iframes na página, verificando se contêm campos de tributos")
             
             # Salva o HTML atual para diagnóstico
-            try:
-                html_content = driver.page_source
-                import os
-                os.makedirs("logs/html", exist_ok=True)
-                with open("logs/html/antes_verificacao_iframe.html", "w", encoding="utf-8") as f:
-                    f.write(html_content)
-                logger.info("HTML salvo antes da verificação de iframes")
-            except Exception as e_html:
-                logger.debug(f"Erro ao salvar HTML: {e_html}")
+            captura.capturar_html(driver, "antes_verificacao_iframe")
             
             # Guarda o contexto principal
             driver.switch_to.default_content()  # Garante que estamos na página principal
@@ -415,6 +395,11 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                 'input[id*="irrf"], input[id*="pis"], input[id*="cofins"], input[id*="csll"]',
                 'input[aria-label*="IR"], input[aria-label*="PIS"], input[aria-label*="COFINS"], input[aria-label*="CSLL"]'
             ]
+            campo_seletores_iframe = campo_seletores_css + [
+                "//input[contains(@name, 'IR') or contains(@name, 'PIS') or contains(@name, 'COFINS') or contains(@name, 'CSLL')]",
+                "//input[contains(@id, 'IR') or contains(@id, 'PIS') or contains(@id, 'COFINS') or contains(@id, 'CSLL')]",
+                "//input[contains(@name, 'irrf') or contains(@name, 'pis') or contains(@name, 'cofins') or contains(@name, 'csll')]"
+            ]
             
             # Tenta cada iframe
             for i, frame in enumerate(frames):
@@ -433,42 +418,14 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                     # Tenta mudar para o iframe
                     driver.switch_to.frame(frame)
                     
-                    # Verifica se o iframe contém campos de tributos usando múltiplos seletores
-                    campos_encontrados = False
-                    for seletor in campo_seletores_css:
-                        campos_teste = driver.find_elements(By.CSS_SELECTOR, seletor)
-                        campos_visiveis = [c for c in campos_teste if c.is_displayed()]
-                        
-                        if campos_visiveis:
-                            logger.info(f"Campos de tributos encontrados no iframe {i+1} usando seletor: {seletor}")
-                            campos_encontrados = True
-                            break
-                    
-                    # Se não encontrou com CSS, tenta com XPath
-                    if not campos_encontrados:
-                        xpath_seletores = [
-                            "//input[contains(@name, 'IR') or contains(@name, 'PIS') or contains(@name, 'COFINS') or contains(@name, 'CSLL')]",
-                            "//input[contains(@id, 'IR') or contains(@id, 'PIS') or contains(@id, 'COFINS') or contains(@id, 'CSLL')]",
-                            "//input[contains(@name, 'irrf') or contains(@name, 'pis') or contains(@name, 'cofins') or contains(@name, 'csll')]"
-                        ]
-                        
-                        for xpath in xpath_seletores:
-                            elementos = driver.find_elements(By.XPATH, xpath)
-                            elementos_visiveis = [e for e in elementos if e.is_displayed()]
-                            
-                            if elementos_visiveis:
-                                logger.info(f"Campos de tributos encontrados no iframe {i+1} usando XPath: {xpath}")
-                                campos_encontrados = True
-                                break
+                    # Verifica se o iframe contém campos de tributos (CSS e XPath numa única chamada)
+                    campo_iframe, seletor = localizar_elemento(driver, None, campo_seletores_iframe, logger_busca=logger)
+                    campos_encontrados = campo_iframe is not None
+                    if campos_encontrados:
+                        logger.info(f"Campos de tributos encontrados no iframe {i+1} usando seletor: {seletor}")
                     
-                    # Para diagnóstico, captura o HTML do iframe atual
-                    try:
-                        iframe_html = driver.page_source
-                        with open(f"logs/html/iframe_{i+1}.html", "w", encoding="utf-8") as f:
-                            f.write(iframe_html)
-                        logger.info(f"HTML do iframe {i+1} salvo para análise")
-                    except Exception as e_iframe_html:
-                        logger.debug(f"Erro ao salvar HTML do iframe {i+1}: {e_iframe_html}")
+                    # Para diagnóstico, captura o HTML do iframe atual (apenas no nível "todos")
+                    captura.capturar_html(driver, f"iframe_{i+1}")
                     
                     # Se encontrou campos, mantém o contexto neste iframe e interrompe o loop
                     if campos_encontrados:
@@ -487,11 +444,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                         pass
             
             # Salva screenshot após verificação de iframes
-            try:
-                driver.save_screenshot("logs/imagens/verificacao_iframes.png")
-                logger.info("Screenshot salvo após verificação de iframes")
-            except:
-                pass
+            captura.capturar_screenshot(driver, "verificacao_iframes.png")
         
         # Mapeamento dos campos de tributos federais com seletores mais abrangentes
         campos_tributos = {
@@ -517,146 +470,68 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
             }
         }
         
-        # Tenta encontrar todos os campos antes de preencher
-        campos_encontrados = {}
-        for nome_campo, config in campos_tributos.items():
-            try:
-                # Expande os seletores para aumentar a chance de encontrar o campo
-                seletores_expandidos = config['seletor'].split(', ')
-                
-                for seletor in seletores_expandidos:
-                    elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
-                    elementos_visiveis = []
-                    
-                    # Verifica quais elementos estão realmente visíveis
-                    for elem in elementos:
-                        try:
-                            if elem.is_displayed() and elem.is_enabled():
-                                elementos_visiveis.append(elem)
-                        except:
-                            pass
-                            
-                    if elementos_visiveis:
-                        campos_encontrados[nome_campo] = elementos_visiveis[0]
-                        logger.info(f"Campo {nome_campo} encontrado com seletor: {seletor}")
-                        break
-            except Exception as e:
-                logger.debug(f"Erro ao procurar campo {nome_campo}: {e}")
-                
-        # Se não encontrou por CSS, tenta por XPath com expressões mais abrangentes
-        if not campos_encontrados or len(campos_encontrados) < len(campos_tributos):
-            xpath_campos = {
-                'IR': [
-                    "//label[contains(text(), 'IR') or contains(text(), 'IRRF') or contains(text(), 'Imposto de Renda')]/following::input[1]",
-                    "//span[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]",
-                    "//div[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]",
-                    "//td[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]",
-                    "//th[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]"
-                ],
-                'PIS': [
-                    "//label[contains(text(), 'PIS')]/following::input[1]",
-                    "//span[contains(text(), 'PIS')]/following::input[1]",
-                    "//div[contains(text(), 'PIS')]/following::input[1]",
-                    "//td[contains(text(), 'PIS')]/following::input[1]",
-                    "//th[contains(text(), 'PIS')]/following::input[1]"
-                ],
-                'COFINS': [
-                    "//label[contains(text(), 'COFINS')]/following::input[1]",
-                    "//span[contains(text(), 'COFINS')]/following::input[1]",
-                    "//div[contains(text(), 'COFINS')]/following::input[1]",
-                    "//td[contains(text(), 'COFINS')]/following::input[1]",
-                    "//th[contains(text(), 'COFINS')]/following::input[1]"
-                ],
-                'CSLL': [
-                    "//label[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
-                    "//span[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
-                    "//div[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
-                    "//td[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
-                    "//th[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]"
-                ]
-            }
-            
-            for nome_campo, xpaths in xpath_campos.items():
-                if nome_campo not in campos_encontrados:
-                    for xpath in xpaths:
-                        try:
-                            elementos = driver.find_elements(By.XPATH, xpath)
-                            elementos_visiveis = [e for e in elementos if e.is_displayed()]
-                            if elementos_visiveis:
-                                campos_encontrados[nome_campo] = elementos_visiveis[0]
-                                logger.info(f"Campo {nome_campo} encontrado com XPath: {xpath}")
-                                break
-                        except Exception as e:
-                            logger.debug(f"Erro ao procurar campo {nome_campo} por XPath {xpath}: {e}")
-        
-        # Tentativa adicional: buscar por inputs numéricos na ordem esperada
-        if not campos_encontrados or len(campos_encontrados) < len(campos_tributos):
-            logger.info("Tentando estratégia alternativa: buscar por inputs numéricos")
-            
-            # Busca todos os inputs que aceitam números
-            inputs_numericos = driver.find_elements(By.CSS_SELECTOR, 
-                'input[type="number"], input[type="text"], input:not([type])')
-            
-            # Filtra apenas os visíveis e habilitados
-            inputs_visiveis = []
-            for inp in inputs_numericos:
-                try:
-                    if inp.is_displayed() and inp.is_enabled() and inp not in campos_encontrados.values():
-                        # Verifica se não é um campo que já sabemos que tem outra função
-                        placeholder = inp.get_attribute("placeholder") or ""
-                        name = inp.get_attribute("name") or ""
-                        if not ("valor serv" in placeholder.lower() or 
-                               "liquido" in placeholder.lower() or
-                               "valor serv" in name.lower() or
-                               "liquido" in name.lower()):
-                            inputs_visiveis.append(inp)
-                except:
-                    pass
-            
-            # Se houver inputs suficientes, assume-se que estão na ordem: IR, PIS, COFINS, CSLL
-            nomes_campos = ["IR", "PIS", "COFINS", "CSLL"]
-            if len(inputs_visiveis) >= len(nomes_campos):
-                logger.info(f"Encontrados {len(inputs_visiveis)} inputs numéricos visíveis")
-                
-                # Preenche os campos não encontrados anteriormente
-                for i, nome in enumerate(nomes_campos):
-                    if nome not in campos_encontrados and i < len(inputs_visiveis):
-                        campos_encontrados[nome] = inputs_visiveis[i]
-                        logger.info(f"Campo {nome} associado a input numérico pela posição")
+        # XPaths baseados nos rótulos, usados quando os seletores CSS não encontram o campo
+        xpath_campos = {
+            'IR': [
+                "//label[contains(text(), 'IR') or contains(text(), 'IRRF') or contains(text(), 'Imposto de Renda')]/following::input[1]",
+                "//span[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]",
+                "//div[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]",
+                "//td[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]",
+                "//th[contains(text(), 'IR') or contains(text(), 'IRRF')]/following::input[1]"
+            ],
+            'PIS': [
+                "//label[contains(text(), 'PIS')]/following::input[1]",
+                "//span[contains(text(), 'PIS')]/following::input[1]",
+                "//div[contains(text(), 'PIS')]/following::input[1]",
+                "//td[contains(text(), 'PIS')]/following::input[1]",
+                "//th[contains(text(), 'PIS')]/following::input[1]"
+            ],
+            'COFINS': [
+                "//label[contains(text(), 'COFINS')]/following::input[1]",
+                "//span[contains(text(), 'COFINS')]/following::input[1]",
+                "//div[contains(text(), 'COFINS')]/following::input[1]",
+                "//td[contains(text(), 'COFINS')]/following::input[1]",
+                "//th[contains(text(), 'COFINS')]/following::input[1]"
+            ],
+            'CSLL': [
+                "//label[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
+                "//span[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
+                "//div[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
+                "//td[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]",
+                "//th[contains(text(), 'CSLL') or contains(text(), 'Contribuição') or contains(text(), 'Social')]/following::input[1]"
+            ]
+        }
+
+        # Localiza os quatro campos numa única chamada ao navegador: seletores CSS e XPath
+        # de cada tributo (na ordem do cache de seletores), depois inputs numéricos pela
+        # posição esperada (IR, PIS, COFINS, CSLL) e, por último, inputs hidden pelo nome/id
+        localizados = localizar_campos(
+            driver,
+            {nome: config['seletor'].split(', ') + xpath_campos.get(nome, [])
+             for nome, config in campos_tributos.items()},
+            requisito="habilitado",
+            prefixo_cache="tributo_",
+            posicionais={"campos": ["IR", "PIS", "COFINS", "CSLL"],
+                         "excluir": ["valor serv", "liquido"]},
+            ocultos={"IR": ["ir", "irrf"], "PIS": ["pis"], "COFINS": ["cofins"],
+                     "CSLL": ["csll", "contribuicao", "social"]},
+            logger_busca=logger
+        )
         
-        # Verifica se algum campo é um input hidden
-        if not campos_encontrados or len(campos_encontrados) < len(campos_tributos):
-            logger.info("Verificando inputs hidden que possam ser campos de tributos")
-            hidden_inputs = driver.find_elements(By.CSS_SELECTOR, 'input[type="hidden"]')
-            
-            nomes_campos = ["IR", "PIS", "COFINS", "CSLL"]
-            for inp in hidden_inputs:
-                try:
-                    nome = inp.get_attribute("name") or ""
-                    id = inp.get_attribute("id") or ""
-                    nome_lower = nome.lower()
-                    id_lower = id.lower()
-                    
-                    for campo in nomes_campos:
-                        campo_lower = campo.lower()
-                        if campo not in campos_encontrados and (
-                            campo_lower in nome_lower or 
-                            campo_lower in id_lower or
-                            (campo == "IR" and ("irrf" in nome_lower or "irrf" in id_lower)) or
-                            (campo == "CSLL" and ("contribuicao" in nome_lower or "social" in id_lower or 
-                                                "contribuicao" in id_lower or "social" in id_lower))
-                        ):
-                            campos_encontrados[campo] = inp
-                            logger.info(f"Campo {campo} encontrado como input hidden")
-                except:
-                    pass
+        campos_encontrados = {}
+        for nome_campo, (elemento, origem) in localizados.items():
+            if elemento is None:
+                continue
+            campos_encontrados[nome_campo] = elemento
+            if origem == "posicional":
+                logger.info(f"Campo {nome_campo} associado a input numérico pela posição")
+            elif origem == "oculto":
+                logger.info(f"Campo {nome_campo} encontrado como input hidden")
+            else:
+                logger.info(f"Campo {nome_campo} encontrado com seletor: {origem}")
         
         # Salva um screenshot para diagnóstico dos campos encontrados
-        try:
-            driver.save_screenshot("logs/imagens/campos_tributos_encontrados.png")
-            logger.info("Screenshot salvo em logs/imagens/campos_tributos_encontrados.png")
-        except:
-            pass
+        captura.capturar_screenshot(driver, "campos_tributos_encontrados.png")
                 
         if not campos_encontrados:
             logger.warning("Nenhum dos campos de tributos federais foi encontrado. Verifique se está na tela correta.")
@@ -669,12 +544,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                 logger.info(f"URL atual: {current_url}")
                 
                 # Salva o HTML da página para análise
-                html_content = driver.page_source
-                import os
-                os.makedirs("logs/html", exist_ok=True)
-                with open("logs/html/pagina_tributos.html", "w", encoding="utf-8") as f:
-                    f.write(html_content)
-                logger.info("HTML da página salvo em logs/html/pagina_tributos.html")
+                captura.capturar_html(driver, "pagina_tributos", erro=True)
                 
                 # Verifica se existem mensagens de erro visíveis na página
                 mensagens_erro = driver.find_elements(By.XPATH, "//*[contains(text(), 'erro') or contains(text(), 'Erro') or contains(text(), 'falha') or contains(text(), 'Falha')]")
@@ -699,7 +569,18 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
         # Agora preenche os campos encontrados
         from selenium.webdriver.common.keys import Keys
         
-        for nome_campo, elemento in campos_encontrados.items():
+        campos_para_digitar = campos_encontrados
+        if modo_preenchimento() == MODO_RAPIDO:
+            # Modo rápido: os tributos são definidos numa única chamada, com os eventos
+            # input/change/blur que disparam o recálculo do valor líquido no portal
+            preencher_campos(driver, [
+                {'nome': nome_campo, 'elemento': elemento,
+                 'valor': campos_tributos[nome_campo]['valor'] or '0,00'}
+                for nome_campo, elemento in campos_encontrados.items()
+            ], logger)
+            campos_para_digitar = {}
+        
+        for nome_campo, elemento in campos_para_digitar.items():
             valor = campos_tributos[nome_campo]['valor']
             if valor is None or valor == '':
                 valor = '0,00'
@@ -731,7 +612,6 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                         elemento.send_keys(Keys.TAB)  # Pressiona TAB para perder o foco
                     
                     logger.info(f"Campo {nome_campo} preenchido com: {valor}")
-                    time.sleep(1)  # Pausa para processamento
                 else:
                     logger.warning(f"Campo {nome_campo} está desabilitado")
             except Exception as e:
@@ -739,9 +619,9 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                 import traceback
                 logger.debug(traceback.format_exc())
         
-        # Aguarda um momento para o cálculo do valor líquido
+        # Aguarda o cálculo do valor líquido (retorna quando o portal termina de recalcular)
         logger.info("Aguardando o cálculo automático do valor líquido...")
-        time.sleep(4)  # 4 segundos para garantir o cálculo
+        aguardar_pagina_estavel(driver, timeout=15)
         
         # Verifica se o valor líquido calculado está correto
         try:
@@ -757,7 +637,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
             )
             
             # Calcula o valor líquido esperado com base nos dados fornecidos
-            valor_liquido_calculado_formatado = formatar_valor_monetario(valor_liquido_calculado_internamente)
+            valor_liquido_calculado_formatado = tributos_federais.formatar_decimal(valor_liquido_calculado_internamente)
             
             # Determina qual valor líquido usar para verificação (planilha ou calculado)
             if valor_liquido_esperado_planilha and valor_liquido_esperado_planilha != '0,00':
@@ -767,8 +647,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                 valor_liquido_esperado = valor_liquido_calculado_formatado
                 logger.info(f"Usando valor líquido calculado: {valor_liquido_esperado}")
             
-            # Localiza o campo de valor líquido com múltiplos seletores
-            campo_valor_liquido = None
+            # Localiza o campo de valor líquido com múltiplos seletores (CSS e, em seguida, XPath)
             seletores_liquido = [
                 'input[aria-label="Valor Líquido"]', 
                 'input[name="Valores.valorLiquido"]',
@@ -777,38 +656,17 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                 'input[placeholder*="Líquido"]',
                 'input[name*="ValorLiquido"]',
                 'input[class*="liquido"]',
-                'input[data-cy*="liquido"]'
+                'input[data-cy*="liquido"]',
+                "//label[contains(text(), 'Líquido')]/following::input[1]",
+                "//label[contains(text(), 'Valor Líquido')]/following::input[1]",
+                "//span[contains(text(), 'Líquido')]/following::input[1]",
+                "//div[contains(text(), 'Valor Líquido')]/following::input[1]"
             ]
             
-            for seletor in seletores_liquido:
-                try:
-                    elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
-                    elementos_visiveis = [e for e in elementos if e.is_displayed()]
-                    if elementos_visiveis:
-                        campo_valor_liquido = elementos_visiveis[0]
-                        logger.info(f"Campo valor líquido encontrado com seletor: {seletor}")
-                        break
-                except Exception as e:
-                    logger.debug(f"Erro ao procurar campo valor líquido com seletor {seletor}: {e}")
-            
-            # Se não encontrou por CSS, tenta por XPath
-            if not campo_valor_liquido:
-                xpath_liquido = [
-                    "//label[contains(text(), 'Líquido')]/following::input[1]",
-                    "//label[contains(text(), 'Valor Líquido')]/following::input[1]",
-                    "//span[contains(text(), 'Líquido')]/following::input[1]",
-                    "//div[contains(text(), 'Valor Líquido')]/following::input[1]"
-                ]
-                
-                for xpath in xpath_liquido:
-                    try:
-                        elementos = driver.find_elements(By.XPATH, xpath)
-                        if elementos and elementos[0].is_displayed():
-                            campo_valor_liquido = elementos[0]
-                            logger.info(f"Campo valor líquido encontrado com XPath: {xpath}")
-                            break
-                    except Exception as e:
-                        logger.debug(f"Erro ao procurar campo valor líquido com XPath {xpath}: {e}")
+            campo_valor_liquido, seletor = localizar_elemento(
+                driver, "campo_valor_liquido", seletores_liquido, logger_busca=logger)
+            if campo_valor_liquido:
+                logger.info(f"Campo valor líquido encontrado com seletor: {seletor}")
             
             if campo_valor_liquido:
                 # Scroll para o campo ficar visível
@@ -853,11 +711,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
                     logger.warning(f"VERIFICAÇÃO FALHOU: Valor líquido calculado ({valor_liquido_calculado}) é diferente do esperado ({valor_liquido_esperado})")
                     
                     # Salva um screenshot para análise
-                    try:
-                        driver.save_screenshot("logs/imagens/verificacao_valor_liquido.png")
-                        logger.info("Screenshot salvo em logs/imagens/verificacao_valor_liquido.png")
-                    except:
-                        pass
+                    captura.capturar_screenshot(driver, "verificacao_valor_liquido.png", erro=True)
                     
                     # Pergunta ao usuário se deseja continuar mesmo com a diferença
                     resposta = input(f"O valor líquido calculado ({valor_liquido_calculado}) é diferente do valor esperado ({valor_liquido_esperado}). Deseja continuar? (s/n): ")
@@ -874,11 +728,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
             logger.warning(traceback.format_exc())
         
         # Salva um screenshot após preencher todos os campos
-        try:
-            driver.save_screenshot("logs/imagens/tributos_federais_preenchidos.png")
-            logger.info("Screenshot salvo em logs/imagens/tributos_federais_preenchidos.png")
-        except:
-            pass
+        captura.capturar_screenshot(driver, "tributos_federais_preenchidos.png")
             
         logger.info("Tributos federais preenchidos com sucesso")
         return True
@@ -888,11 +738,7 @@ def preencher_tributos_federais(driver, dados_nota, logger=None):
         import traceback
         logger.error(traceback.format_exc())
         # Salva um screenshot em caso de erro
-        try:
-            driver.save_screenshot("logs/imagens/erro_tributos_federais.png")
-            logger.info("Screenshot do erro salvo em logs/imagens/erro_tributos_federais.png")
-        except:
-            pass
+        captura.capturar_screenshot(driver, "erro_tributos_federais.png")
         return False
 
 # Função principal para ser chamada pelo script principal
@@ -0,0 +1,147 @@
+"""
+Módulo com as formas de preencher campos do formulário do portal NFSe.
+
+Modo "humano" (padrão): digita caractere a caractere com pausas aleatórias,
+como o fluxo sempre fez.
+
+Modo "rapido": define o valor de vários campos numa única chamada JavaScript,
+dispara os eventos input, change e blur que os componentes do portal escutam
+e confere os valores resultantes. Campos que não aceitarem o valor voltam para
+a digitação, e campos que dependem de teclas (ex.: ENTER do Local da Prestação)
+podem forçar a digitação individualmente.
+
+O modo é escolhido por execução pela variável de ambiente MODO_PREENCHIMENTO
+(humano ou rapido).
+"""
+import os
+import re
+import time
+import random
+import logging
+
+# Configuração de logger
+logger = logging.getLogger('preenchimento')
+
+MODO_HUMANO = "humano"
+MODO_RAPIDO = "rapido"
+
+# Define os valores usando o setter nativo (para que componentes que interceptam
+# a propriedade value percebam a mudança), dispara os eventos e retorna os valores lidos
+_SCRIPT_DEFINIR_VALORES = """
+var pares = arguments[0], lidos = [];
+for (var i = 0; i < pares.length; i++) {
+    var el = pares[i][0], valor = pares[i][1];
+    var prototipo = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype :
+                    el instanceof HTMLSelectElement ? HTMLSelectElement.prototype :
+                    HTMLInputElement.prototype;
+    var setter = Object.getOwnPropertyDescriptor(prototipo, 'value').set;
+    el.focus();
+    setter.call(el, valor);
+    el.dispatchEvent(new Event('input', {bubbles: true}));
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+    el.blur();
+    el.dispatchEvent(new Event('blur'));
+    lidos.push(el.value);
+}
+return lidos;
+"""
+
+def modo_preenchimento():
+    """
+    Retorna o modo de preenchimento desta execução.
+    Lido a cada chamada para respeitar o .env carregado depois da importação.
+    """
+    modo = os.getenv("MODO_PREENCHIMENTO", MODO_HUMANO).strip().lower()
+    return MODO_RAPIDO if modo in (MODO_RAPIDO, "rápido") else MODO_HUMANO
+
+def digitar_texto(elemento, texto):
+    """
+    Digita o texto caractere a caractere com pausas aleatórias (modo humano).
+
+    Args:
+        elemento: Elemento web onde será feita a digitação
+        texto: Texto a ser digitado
+    """
+    # Limpa o campo primeiro
+    elemento.clear()
+
+    # Velocidades de digitação variáveis
+    for caractere in texto:
+        elemento.send_keys(caractere)
+        # Pequena pausa aleatória para simular digitação real
+        time.sleep(random.uniform(0.05, 0.15))
+
+    # Pausa final após completar a digitação
+    time.sleep(random.uniform(0.2, 0.5))
+
+def _valor_confere(esperado, lido):
+    """Compara ignorando espaços nas pontas e, para campos com máscara, a pontuação."""
+    esperado, lido = str(esperado).strip(), str(lido or "").strip()
+    if esperado == lido:
+        return True
+    normalizar = lambda v: re.sub(r'[\W_]', '', v).lower()
+    return normalizar(esperado) == normalizar(lido)
+
+def preencher_campos(driver, campos, logger_preenchimento=None):
+    """
+    Preenche vários campos de acordo com o modo da execução.
+
+    No modo rápido, os campos sem `digitar` são preenchidos numa única chamada
+    JavaScript e conferidos; os que não conferirem são digitados em seguida.
+
+    Args:
+        driver: WebDriver do Selenium
+        campos: Lista de dicionários com as chaves 'nome', 'elemento', 'valor' e,
+            opcionalmente, 'digitar' (True para sempre digitar o campo)
+        logger_preenchimento: Logger para registro de logs (opcional)
+
+    Returns:
+        list: Nomes dos campos que não puderam ser preenchidos
+    """
+    log = logger_preenchimento or logger
+    rapido = modo_preenchimento() == MODO_RAPIDO
+    em_lote = [c for c in campos if rapido and not c.get('digitar')]
+    digitados = [c for c in campos if not rapido or c.get('digitar')]
+    falharam = []
+
+    if em_lote:
+        try:
+            lidos = driver.execute_script(_SCRIPT_DEFINIR_VALORES,
+                                          [[c['elemento'], str(c['valor'])] for c in em_lote])
+        except Exception as e:
+            log.warning(f"Preenchimento rápido falhou, digitando os campos: {e}")
+            lidos = [None] * len(em_lote)
+
+        for campo, lido in zip(em_lote, lidos):
+            if _valor_confere(campo['valor'], lido):
+                log.info(f"Campo {campo['nome']} preenchido (modo rápido) com: '{campo['valor']}'")
+            else:
+                log.warning(f"Campo {campo['nome']} ficou com '{lido}' no modo rápido, digitando o valor")
+                digitados.append(campo)
+
+    for campo in digitados:
+        try:
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", campo['elemento'])
+            digitar_texto(campo['elemento'], str(campo['valor']))
+            log.info(f"Campo {campo['nome']} preenchido com: '{campo['valor']}'")
+        except Exception as e:
+            log.warning(f"Erro ao preencher {campo['nome']}: {e}")
+            falharam.append(campo['nome'])
+
+    return falharam
+
+def preencher_campo(elemento, texto, digitar=False, nome="campo"):
+    """
+    Preenche um único campo de acordo com o modo da execução.
+
+    Args:
+        elemento: Elemento web a preencher
+        texto: Texto a inserir
+        digitar: Se True, digita o texto mesmo no modo rápido (campos que dependem de teclas)
+        nome: Nome do campo para os logs
+    """
+    if digitar or modo_preenchimento() != MODO_RAPIDO:
+        digitar_texto(elemento, texto)
+        return
+    # elemento.parent é o driver que localizou o elemento
+    preencher_campos(elemento.parent, [{'nome': nome, 'elemento': elemento, 'valor': texto}])
@@ -0,0 +1,299 @@
+"""
+Módulo para manter uma única sessão autenticada do navegador no portal NFSe
+durante todo o lote de notas, evitando abrir o Chrome e refazer o login
+(com CAPTCHA) a cada nota emitida.
+"""
+import logging
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.action_chains import ActionChains
+from esperas import aguardar, aguardar_pagina_estavel
+
+# Configuração de logger
+logger = logging.getLogger('sessao_nfse')
+
+def detectar_tela_emitir_nota(driver):
+    """
+    Detecta se estamos na tela que exibe o card 'Emitir Nota Fiscal'.
+
+    Args:
+        driver: WebDriver do Selenium
+
+    Returns:
+        bool: True se a tela com o card foi detectada, False caso contrário
+    """
+    try:
+        logger.info("Verificando se estamos na tela para emitir próxima nota...")
+
+        # Aguarda a página carregar completamente
+        aguardar_pagina_estavel(driver, timeout=10)
+
+        # Procura pelo texto indicativo
+        texto_emitir_nota = driver.find_elements(By.XPATH, "//span[contains(@class, 'componente_card_texto_titulo') and contains(text(), 'Emitir Nota Fiscal')]")
+        if texto_emitir_nota:
+            logger.info("Tela para emitir próxima nota detectada!")
+            return True
+
+        # Procura também por outros indicadores
+        outros_indicadores = [
+            "//h1[contains(text(), 'Emissão de Nota Fiscal')]",
+            "//h2[contains(text(), 'Emitir Nota Fiscal')]",
+            "//div[contains(text(), 'Emitir nova nota')]"
+        ]
+
+        for xpath in outros_indicadores:
+            elementos = driver.find_elements(By.XPATH, xpath)
+            if elementos and elementos[0].is_displayed():
+                logger.info(f"Tela para emitir próxima nota detectada via indicador: {xpath}")
+                return True
+
+        logger.info("Não estamos na tela para emitir próxima nota.")
+        return False
+
+    except Exception as e:
+        logger.warning(f"Erro ao verificar tela para próxima nota: {e}")
+        return False
+
+def _saiu_do_card_emitir(driver):
+    """Condição de espera: a página deixou de exibir o card 'Emitir Nota Fiscal'."""
+    return ("Emitir Nota Fiscal" not in driver.page_source or
+            "componente_card_texto_titulo" not in driver.page_source)
+
+def clicar_card_emitir_nota(driver):
+    """
+    Clica no card 'Emitir Nota Fiscal' para iniciar a emissão da próxima nota.
+
+    Args:
+        driver: WebDriver do Selenium
+
+    Returns:
+        bool: True se o clique foi bem-sucedido, False caso contrário
+    """
+    try:
+        logger.info("Tentando clicar no card 'Emitir Nota Fiscal' para próxima nota...")
+
+        # Lista de possíveis seletores para o card
+        seletores = [
+            "a.componente_card",
+            "div.componente_card",
+            "a[title='Emitir Nota Fiscal']",
+            "button[title='Emitir Nota Fiscal']",
+            "a[onclick*='emitirNota']",
+            "a.botao_cor_tema"
+        ]
+
+        # Tenta cada seletor
+        for seletor in seletores:
+            elementos = driver.find_elements(By.CSS_SELECTOR, seletor)
+            elementos_visiveis = [e for e in elementos if e.is_displayed()]
+
+            for elemento in elementos_visiveis:
+                # Verifica se o elemento contém o texto "Emitir Nota Fiscal"
+                if "Emitir Nota Fiscal" not in elemento.text:
+                    continue
+
+                logger.info(f"Card 'Emitir Nota Fiscal' encontrado com seletor: {seletor}")
+
+                # Rola até o elemento
+                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elemento)
+
+                # Tenta diferentes métodos de clique
+                metodos = [
+                    {"nome": "clique direto", "func": lambda e=elemento: e.click()},
+                    {"nome": "JavaScript", "func": lambda e=elemento: driver.execute_script("arguments[0].click();", e)},
+                    {"nome": "ActionChains", "func": lambda e=elemento: ActionChains(driver).move_to_element(e).click().perform()}
+                ]
+
+                for metodo in metodos:
+                    try:
+                        logger.info(f"Tentando clicar com método: {metodo['nome']}")
+                        metodo["func"]()
+                        logger.info(f"Card 'Emitir Nota Fiscal' clicado via {metodo['nome']}")
+
+                        # Verifica se a página mudou
+                        if aguardar(driver, _saiu_do_card_emitir, timeout=10, descricao="saída do card 'Emitir Nota Fiscal'"):
+                            logger.info("Página mudou após o clique.")
+                            return True
+                        logger.warning("A página não parece ter mudado após o clique.")
+
+                    except Exception as e:
+                        logger.warning(f"Clique via {metodo['nome']} falhou: {e}")
+
+        # Tenta por XPath se os seletores falharem
+        xpaths = [
+            "//span[contains(@class, 'componente_card_texto_titulo') and contains(text(), 'Emitir Nota Fiscal')]/ancestor::a",
+            "//span[contains(@class, 'componente_card_texto_titulo') and contains(text(), 'Emitir Nota Fiscal')]/ancestor::div",
+            "//span[contains(text(), 'Emitir Nota Fiscal')]/ancestor::a",
+            "//a[contains(text(), 'Emitir Nota Fiscal')]"
+        ]
+
+        for xpath in xpaths:
+            elementos = driver.find_elements(By.XPATH, xpath)
+            if elementos and elementos[0].is_displayed():
+                logger.info(f"Card 'Emitir Nota Fiscal' encontrado por XPath: {xpath}")
+
+                try:
+                    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elementos[0])
+                    elementos[0].click()
+                    logger.info("Card 'Emitir Nota Fiscal' clicado via XPath")
+                    if aguardar(driver, _saiu_do_card_emitir, timeout=10, descricao="saída do card 'Emitir Nota Fiscal'"):
+                        return True
+                    logger.warning("A página não parece ter mudado após o clique.")
+                except Exception as e:
+                    logger.warning(f"Clique XPath falhou: {e}")
+                try:
+                    driver.execute_script("arguments[0].click();", elementos[0])
+                    logger.info("Card clicado via JavaScript (XPath)")
+                    if aguardar(driver, _saiu_do_card_emitir, timeout=10, descricao="saída do card 'Emitir Nota Fiscal'"):
+                        return True
+                    logger.warning("A página não parece ter mudado após o clique.")
+                except Exception as e2:
+                    logger.warning(f"Clique JavaScript (XPath) falhou: {e2}")
+
+        logger.error("Não foi possível encontrar ou clicar no card para emitir próxima nota")
+        return False
+
+    except Exception as e:
+        logger.error(f"Erro ao tentar clicar no card para próxima nota: {e}")
+        return False
+
+class SessaoNFSe:
+    """
+    Mantém o navegador autenticado no portal NFSe entre as notas de um lote.
+
+    O navegador é criado e autenticado uma única vez (login, área fiscal, CAPTCHA
+    e redirecionamento). Após cada nota a sessão volta ao card 'Emitir Nota Fiscal'
+    em vez de fechar o Chrome. Se o navegador morrer ou a sessão expirar, um novo
+    login é feito na próxima chamada de `garantir`.
+    """
+
+    def __init__(self, criar_driver, autenticar, url_destino, logger_sessao=None):
+        """
+        Inicializa a sessão sem abrir o navegador.
+
+        Args:
+            criar_driver: Função sem argumentos que retorna um novo WebDriver
+            autenticar: Função que recebe o driver e executa o login completo,
+                retornando True quando a página de destino for alcançada
+            url_destino: URL da página inicial do sistema após o login
+            logger_sessao: Logger para registro de logs (opcional)
+        """
+        self.criar_driver = criar_driver
+        self.autenticar = autenticar
+        self.url_destino = url_destino
+        self.logger = logger_sessao or logger
+        self.driver = None
+        self.autenticada = False
+        # Indica que o formulário de emissão já foi aberto pelo card ao final da nota anterior
+        self.emissao_aberta = False
+        self.logins_realizados = 0
+
+    def navegador_responde(self):
+        """Verifica se o navegador ainda está aberto e respondendo a comandos."""
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def garantir(self):
+        """
+        Garante que exista um navegador autenticado, abrindo e autenticando se necessário.
+
+        Returns:
+            bool: True se a sessão está pronta para emitir notas, False caso contrário
+        """
+        if self.autenticada and self.navegador_responde():
+            return True
+
+        if self.driver is not None:
+            self.logger.warning("Sessão do navegador perdida. Um novo login será realizado.")
+            self.encerrar()
+
+        self.logger.info("Abrindo navegador para nova sessão no portal NFSe...")
+        self.driver = self.criar_driver()
+        self.emissao_aberta = False
+
+        self.autenticada = bool(self.autenticar(self.driver))
+        if self.autenticada:
+            self.logins_realizados += 1
+            self.logger.info(f"Sessão autenticada (logins realizados nesta execução: {self.logins_realizados})")
+        else:
+            self.logger.error("Falha ao autenticar a sessão no portal NFSe")
+        return self.autenticada
+
+    def abrir_emissao(self, clicar_emitir_nota):
+        """
+        Abre o formulário de emissão, a menos que ele já tenha sido aberto ao final da nota anterior.
+
+        Args:
+            clicar_emitir_nota: Função que recebe o driver e clica em 'Emitir Nota Fiscal'
+                a partir da página de destino
+
+        Returns:
+            bool: True se o formulário de emissão foi aberto, False caso contrário
+        """
+        if self.emissao_aberta:
+            self.logger.info("Formulário de emissão já aberto pela sessão, reutilizando")
+            self.emissao_aberta = False
+            return True
+        return clicar_emitir_nota(self.driver)
+
+    def retornar_para_emissao(self):
+        """
+        Volta ao card 'Emitir Nota Fiscal' após uma nota, sem fechar o navegador.
+
+        Primeiro tenta o card exibido pelo portal logo após a emissão. Se ele não
+        estiver na tela (nota cancelada ou erro no meio do fluxo), recarrega a página
+        de destino mantendo os cookies da sessão. Se o portal pedir login de novo,
+        a sessão é invalidada para que `garantir` faça um novo login.
+
+        Returns:
+            bool: True se a sessão continua utilizável, False caso contrário
+        """
+        if not self.navegador_responde():
+            self.autenticada = False
+            return False
+
+        self.logger.info("Verificando se é possível continuar para a próxima nota...")
+        if detectar_tela_emitir_nota(self.driver) and clicar_card_emitir_nota(self.driver):
+            self.logger.info("Continuando para a próxima nota sem fechar o navegador")
+            self.emissao_aberta = True
+            return True
+
+        try:
+            self.logger.info(f"Retornando à página de destino: {self.url_destino}")
+            self.driver.get(self.url_destino)
+            WebDriverWait(self.driver, 30).until(
+                lambda d: d.execute_script('return document.readyState') == 'complete'
+            )
+        except Exception as e:
+            self.logger.warning(f"Erro ao retornar à página de destino: {e}")
+
+        try:
+            url_atual = self.driver.current_url
+        except WebDriverException:
+            url_atual = ""
+
+        if self.url_destino not in url_atual:
+            self.logger.warning(f"Portal não manteve a sessão (URL atual: {url_atual}). Novo login será necessário.")
+            self.autenticada = False
+            return False
+
+        self.emissao_aberta = False
+        return True
+
+    def encerrar(self):
+        """Fecha o navegador, se estiver aberto."""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+                self.logger.info("Navegador fechado")
+            except Exception as e:
+                self.logger.warning(f"Erro ao fechar o navegador: {e}")
+        self.driver = None
+        self.autenticada = False
+        self.emissao_aberta = False
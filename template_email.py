@@ -0,0 +1,138 @@
+"""
+Módulo com o template do corpo dos e-mails das notas fiscais (layout_email.txt).
+
+O layout é interpretado uma única vez, na carga: o texto é dividido em trechos
+fixos e marcadores `{{NOME}}`, e cada rascunho é montado apenas juntando os
+trechos com os valores da nota, sem percorrer o texto de novo. Marcadores
+desconhecidos são apontados na carga, antes de criar qualquer rascunho, em vez
+de chegarem ao cliente como `{{...}}`.
+
+Além das variáveis fixas (VARIAVEIS_FIXAS), o layout pode usar qualquer coluna
+da planilha de controle, pelo nome normalizado do cabeçalho: maiúsculas, sem
+acentos e com `_` no lugar de espaços e símbolos (ex.: "Nome Reduzido" vira
+`{{NOME_REDUZIDO}}` e "E-MAIL\\nResponsável" vira `{{E_MAIL_RESPONSAVEL}}`).
+"""
+import re
+import html
+import logging
+import unicodedata
+from datetime import datetime, date
+
+# Configuração de logger
+logger = logging.getLogger('template_email')
+
+# Variáveis preenchidas pela automação em todos os rascunhos
+VARIAVEIS_FIXAS = {
+    'SAUDACAO': 'Bom dia, Boa tarde ou Boa noite (horário de Brasília)',
+    'ARQUIVO': 'Nomes dos arquivos anexados',
+    'NUMERO_NOTA': 'Número da nota fiscal',
+    'EMPRESA': 'Nome reduzido da empresa',
+}
+
+MARCADOR = re.compile(r'\{\{\s*([^{}]*?)\s*\}\}')
+NOME_VALIDO = re.compile(r'[A-Z][A-Z0-9_]*')
+
+def nome_variavel(coluna):
+    """Nome da variável do layout correspondente a uma coluna da planilha."""
+    texto = unicodedata.normalize('NFKD', str(coluna)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^A-Za-z0-9]+', '_', texto).strip('_').upper()
+
+def formatar_valor(valor):
+    """Texto de um valor da planilha para o e-mail (datas em dd/mm/aaaa, números inteiros sem ',0')."""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y') if valor.time() == datetime.min.time() else valor.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+def saudacao(hora):
+    """Saudação de acordo com a hora (0 a 23)."""
+    if hora < 12:
+        return "Bom dia"
+    if hora < 18:
+        return "Boa tarde"
+    return "Boa noite"
+
+class TemplateEmail:
+    """Layout de e-mail compilado em trechos fixos e marcadores."""
+
+    def __init__(self, texto, variaveis, origem='layout'):
+        """
+        Interpreta o layout e confere os marcadores.
+
+        Args:
+            texto: Conteúdo do layout
+            variaveis: Conjunto dos nomes de variáveis aceitos
+            origem: Nome do layout, usado nas mensagens de erro
+
+        Raises:
+            ValueError: Se houver marcadores desconhecidos ou mal formados
+        """
+        self.trechos = []
+        self.campos = []
+        invalidos = []
+        posicao = 0
+        for m in MARCADOR.finditer(texto):
+            nome = m.group(1)
+            if not NOME_VALIDO.fullmatch(nome) or nome not in variaveis:
+                linha = texto.count('\n', 0, m.start()) + 1
+                invalidos.append(f"{m.group(0)} (linha {linha})")
+            self.trechos.append(texto[posicao:m.start()])
+            self.campos.append(nome)
+            posicao = m.end()
+        self.trechos.append(texto[posicao:])
+
+        # Chaves soltas (marcador sem fechamento, por exemplo) também são erro
+        for trecho in self.trechos:
+            if '{{' in trecho or '}}' in trecho:
+                invalidos.append(f"marcador incompleto perto de '{trecho.strip()[:30]}'")
+        if invalidos:
+            raise ValueError(f"Marcador(es) desconhecido(s) em {origem}: {', '.join(invalidos)}. "
+                             f"Variáveis disponíveis: {', '.join(sorted(variaveis))}")
+        self.variaveis = frozenset(self.campos)
+
+    def render(self, valores, escapar=True):
+        """
+        Monta o texto com os valores das variáveis.
+
+        Args:
+            valores: Dicionário {variável: valor}; variáveis ausentes ficam vazias
+            escapar: Escapa os valores para HTML (padrão True)
+
+        Returns:
+            str: Texto final
+        """
+        partes = [self.trechos[0]]
+        for campo, trecho in zip(self.campos, self.trechos[1:]):
+            valor = formatar_valor(valores.get(campo))
+            partes.append(html.escape(valor, quote=False) if escapar else valor)
+            partes.append(trecho)
+        return ''.join(partes)
+
+def carregar_template(caminho, variaveis):
+    """
+    Lê e compila o layout de e-mail.
+
+    Args:
+        caminho: Caminho do arquivo de layout
+        variaveis: Conjunto dos nomes de variáveis aceitos
+
+    Returns:
+        TemplateEmail: Layout compilado
+
+    Raises:
+        OSError: Se o arquivo não puder ser lido
+        ValueError: Se o layout estiver vazio ou tiver marcadores desconhecidos
+    """
+    with open(caminho, 'r', encoding='utf-8') as f:
+        texto = f.read()
+    if not texto.strip():
+        raise ValueError(f"Layout de e-mail vazio: {caminho}")
+    template = TemplateEmail(texto, set(variaveis), origem=caminho)
+    logger.info(f"Layout de e-mail carregado: {len(template.campos)} marcador(es) "
+                f"({', '.join(sorted(template.variaveis)) or 'nenhum'})")
+    return template
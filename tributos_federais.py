@@ -0,0 +1,224 @@
+"""
+Módulo com o cálculo e a conferência das retenções federais (IRRF, PIS, Cofins e CSLL).
+
+As retenções de cada nota são recalculadas a partir do valor do serviço, em
+Decimal e arredondadas ao centavo, com as alíquotas indicadas nos cabeçalhos da
+planilha de controle (ex.: "IRRF(1,5%) ou (4,8%)", "PIS (0,65%)") e os limites
+de dispensa da legislação: IRRF de até R$ 10,00 não é retido, e PIS, Cofins e
+CSLL não são retidos quando a soma dos três não passa de R$ 10,00.
+
+Todas as notas pendentes são conferidas de uma vez, logo após a leitura da
+planilha, para apontar as linhas com valores divergentes antes de abrir o
+navegador.
+"""
+import re
+import math
+import logging
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import NamedTuple
+
+# Configuração de logger
+logger = logging.getLogger('tributos_federais')
+
+# Alíquotas usadas quando o cabeçalho da coluna não indica a alíquota.
+# IRRF: 1,5% (serviços profissionais) ou 4,8% (pagamentos por órgãos públicos)
+ALIQUOTAS_PADRAO = {
+    'irrf': (Decimal('0.015'), Decimal('0.048')),
+    'pis': (Decimal('0.0065'),),
+    'cofins': (Decimal('0.03'),),
+    'csll': (Decimal('0.01'),),
+}
+
+# Nome (sigla) procurado nos cabeçalhos da planilha para cada tributo
+SIGLAS_COLUNAS = {'irrf': 'IRRF', 'pis': 'PIS', 'cofins': 'COFINS', 'csll': 'CSLL'}
+
+COLUNA_VALOR_SERVICO = 'Total'
+COLUNA_TOTAL_IMPOSTOS = 'Total Impostos'
+COLUNA_LIQUIDO = 'Líquido'
+
+# Retenções iguais ou inferiores a este valor são dispensadas (IRRF e a soma de PIS, Cofins e CSLL)
+LIMITE_DISPENSA = Decimal('10.00')
+
+# Diferença aceita entre a planilha e o cálculo
+TOLERANCIA = Decimal('0.01')
+
+CENTAVO = Decimal('0.01')
+
+# Texto só com pontos de milhar e sem vírgula (ex.: "10.000", "1.234.567")
+MILHAR_COM_PONTO = re.compile(r'[1-9]\d{0,2}(\.\d{3})+')
+
+def para_decimal(valor):
+    """
+    Converte um valor da planilha (número ou texto como "1.234,56", "1234,56", "10.000" ou "R$ 1234.56") em Decimal.
+
+    Returns:
+        Decimal ou None se o valor estiver vazio
+
+    Raises:
+        ValueError: Se o valor não for numérico
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, int):
+        return Decimal(valor)
+    if isinstance(valor, float):
+        # repr devolve o menor texto que representa o float (0.1 e não 0.1000000000000000055...)
+        return None if math.isnan(valor) else Decimal(repr(valor))
+    texto = str(valor).replace('R$', '').replace(' ', '').strip()
+    if not texto or texto.lower() == 'nan':
+        return None
+    if ',' in texto or MILHAR_COM_PONTO.fullmatch(texto):
+        # "1.234,56" ou "10.000": o ponto é separador de milhar
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"valor não numérico: {valor!r}")
+
+def formatar_decimal(valor):
+    """Valor no formato do portal, com vírgula decimal e sem separador de milhar (ex.: "1234,56")."""
+    return f"{valor.quantize(CENTAVO, rounding=ROUND_HALF_UP)}".replace('.', ',')
+
+def _centavos(valor):
+    """Arredonda ao centavo (meio centavo para cima)."""
+    return valor.quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+class CalculoTributos(NamedTuple):
+    """Retenções calculadas para uma nota."""
+    valor_servico: Decimal
+    aliquota_irrf: Decimal
+    irrf: Decimal
+    pis: Decimal
+    cofins: Decimal
+    csll: Decimal
+
+    @property
+    def total(self):
+        """Soma das retenções."""
+        return self.irrf + self.pis + self.cofins + self.csll
+
+    @property
+    def liquido(self):
+        """Valor líquido (valor do serviço menos as retenções)."""
+        return self.valor_servico - self.total
+
+def calcular_tributos(valor_servico, aliquota_irrf=None, aliquotas=None):
+    """
+    Calcula as retenções federais de uma nota, aplicando os limites de dispensa.
+
+    Args:
+        valor_servico: Valor bruto do serviço (Decimal)
+        aliquota_irrf: Alíquota do IRRF (padrão: a primeira de `aliquotas['irrf']`)
+        aliquotas: Alíquotas no formato de ALIQUOTAS_PADRAO (padrão: ALIQUOTAS_PADRAO)
+
+    Returns:
+        CalculoTributos: Retenções calculadas
+    """
+    aliquotas = aliquotas or ALIQUOTAS_PADRAO
+    if aliquota_irrf is None:
+        aliquota_irrf = aliquotas['irrf'][0]
+    irrf = _centavos(valor_servico * aliquota_irrf)
+    if irrf <= LIMITE_DISPENSA:
+        irrf = Decimal('0.00')
+    pis, cofins, csll = (_centavos(valor_servico * aliquotas[tributo][0]) for tributo in ('pis', 'cofins', 'csll'))
+    if pis + cofins + csll <= LIMITE_DISPENSA:
+        pis = cofins = csll = Decimal('0.00')
+    return CalculoTributos(valor_servico, aliquota_irrf, irrf, pis, cofins, csll)
+
+def colunas_tributos(colunas):
+    """
+    Localiza as colunas de cada tributo na planilha e lê as alíquotas indicadas no cabeçalho.
+
+    Args:
+        colunas: Nomes das colunas da planilha
+
+    Returns:
+        tuple: ({tributo: coluna}, {tributo: (alíquotas,)}) para os tributos encontrados
+    """
+    encontradas, aliquotas = {}, dict(ALIQUOTAS_PADRAO)
+    for tributo, sigla in SIGLAS_COLUNAS.items():
+        for coluna in colunas:
+            if re.search(rf'\b{sigla}\b', str(coluna).upper()):
+                encontradas[tributo] = coluna
+                percentuais = re.findall(r'(\d+(?:[.,]\d+)?)\s*%', str(coluna))
+                if percentuais:
+                    aliquotas[tributo] = tuple(Decimal(p.replace(',', '.')) / 100 for p in percentuais)
+                break
+    return encontradas, aliquotas
+
+def conferir_nota(dados, colunas, aliquotas):
+    """
+    Confere as retenções e o líquido de uma linha da planilha com o cálculo.
+
+    A alíquota do IRRF é a que reproduz o valor da planilha; se nenhuma reproduzir,
+    é usada a primeira. Linhas sem nenhuma retenção (tomador que não retém) não são
+    conferidas.
+
+    Args:
+        dados: Dicionário da linha da planilha
+        colunas: {tributo: coluna}, de `colunas_tributos`
+        aliquotas: {tributo: (alíquotas,)}, de `colunas_tributos`
+
+    Returns:
+        tuple: (CalculoTributos ou None, lista de divergências em texto)
+    """
+    try:
+        valor_servico = para_decimal(dados.get(COLUNA_VALOR_SERVICO))
+        informados = {tributo: para_decimal(dados.get(coluna)) or Decimal('0')
+                      for tributo, coluna in colunas.items()}
+        total_informado = para_decimal(dados.get(COLUNA_TOTAL_IMPOSTOS))
+        liquido_informado = para_decimal(dados.get(COLUNA_LIQUIDO))
+    except ValueError as e:
+        return None, [str(e)]
+    if valor_servico is None or valor_servico <= 0:
+        return None, [f"valor do serviço ({COLUNA_VALOR_SERVICO}) ausente ou inválido"]
+    if not any(informados.values()):
+        return None, []
+
+    calculos = [calcular_tributos(valor_servico, aliquota, aliquotas) for aliquota in aliquotas['irrf']]
+    calculo = next((c for c in calculos if abs(c.irrf - informados.get('irrf', c.irrf)) <= TOLERANCIA), calculos[0])
+
+    divergencias = []
+    for tributo, informado in informados.items():
+        esperado = getattr(calculo, tributo)
+        if abs(esperado - informado) > TOLERANCIA:
+            aliquota = calculo.aliquota_irrf if tributo == 'irrf' else aliquotas[tributo][0]
+            divergencias.append(f"{SIGLAS_COLUNAS[tributo]}: planilha {formatar_decimal(informado)}, "
+                                f"calculado {formatar_decimal(esperado)} ({formatar_decimal(aliquota * 100)}%)")
+    if total_informado and abs(calculo.total - total_informado) > TOLERANCIA:
+        divergencias.append(f"Total de impostos: planilha {formatar_decimal(total_informado)}, "
+                            f"calculado {formatar_decimal(calculo.total)}")
+    if liquido_informado and abs(calculo.liquido - liquido_informado) > TOLERANCIA:
+        divergencias.append(f"Líquido: planilha {formatar_decimal(liquido_informado)}, "
+                            f"calculado {formatar_decimal(calculo.liquido)}")
+    return calculo, divergencias
+
+def conferir_lote(notas, colunas_planilha, logger_tributos=None):
+    """
+    Confere as retenções de todas as notas pendentes de uma vez.
+
+    Args:
+        notas: Lista de notas pendentes (NotaPendente: linha_excel e dados)
+        colunas_planilha: Nomes das colunas da planilha
+        logger_tributos: Logger para registro de logs (opcional)
+
+    Returns:
+        dict: {linha_excel: [divergências]} apenas das notas com divergência
+    """
+    log = logger_tributos or logger
+    colunas, aliquotas = colunas_tributos(colunas_planilha)
+    if not colunas:
+        log.info("Planilha sem colunas de tributos federais; conferência das retenções ignorada")
+        return {}
+    divergentes = {}
+    for nota in notas:
+        calculo, divergencias = conferir_nota(nota.dados, colunas, aliquotas)
+        if divergencias:
+            divergentes[nota.linha_excel] = divergencias
+        elif calculo is not None:
+            log.debug(f"Linha {nota.linha_excel}: retenções conferidas (total {formatar_decimal(calculo.total)}, "
+                      f"líquido {formatar_decimal(calculo.liquido)})")
+    log.info(f"Retenções federais conferidas em {len(notas)} nota(s) pendente(s): {len(divergentes)} com divergência")
+    return divergentes